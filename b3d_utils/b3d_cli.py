@@ -2,11 +2,15 @@ import logging
 import sys
 import argparse
 import os
+import math
 
 import remove_b3d
 import merge_b3d
 import extract_b3d
 import list_b3d
+import query_b3d
+import tile_b3d
+import stats_b3d
 
 import remove_res
 import merge_res
@@ -36,6 +40,24 @@ def parse_items(value):
         items = value.strip().split(',')
     return items
 
+def parse_region(value):
+    # x,y,z,r - sphere in map coordinates
+    try:
+        region = tuple(float(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Region should be 4 numbers x,y,z,r: {value}")
+    if len(region) != 4 or not region[3] >= 0:
+        raise argparse.ArgumentTypeError(f"Region should be 4 numbers x,y,z,r with r >= 0: {value}")
+    return region
+
+def parse_cell_size(value):
+    try:
+        size = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Cell size should be a number: {value}")
+    if not (size > 0 and math.isfinite(size)):
+        raise argparse.ArgumentTypeError(f"Cell size should be positive number: {value}")
+    return size
 
 
 parser = argparse.ArgumentParser(description="Say hello")
@@ -116,6 +138,10 @@ extract_parser.add_argument('--split', action='store_true', help="Export each no
 extract_parser.add_argument('--o', help="Path to output folder/file. Default is b3d file folder.")
 extract_parser.add_argument('--res', help="Path to res file. If is set, exports associated res file(s) with defined parameters.")
 extract_parser.add_argument('--ref-materials', action='store_true', help="Save only materials used in this .b3d")
+extract_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index next to b3d file")
+extract_parser.add_argument('--jobs', type=int, default=1, help="Number of worker processes used with --split. 0 - use all CPU cores. Default is 1")
+extract_parser.add_argument('--last-match', action='store_true', help="With --inc-nodes and no up to date index read whole file, so the last root of repeated name is taken. By default reading stops at first root of each name")
+extract_parser.add_argument('--region', type = parse_region, help="Sphere x,y,z,r. Extract only roots which bounds intersect it (together with --inc-nodes - only listed roots inside it)")
 
 #   Settings for connected res file
 extract_parser.add_argument('--sections', help="List of res sections to include. All included by default", nargs="+", choices=SECTIONS)
@@ -132,8 +158,11 @@ extract_parser.add_argument('--inc-sounds', type = parse_items, help="Sound name
 #list - parses b3d. List all nodes
 list_parser = subparser.add_parser("list", help="List b3d file")
 list_parser.add_argument('--i', help="Path to b3d file", required=True)
-list_parser.add_argument('--t', help="What type of information to list. Availabe options: MATERIALS, ROOTS, FULL", choices=['MATERIALS','ROOTS','FULL'], required=True)
+list_parser.add_argument('--t', help="What type of information to list. Availabe options: MATERIALS, MATERIAL-USAGE, ROOTS, FULL", choices=['MATERIALS','MATERIAL-USAGE','ROOTS','FULL'], required=True)
 list_parser.add_argument('--o', help="Path to output file. If not set - prints to terminal")
+list_parser.add_argument('--ndjson', action='store_true', help="With --t FULL writes one root per line (NDJSON) instead of single JSON array")
+list_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index (used by --t MATERIAL-USAGE)")
+list_parser.add_argument('--jobs', type=int, default=1, help="Number of worker processes used with --t FULL. 0 - use all CPU cores. Default is 1")
 
 #remove
 remove_parser = subparser.add_parser("remove", help="Remove selected b3d nodes with all references from b3d file")
@@ -141,6 +170,29 @@ remove_parser.add_argument('--i', help="Path to b3d file", required=True)
 remove_parser.add_argument('--rem-nodes', type = parse_items, help="List of node names divided by comma. Accepts comma-separated string or path to file with comma-separated string. File path should start with @. For example: @test.txt")
 remove_parser.add_argument('--rem-materials', type = parse_items, help="Material name in res")
 remove_parser.add_argument('--o', help="Path to b3d file to save result. If not set save into original file")
+remove_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index next to b3d file")
+
+#query - finds roots in region using spatial index
+query_parser = subparser.add_parser("query", help="List b3d roots which bounds intersect region")
+query_parser.add_argument('--i', help="Path to b3d file", required=True)
+query_parser.add_argument('--region', type = parse_region, help="Sphere x,y,z,r", required=True)
+query_parser.add_argument('--o', help="Path to output file. If not set - prints to terminal")
+query_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index next to b3d file")
+
+#stats - block type and root statistics
+stats_parser = subparser.add_parser("stats", help="Show count, size, vertices, polygons and scan time per block type and heaviest roots")
+stats_parser.add_argument('--i', help="Path to b3d file", required=True)
+stats_parser.add_argument('--t', help="Output format. Availabe options: TABLE, JSON", choices=['TABLE','JSON'], default='TABLE')
+stats_parser.add_argument('--top', type=int, default=20, help="Number of heaviest roots to show. Default is 20")
+stats_parser.add_argument('--o', help="Path to output file. If not set - prints to terminal")
+
+#tile - cuts b3d into grid tiles
+tile_parser = subparser.add_parser("tile", help="Split b3d file into square tiles by root bounds")
+tile_parser.add_argument('--i', help="Path to b3d file", required=True)
+tile_parser.add_argument('--cell-size', type=parse_cell_size, help="Tile size in map units (x and y)", required=True)
+tile_parser.add_argument('--node-refs', action='store_true', help="Add roots referenced by tile roots to the tile. If not set ignore node references")
+tile_parser.add_argument('--o', help="Path to output folder. Default is b3d file folder.")
+tile_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index next to b3d file")
 
 # merge
 merge_parser = subparser.add_parser("merge", help="List b3d file")
@@ -148,82 +200,94 @@ merge_parser.add_argument('--i-from', help="Path to b3d file to merge from", req
 merge_parser.add_argument('--i-to', help="Path to b3d file to merge into", required=True)
 merge_parser.add_argument('--replace', action='store_true', help="If is set replaces nodes with same names. Ignores otherwise")
 merge_parser.add_argument('--o', help="Path to b3d file to save merge result. If not set merges into original file")
+merge_parser.add_argument('--no-index', action='store_true', help="Do not read or write .b3didx root index next to b3d files")
+
+
+# guarded so that --jobs worker processes can import this module
+if __name__ == '__main__':
+    args = parser.parse_args()
+    print(args)
+    if args.format == 'b3d':
+        if args.command == 'extract':
+
+            res_params = common.get_res_params(
+                args.sections, 
+                args.inc_soundfiles, args.ref_soundfiles,
+                args.inc_backfiles, 
+                args.inc_maskfiles, args.ref_maskfiles,
+                args.inc_texturefiles, args.ref_texturefiles,
+                args.inc_materials,
+                args.inc_sounds
+            )
+
+            extract_b3d.b3dextract(args.i, args.res, args.o, args.inc_nodes, args.split, args.node_refs, args.ref_materials, res_params["current_sections"], res_params["section_records"], not args.no_index, args.jobs or os.cpu_count(), args.region, args.last_match)
+
+        elif args.command == 'list':
+            list_b3d.b3dlist(args.i, args.t, args.o, args.ndjson, not args.no_index, args.jobs or os.cpu_count())
+        
+        elif args.command == 'query':
+            query_b3d.b3dquery(args.i, args.region, args.o, not args.no_index)
 
+        elif args.command == 'stats':
+            stats_b3d.b3dstats(args.i, args.t, args.o, args.top)
 
-args = parser.parse_args()
-print(args)
-if args.format == 'b3d':
-    if args.command == 'extract':
-
-        res_params = common.get_res_params(
-            args.sections, 
-            args.inc_soundfiles, args.ref_soundfiles,
-            args.inc_backfiles, 
-            args.inc_maskfiles, args.ref_maskfiles,
-            args.inc_texturefiles, args.ref_texturefiles,
-            args.inc_materials,
-            args.inc_sounds
-        )
-
-        extract_b3d.b3dextract(args.i, args.res, args.o, args.inc_nodes, args.split, args.node_refs, args.ref_materials, res_params["current_sections"], res_params["section_records"])
+        elif args.command == 'tile':
+            tile_b3d.b3dtile(args.i, args.o, args.cell_size, args.node_refs, not args.no_index)
 
-    elif args.command == 'list':
-        list_b3d.b3dlist(args.i, args.t, args.o)
-        
-    elif args.command == 'merge':
-        merge_b3d.b3dmerge(args.i_from, args.i_to, args.o, args.replace)
+        elif args.command == 'merge':
+            merge_b3d.b3dmerge(args.i_from, args.i_to, args.o, args.replace, not args.no_index)
 
-    elif args.command == 'remove':
-        remove_b3d.b3dremove(args.i, args.o, args.rem_materials, args.rem_nodes)
+        elif args.command == 'remove':
+            remove_b3d.b3dremove(args.i, args.o, args.rem_materials, args.rem_nodes, not args.no_index)
 
-elif args.format == 'res':
+    elif args.format == 'res':
     
-    if args.command == 'extract':
+        if args.command == 'extract':
 
-        res_params = common.get_res_params(
-            args.sections, 
-            args.inc_soundfiles, args.ref_soundfiles,
-            args.inc_backfiles, 
-            args.inc_maskfiles, args.ref_maskfiles,
-            args.inc_texturefiles, args.ref_texturefiles,
-            args.inc_materials,
-            args.inc_sounds
-        )
+            res_params = common.get_res_params(
+                args.sections, 
+                args.inc_soundfiles, args.ref_soundfiles,
+                args.inc_backfiles, 
+                args.inc_maskfiles, args.ref_maskfiles,
+                args.inc_texturefiles, args.ref_texturefiles,
+                args.inc_materials,
+                args.inc_sounds
+            )
 
-        extract_res.resextract(args.i, args.o, res_params["current_sections"], res_params["section_records"])
+            extract_res.resextract(args.i, args.o, res_params["current_sections"], res_params["section_records"])
 
-    elif args.command == 'list':
+        elif args.command == 'list':
 
-        list_res.reslist(args.i, args.o)
+            list_res.reslist(args.i, args.o)
     
-    elif args.command == 'merge':
+        elif args.command == 'merge':
 
-        merge_res.resmerge(args.i_from, args.i_to, args.o, args.replace)
+            merge_res.resmerge(args.i_from, args.i_to, args.o, args.replace)
     
-    elif args.command == 'remove':
+        elif args.command == 'remove':
         
-        res_params = common.get_res_params(
-            [], 
-            args.rem_soundfiles, args.ref_soundfiles,
-            args.rem_backfiles, 
-            args.rem_maskfiles, args.ref_maskfiles,
-            args.rem_texturefiles, args.ref_texturefiles,
-            args.rem_materials,
-            args.rem_sounds
-        )
-
-        remove_res.resremove(args.i, args.o, res_params["section_records"])
-
-    elif args.command == 'unpack':
-
-        selected_sections = None
-        if(args.sections):
-            selected_sections = args.sections
-        else:
-            selected_sections = SECTIONS
+            res_params = common.get_res_params(
+                [], 
+                args.rem_soundfiles, args.ref_soundfiles,
+                args.rem_backfiles, 
+                args.rem_maskfiles, args.ref_maskfiles,
+                args.rem_texturefiles, args.ref_texturefiles,
+                args.rem_materials,
+                args.rem_sounds
+            )
+
+            remove_res.resremove(args.i, args.o, res_params["section_records"])
+
+        elif args.command == 'unpack':
+
+            selected_sections = None
+            if(args.sections):
+                selected_sections = args.sections
+            else:
+                selected_sections = SECTIONS
             
-        unpack_res.resunpack(args.i, args.o, selected_sections, args.tga_debug)
+            unpack_res.resunpack(args.i, args.o, selected_sections, args.tga_debug)
         
-    elif args.command == 'pack':
+        elif args.command == 'pack':
 
-        pack_res.respack(args.i, args.o, args.tga_debug)
+            pack_res.respack(args.i, args.o, args.tga_debug)
@@ -0,0 +1,582 @@
+import sys
+import os
+import random
+import struct
+import argparse
+import logging
+
+from io import BytesIO
+from array import array
+
+import parsing.read_b3d as b3dr
+import imghelp as img
+import common as c
+import pack_res
+
+from parsing.layout_b3d import *
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+log = logging.getLogger("corpus")
+log.setLevel(logging.DEBUG)
+
+# Synthetic b3d/res corpus for load testing.
+#
+# Files are random but valid: every block has correct layout, texnums point to
+# existing materials (1..materials-1, 0 is kept free like in game files),
+# block 18 references only point to earlier roots, so hierarchy has no cycles.
+# Geometry is written from a precomputed pool of random floats, so output of
+# several gigabytes is limited by disk speed rather than by random generator.
+
+BEGIN_CHUNK = b'\x4D\x01\x00\x00'
+END_CHUNK = b'\x2B\x02\x00\x00'
+GROUP_CHUNK = b'\xbc\x01\x00\x00'
+BEGIN_CHUNKS = BEGIN_CHUNK
+END_CHUNKS = b'\xde\x00\x00\x00'
+
+# blocks with child count
+PARENT_TYPES = {2, 3, 4, 5, 6, 7, 9, 10, 11, 19, 21, 22, 24, 26, 29, 33, 36, 37, 39}
+# vertex blocks get polygon blocks as children
+VERTEX_TYPES = {6, 7, 36, 37}
+POLYGON_CHILDREN = {8: 1, 35: 3}
+
+# Polygon formats and u32 words per polygon vertex, written out by hand from the
+# format rules (not taken from the parser, so the corpus checks it):
+#   block 8/35: f = format ^ 1; index, u v pairs if f & 0x2 ((f >> 8 & 0xff) + 1 pairs),
+#               normal if f & 0x30 == 0x30 (3 floats if f & 0x1, else 1 float)
+#   block 28:   index, scale, u v pairs if format & 0x2 ((format >> 8 & 0xff) + 1 pairs)
+POLYGON_8_FORMATS = {
+    0x0: 1, 0x1: 1,
+    0x2: 3, 0x3: 3,             # 1 uv
+    0x30: 4,                    # normal of 3
+    0x32: 6, 0x33: 4,           # 1 uv, normal of 3 / of 1
+    0x103: 5,                   # 2 uv
+    0x132: 8, 0x133: 6,         # 2 uv, normal of 3 / of 1
+    0x202: 7,                   # 3 uv
+}
+POLYGON_28_FORMATS = {
+    0x0: 2,
+    0x2: 4, 0x32: 4,            # 1 uv
+    0x102: 6,                   # 2 uv
+    0x202: 8,                   # 3 uv
+}
+COMPLEX_VERT_FORMATS = [0x1, 0x2, 0x3, 0x101, 0x102, 0x203]
+
+TEXTURE_PARAMS = ['PFRM0565', 'PFRM1555', 'PFRM4444', 'CMAP']
+MASK_PARAMS = ['MSK8', 'MASK', 'MSKR', 'MS16 PFRM0565', 'MS16 PFRM1555', 'MS16 PFRM4444']
+
+FLOAT_POOL_SIZE = 1 << 16
+UINT_POOL_SIZE = 1 << 12
+
+DEFAULT_CONFIG = {
+    "seed": 1,
+    "roots": 100,           # number of roots, ignored when size is set
+    "size": None,           # target b3d size in bytes, roots are added until it is reached
+    "depth": 3,             # levels of blocks below root
+    "children": (1, 4),     # children per parent block
+    "root_types": {5: 6, 24: 2, 19: 1, 4: 1},
+    "block_mix": {
+        5: 3, 4: 2, 9: 1, 10: 1, 21: 1, 24: 2, 29: 1, 33: 1, 39: 1,
+        36: 3, 37: 6, 6: 1, 7: 1,
+        8: 2, 28: 1, 35: 3,
+        12: 1, 13: 1, 14: 1, 15: 1, 16: 1, 17: 1, 20: 1, 23: 1, 25: 1,
+        27: 1, 30: 1, 31: 1, 34: 1, 40: 1,
+    },
+    "verts": (8, 64),       # vertices of blocks 6, 7, 36, 37
+    "polygons": (4, 32),    # polygons of blocks 8, 28, 35
+    "poly_verts": (3, 4),   # vertices of one polygon
+    "floats": (0, 4),       # lengths of other variable arrays
+    "ref_density": 0.5,     # block 18 references per root
+    "materials": 16,
+    "extent": 10000.0,      # roots are spread over square of this size
+    "root_radius": 50.0,
+    # res
+    "textures": 8,
+    "masks": 6,
+    "texture_size": 16,
+}
+
+def make_config(**kwargs):
+    config = dict(DEFAULT_CONFIG)
+    for key, value in kwargs.items():
+        if key not in config:
+            raise ValueError('Unknown corpus option {}'.format(key))
+        if value is not None:
+            config[key] = value
+    if config["materials"] < 2:
+        raise ValueError('At least 2 materials are needed, texnum 0 is never used')
+    return config
+
+def material_names(count):
+    return ['mat{:04d}'.format(i) for i in range(count)]
+
+def root_name(index):
+    return 'root{:06d}'.format(index)
+
+def name32(name):
+    data = name.encode('cp1251')
+    return data + b'\x00' * (32 - len(data))
+
+EMPTY_NAME32 = name32('')
+
+class Weighted:
+
+    def __init__(self, rnd, weights):
+        self.rnd = rnd
+        self.items = list(weights.keys())
+        self.cum_weights = []
+        total = 0
+        for item in self.items:
+            total += weights[item]
+            self.cum_weights.append(total)
+
+    def pick(self):
+        return self.rnd.choices(self.items, cum_weights=self.cum_weights)[0]
+
+class B3DGenerator:
+
+    def __init__(self, config):
+        self.config = config
+        self.rnd = random.Random(config["seed"])
+        rnd = self.rnd
+
+        self.materials = material_names(config["materials"])
+        self.root_types = Weighted(rnd, config["root_types"])
+        self.block_types = Weighted(rnd, config["block_mix"])
+        self.polygon_types = Weighted(rnd, POLYGON_CHILDREN)
+        self.root_names = []
+
+        floats = array('f', [round(rnd.uniform(-100.0, 100.0), 3) for _ in range(FLOAT_POOL_SIZE)])
+        # doubled, so any slice up to pool size can start anywhere
+        self.float_pool = floats.tobytes() * 2
+        self.uint_pool = array('I', [rnd.randrange(1 << 16) for _ in range(UINT_POOL_SIZE)])
+
+    def floats(self, count):
+        """count random floats as bytes."""
+        size = count * 4
+        pool_size = FLOAT_POOL_SIZE * 4
+        if size <= pool_size:
+            start = self.rnd.randrange(FLOAT_POOL_SIZE) * 4
+            return self.float_pool[start:start+size]
+        parts = [self.float_pool[:pool_size]] * (size // pool_size)
+        parts.append(self.float_pool[:size % pool_size])
+        return b''.join(parts)
+
+    def count(self, key):
+        lo, hi = self.config[key]
+        return self.rnd.randint(lo, hi)
+
+    def texnum(self):
+        return self.rnd.randrange(1, len(self.materials))
+
+    def sphere(self, center):
+        rnd = self.rnd
+        radius = self.config["root_radius"]
+        return SPHERE.pack(
+            center[0] + rnd.uniform(-radius, radius),
+            center[1] + rnd.uniform(-radius, radius),
+            center[2] + rnd.uniform(-radius, radius) * 0.1,
+            rnd.uniform(1.0, radius)
+        )
+
+    def polygons(self, parts, poly_count, vert_count, is_28=False):
+        rnd = self.rnd
+        lo, hi = self.config["poly_verts"]
+        formats = POLYGON_28_FORMATS if is_28 else POLYGON_8_FORMATS
+        format_list = list(formats.keys())
+        index_count = max(vert_count, 1)
+        for _ in range(poly_count):
+            format_raw = rnd.choice(format_list)
+            poly_verts = rnd.randint(lo, hi)
+            words = formats[format_raw]
+            parts.append(POLYGON_HEAD.pack(format_raw, rnd.uniform(0.0, 1.0), 0, self.texnum(), poly_verts))
+            verts = array('I')
+            verts.frombytes(self.floats(words * poly_verts))
+            start = rnd.randrange(index_count)
+            verts[0::words] = array('I', [(start + i) % index_count for i in range(poly_verts)])
+            if is_28:
+                verts[1::words] = self.uint_pool[:poly_verts]
+            parts.append(verts.tobytes())
+
+    def body(self, parts, btype, center, child_cnt, ctx):
+        """Appends body of block btype, ctx carries vertex count of parent and reference names."""
+        rnd = self.rnd
+        floats = self.floats
+        if btype != 18 and btype not in (0, 1, 19, 23, 24, 25):
+            bound = self.sphere(center)
+        if btype == 0:
+            parts.append(floats(11))
+        elif btype == 1:
+            parts.append(HEAD_B_1.pack(EMPTY_NAME32, EMPTY_NAME32))
+        elif btype in (2, 9, 10, 11, 22):
+            parts.append(bound + floats(4) + UINT.pack(child_cnt))
+        elif btype == 3:
+            parts.append(bound + UINT.pack(child_cnt))
+        elif btype == 4:
+            parts.append(bound + EMPTY_NAME32 + EMPTY_NAME32 + UINT.pack(child_cnt))
+        elif btype == 5:
+            parts.append(bound + EMPTY_NAME32 + UINT.pack(child_cnt))
+        elif btype in (6, 7):
+            vert_count = ctx["verts"]
+            names = EMPTY_NAME32 * (2 if btype == 6 else 1)
+            parts.append(bound + names + UINT.pack(vert_count) + floats(5 * vert_count) + UINT.pack(child_cnt))
+        elif btype == 8:
+            poly_count = self.count("polygons")
+            parts.append(bound + UINT.pack(poly_count))
+            self.polygons(parts, poly_count, ctx["verts"])
+        elif btype in (12, 14):
+            count = self.count("floats")
+            parts.append(bound + floats(4) + UINT3.pack(0, 0, count) + floats(count))
+        elif btype in (13, 15):
+            count = self.count("floats")
+            parts.append(bound + UINT3.pack(0, 0, count) + floats(count))
+        elif btype in (16, 17):
+            count = self.count("floats")
+            parts.append(bound + floats(8) + UINT3.pack(0, 0, count) + floats(count))
+        elif btype == 18:
+            space_name, add_name = ctx["ref"]
+            parts.append(self.sphere(center) + name32(space_name) + name32(add_name))
+        elif btype == 19:
+            parts.append(UINT.pack(child_cnt))
+        elif btype == 20:
+            coords_count = self.count("floats")
+            count = self.count("floats")
+            parts.append(bound + UINT4.pack(coords_count, 0, 0, count) + floats(count) + floats(3 * coords_count))
+        elif btype == 21:
+            parts.append(bound + UINT3.pack(ctx["groups"], 0, child_cnt))
+        elif btype == 23:
+            count = self.count("floats")
+            verts_count = self.count("floats")
+            parts.append(UINT3.pack(0, 0, count) + floats(count) + UINT.pack(verts_count))
+            for _ in range(verts_count):
+                coords = self.count("floats")
+                parts.append(UINT.pack(coords) + floats(3 * coords))
+        elif btype == 24:
+            parts.append(floats(12) + UINT2.pack(0, child_cnt))
+        elif btype == 25:
+            parts.append(floats(1) + UINT2.pack(0, 0) + EMPTY_NAME32 + floats(11))
+        elif btype == 26:
+            parts.append(bound + floats(9) + UINT.pack(child_cnt))
+        elif btype == 27:
+            parts.append(bound + UINT.pack(0) + floats(3) + UINT.pack(0))
+        elif btype == 28:
+            poly_count = self.count("polygons")
+            parts.append(bound + floats(3) + UINT.pack(poly_count))
+            self.polygons(parts, poly_count, ctx["verts"], True)
+        elif btype == 29:
+            count = self.count("floats")
+            parts.append(bound + UINT2.pack(count, 0) + floats(4) + floats(count) + UINT.pack(child_cnt))
+        elif btype == 30:
+            parts.append(bound + EMPTY_NAME32 + floats(6))
+        elif btype == 31:
+            count = self.count("floats")
+            parts.append(bound + UINT.pack(count) + floats(4) + UINT.pack(0) + floats(3))
+            parts.append(b''.join(UNK_FI.pack(rnd.uniform(0.0, 1.0), 0) for _ in range(count)))
+        elif btype == 33:
+            parts.append(bound + UINT3.pack(0, 0, 0) + floats(15) + UINT.pack(child_cnt))
+        elif btype == 34:
+            count = self.count("floats")
+            parts.append(bound + UINT2.pack(0, count) + floats(4 * count))
+        elif btype == 35:
+            poly_count = self.count("polygons")
+            parts.append(bound + UINT3.pack(rnd.choice((1, 2, 3)), self.texnum(), poly_count))
+            self.polygons(parts, poly_count, ctx["verts"])
+        elif btype in (36, 37):
+            vert_count = ctx["verts"]
+            format_raw = rnd.choice(COMPLEX_VERT_FORMATS)
+            uv_count = format_raw >> 8
+            normal_size = 3 if (format_raw & 0xff) in (1, 2) else 1
+            names = EMPTY_NAME32 * (2 if btype == 36 else 1)
+            parts.append(bound + names + UINT2.pack(format_raw, vert_count))
+            parts.append(floats((5 + 2 * uv_count + normal_size) * vert_count) + UINT.pack(child_cnt))
+        elif btype == 39:
+            parts.append(bound + UINT.pack(0) + floats(4) + UINT2.pack(0, child_cnt))
+        elif btype == 40:
+            count = self.count("floats")
+            parts.append(bound + EMPTY_NAME32 + EMPTY_NAME32 + UINT3.pack(0, 0, count) + floats(count))
+        else:
+            raise ValueError('Block type {} is not supported by generator'.format(btype))
+
+    def block(self, parts, btype, name, center, depth, parent_verts, refs=()):
+        rnd = self.rnd
+        ctx = {"verts": parent_verts, "groups": 0}
+
+        children = []
+        if btype in VERTEX_TYPES:
+            ctx["verts"] = self.count("verts")
+            if depth < self.config["depth"]:
+                children = [self.polygon_types.pick() for _ in range(self.count("children"))]
+        elif btype in PARENT_TYPES and depth < self.config["depth"]:
+            children = [self.block_types.pick() for _ in range(self.count("children"))]
+        if btype in PARENT_TYPES:
+            children.extend([18] * len(refs))
+        else:
+            refs = ()
+
+        if btype == 21:
+            ctx["groups"] = len(children)
+
+        parts.append(BEGIN_CHUNK)
+        parts.append(name32(name))
+        parts.append(UINT.pack(btype))
+        self.body(parts, btype, center, len(children), ctx)
+
+        ref_index = 0
+        for i, child_type in enumerate(children):
+            if btype == 21 and i > 0:
+                parts.append(GROUP_CHUNK)
+            if child_type == 18 and ref_index < len(refs):
+                self.ref_block(parts, center, refs[ref_index])
+                ref_index += 1
+            else:
+                self.block(parts, child_type, '', center, depth + 1, ctx["verts"])
+
+        parts.append(END_CHUNK)
+
+    def ref_block(self, parts, center, ref):
+        parts.append(BEGIN_CHUNK)
+        parts.append(EMPTY_NAME32)
+        parts.append(UINT.pack(18))
+        self.body(parts, 18, center, 0, {"ref": ref})
+        parts.append(END_CHUNK)
+
+    def references(self):
+        """space and add names of block 18 children of next root, only earlier roots are referenced."""
+        rnd = self.rnd
+        earlier = self.root_names
+        if len(earlier) == 0:
+            return []
+        density = self.config["ref_density"]
+        ref_count = int(density) + (1 if rnd.random() < density - int(density) else 0)
+        refs = []
+        for _ in range(ref_count):
+            add_name = earlier[rnd.randrange(len(earlier))]
+            space_name = earlier[rnd.randrange(len(earlier))] if rnd.random() < 0.25 else ''
+            refs.append((space_name, add_name))
+        return refs
+
+    def root(self):
+        rnd = self.rnd
+        extent = self.config["extent"]
+        name = root_name(len(self.root_names))
+        center = (rnd.uniform(0.0, extent), rnd.uniform(0.0, extent), rnd.uniform(0.0, extent * 0.01))
+        parts = []
+        self.block(parts, self.root_types.pick(), name, center, 0, 0, self.references())
+        self.root_names.append(name)
+        return b''.join(parts)
+
+    def write(self, outFilename):
+        """Writes b3d file, returns number of roots."""
+        size = self.config["size"]
+        root_count = self.config["roots"]
+        with open(outFilename, 'wb') as outFile:
+            outFile.write(b'b3d\x00')
+            ms_file_size = c.reserve_size_byte(outFile)
+            ms_materials = c.reserve_size_byte(outFile)
+            ms_materials_size = c.reserve_size_byte(outFile)
+            ms_nodes = c.reserve_size_byte(outFile)
+            ms_nodes_size = c.reserve_size_byte(outFile)
+
+            cp_materials = int(outFile.tell()/4)
+            outFile.write(struct.pack("<i", len(self.materials)))
+            for mat_name in self.materials:
+                b3dr.write_name(outFile, mat_name)
+
+            cp_nodes = int(outFile.tell()/4)
+            outFile.write(BEGIN_CHUNKS)
+
+            written = outFile.tell()
+            while True:
+                if size is not None:
+                    if written >= size:
+                        break
+                elif len(self.root_names) >= root_count:
+                    break
+                data = self.root()
+                outFile.write(data)
+                written += len(data)
+
+            outFile.write(END_CHUNKS)
+            cp_eof = int(outFile.tell()/4)
+
+            c.write_size(outFile, ms_file_size, cp_eof)
+            c.write_size(outFile, ms_materials, cp_materials)
+            c.write_size(outFile, ms_materials_size, cp_nodes - cp_materials)
+            c.write_size(outFile, ms_nodes, cp_nodes)
+            c.write_size(outFile, ms_nodes_size, cp_eof - cp_nodes)
+
+        return len(self.root_names)
+
+def generate_b3d(outFilename, config):
+    generator = B3DGenerator(config)
+    root_count = generator.write(outFilename)
+    log.info('Written {} roots, {} materials to {} ({} bytes)'.format(
+        root_count, len(generator.materials), outFilename, os.path.getsize(outFilename)))
+    return root_count
+
+# res
+
+def tga32(width, height, colors, rnd):
+    """Uncompressed 32 bit tga made of given ARGB colors."""
+    header = img.TGAHeader()
+    header.image_type = 2
+    header.pixel_depht = 32
+    header.image_descriptor = 32
+    header.image_width = width
+    header.image_height = height
+    pixels = b''.join(struct.pack('>I', rnd.choice(colors)) for _ in range(width * height))
+    return BytesIO(header.to_bytes() + pixels)
+
+def make_palette(rnd):
+    return [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(256)]
+
+def make_plm(palette):
+    palt = b''.join(struct.pack('BBB', *color) for color in palette)
+    sections = b'PALT' + struct.pack('<I', len(palt)) + palt
+    return b'PLM\x00' + struct.pack('<I', len(sections)) + sections
+
+def ms16_mask(width, height, pfrm, rnd):
+    """16 bit mask. Written here because run packets of imghelp.compress_rle are not the
+    ones msk_to_tga32 reads: byte > 127 skips (byte - 128) black pixels, otherwise byte raw pixels follow."""
+    data = bytearray()
+    for _ in range(height):
+        x = 0
+        while x < width:
+            count = min(rnd.randint(1, 8), width - x)
+            if rnd.random() < 0.5:
+                data.append(128 + count)
+            else:
+                data.append(count)
+                data += struct.pack('<{}H'.format(count), *[rnd.randrange(1, 1 << 16) for _ in range(count)])
+            x += count
+    a_msk, r_msk, g_msk, b_msk = img.get_argb_bit_mask(pfrm)
+    footer = b'PFRM' + struct.pack('<5i', 16, r_msk, g_msk, b_msk, a_msk)
+    return b'MS16' + struct.pack('<HH', width, height) + b'\x00' * 768 + bytes(data) + footer
+
+def write_file_section(outBuffer, section_name, entries):
+    c.write_cstring(outBuffer, "{} {}".format(section_name, len(entries)))
+    for entry_name, data in entries:
+        c.write_cstring(outBuffer, entry_name)
+        outBuffer.write(struct.pack('<I', len(data)))
+        outBuffer.write(data)
+
+def generate_res(outFilename, config):
+    """Writes res file with textures in every supported format, masks and materials of generated b3d."""
+    rnd = random.Random(config["seed"])
+    size = config["texture_size"]
+    palette = make_palette(rnd)
+    # few distinct colors, so palette lookup of CMAP textures and masks stays cheap
+    colors = [0xff000000 | (r << 16) | (g << 8) | b for r, g, b in rnd.sample(palette, 8)]
+
+    textures = []
+    for i in range(config["textures"]):
+        params = TEXTURE_PARAMS[i % len(TEXTURE_PARAMS)]
+        tex_params = pack_res.parse_tex_params(params)
+        tex_params['palette'] = palette
+        result = img.tga32_to_txr(tga32(size, size, colors, rnd), tex_params, False)
+        # format is stored in txr itself, entry name keeps only other params
+        textures.append(("tex{:04d}.txr".format(i), result["data"].getvalue()))
+
+    masks = []
+    for i in range(config["masks"]):
+        params = MASK_PARAMS[i % len(MASK_PARAMS)]
+        msk_params = pack_res.parse_msk_params(params)
+        msk_params['palette'] = palette
+        if msk_params['magic'] == 'MS16':
+            data = ms16_mask(size, size, msk_params['pfrm'], rnd)
+        else:
+            mask_colors = colors[:4] + [0xff000000] * 4 # black runs are compressed
+            data = img.tga32_to_msk(tga32(size, size, mask_colors, rnd), msk_params, False)["data"].getvalue()
+        masks.append(("msk{:04d}.msk".format(i), data))
+
+    outBuffer = BytesIO()
+    write_file_section(outBuffer, "PALETTEFILES", [("common.plm", make_plm(palette))])
+    write_file_section(outBuffer, "SOUNDFILES", [])
+    write_file_section(outBuffer, "BACKFILES", [])
+    write_file_section(outBuffer, "TEXTUREFILES", textures)
+    write_file_section(outBuffer, "MASKFILES", masks)
+    c.write_cstring(outBuffer, "COLORS 0")
+
+    names = material_names(config["materials"])
+    c.write_cstring(outBuffer, "MATERIALS {}".format(len(names)))
+    for i, mat_name in enumerate(names):
+        params = []
+        if len(textures) > 0:
+            params.append("tex {}".format(i % len(textures) + 1))
+        if len(masks) > 0 and i % 4 == 3:
+            params.append("msk {}".format(i // 4 % len(masks) + 1))
+        if i > 0 and i % 8 == 0:
+            params.append("par {}".format(i))
+        if len(params) == 0:
+            params.append("col 1")
+        c.write_cstring(outBuffer, "{} {}".format(mat_name, " ".join(params)))
+
+    c.write_cstring(outBuffer, "SOUNDS 0")
+
+    with open(outFilename, 'wb') as file:
+        file.write(outBuffer.getvalue())
+
+    log.info('Written {} textures, {} masks, {} materials to {}'.format(
+        len(textures), len(masks), len(names), outFilename))
+
+def generate_corpus(outpath, basename='corpus', config=None):
+    """Writes {basename}.b3d and matching {basename}.res into outpath, returns their names."""
+    if config is None:
+        config = make_config()
+    if not os.path.exists(outpath):
+        os.makedirs(outpath)
+    b3dFilename = os.path.join(outpath, '{}.b3d'.format(basename))
+    resFilename = os.path.join(outpath, '{}.res'.format(basename))
+    generate_b3d(b3dFilename, config)
+    generate_res(resFilename, config)
+    return b3dFilename, resFilename
+
+def parse_size(text):
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def parse_range(text):
+    parts = [int(x) for x in text.split(',')]
+    if len(parts) == 1:
+        parts = parts * 2
+    if len(parts) != 2 or parts[0] > parts[1]:
+        raise argparse.ArgumentTypeError('Expected range as MIN,MAX')
+    return tuple(parts)
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        btype, weight = item.split(':')
+        mix[int(btype)] = float(weight)
+    return mix
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates synthetic .b3d and .res files for load testing")
+    parser.add_argument('--o', help="Output folder", required=True)
+    parser.add_argument('--name', help="Base name of generated files", default='corpus')
+    parser.add_argument('--seed', help="Random seed", type=int)
+    parser.add_argument('--roots', help="Number of roots", type=int)
+    parser.add_argument('--size', help="Target .b3d size (e.g. 500K, 20M, 2G). Overrides --roots", type=parse_size)
+    parser.add_argument('--depth', help="Nesting depth below root", type=int)
+    parser.add_argument('--children', help="Children per parent block, MIN,MAX", type=parse_range)
+    parser.add_argument('--mix', help="Block type weights, TYPE:WEIGHT,... (e.g. 5:2,37:4,35:4)", type=parse_mix)
+    parser.add_argument('--verts', help="Vertices per vertex block, MIN,MAX", type=parse_range)
+    parser.add_argument('--polygons', help="Polygons per polygon block, MIN,MAX", type=parse_range)
+    parser.add_argument('--ref-density', help="Block 18 references per root", type=float)
+    parser.add_argument('--materials', help="Number of materials", type=int)
+    parser.add_argument('--textures', help="Number of textures in .res", type=int)
+    parser.add_argument('--masks', help="Number of masks in .res", type=int)
+    args = parser.parse_args(argv)
+
+    config = make_config(
+        seed=args.seed, roots=args.roots, size=args.size, depth=args.depth,
+        children=args.children, block_mix=args.mix, verts=args.verts,
+        polygons=args.polygons, ref_density=args.ref_density, materials=args.materials,
+        textures=args.textures, masks=args.masks
+    )
+    generate_corpus(args.o, args.name, config)
+
+if __name__ == '__main__':
+    main()
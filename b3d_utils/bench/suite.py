@@ -0,0 +1,292 @@
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import logging
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+import parsing.read_b3d as b3dr
+import bench.corpus as corpus
+import list_b3d
+import extract_b3d
+import merge_b3d
+import remove_b3d
+
+from parsing.read_b3d import ChunkType
+from parsing.source_b3d import B3DSource
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+log = logging.getLogger("suite")
+log.setLevel(logging.DEBUG)
+
+# Benchmarks of parsers and b3d commands over generated corpus.
+#
+# Every case runs in a fresh interpreter, so peak RSS belongs to that case only
+# and caches of earlier cases don't help later ones. Cases never use .b3didx
+# index, they measure parsing itself. Wall time of a case is median of its runs.
+
+RESULTS_VERSION = 1
+
+CORPUS_NAME = 'bench'
+
+DEFAULT_CORPUS = {
+    "seed": 1,
+    "size": 20 << 20,
+}
+
+def corpus_files(corpusDir):
+    return {
+        "b3d": os.path.join(corpusDir, '{}.b3d'.format(CORPUS_NAME)),
+        "part": os.path.join(corpusDir, '{}_part.b3d'.format(CORPUS_NAME)),
+        "meta": os.path.join(corpusDir, '{}.json'.format(CORPUS_NAME)),
+    }
+
+def every_tenth_root(b3dFilename):
+    with B3DSource(b3dFilename) as source:
+        stream = source.stream
+        b3dr.read_file_header(stream)
+        b3dr.read_materials_list(stream)
+        stream.read(4) # BEGIN_BLOCKS
+        roots = b3dr.read_roots(stream, stream.tell())["roots"]
+    return [name for i, name in enumerate(roots.keys()) if i % 10 == 0]
+
+def prepare_corpus(corpusDir, corpusConfig):
+    """Generates corpus once, it is reused while its config is the same."""
+    files = corpus_files(corpusDir)
+    if os.path.exists(files["meta"]) and os.path.exists(files["b3d"]) and os.path.exists(files["part"]):
+        with open(files["meta"], 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta["config"] == corpusConfig:
+            return meta
+
+    if not os.path.exists(corpusDir):
+        os.makedirs(corpusDir)
+    config = corpus.make_config(**corpusConfig)
+    corpus.generate_b3d(files["b3d"], config)
+
+    # extract selection and merge target: every tenth root of corpus
+    selected = every_tenth_root(files["b3d"])
+    extract_b3d.b3dextract(files["b3d"], None, files["part"], selected, False, False, False, [], {}, useIndex=False)
+
+    meta = {
+        "config": corpusConfig,
+        "b3d_size": os.path.getsize(files["b3d"]),
+        "part_size": os.path.getsize(files["part"]),
+        "selected": selected,
+    }
+    with open(files["meta"], 'w', encoding='utf-8') as file:
+        json.dump(meta, file, indent=2)
+    return meta
+
+# cases, each returns number of input bytes it processed
+
+def read_header(stream):
+    b3dr.read_file_header(stream)
+    b3dr.read_materials_list(stream)
+    stream.read(4) # BEGIN_BLOCKS
+    return stream.tell()
+
+def case_read_roots(files, workDir):
+    with B3DSource(files["b3d"]) as source:
+        nodesOffset = read_header(source.stream)
+        b3dr.read_roots(source.stream, nodesOffset)
+        return source.size
+
+def case_read_block(files, workDir):
+    with B3DSource(files["b3d"]) as source:
+        stream = source.stream
+        read_header(stream)
+        ex = 0
+        while ex != ChunkType.END_CHUNKS:
+            ex = b3dr.read_chunk_type(stream)
+            if ex == ChunkType.BEGIN_CHUNK:
+                b3dr.read_block(stream)
+        return source.size
+
+def case_b3dlist(files, workDir):
+    list_b3d.b3dlist(files["b3d"], 'FULL', os.path.join(workDir, 'list.json'))
+    return os.path.getsize(files["b3d"])
+
+def case_b3dextract(files, workDir):
+    with open(files["meta"], 'r', encoding='utf-8') as file:
+        selected = json.load(file)["selected"]
+    extract_b3d.b3dextract(files["b3d"], None, os.path.join(workDir, 'extract.b3d'), selected, False, True, True, [], {}, useIndex=False)
+    return os.path.getsize(files["b3d"])
+
+def case_b3dmerge(files, workDir):
+    merge_b3d.b3dmerge(files["b3d"], files["part"], os.path.join(workDir, 'merge.b3d'), True, useIndex=False)
+    return os.path.getsize(files["b3d"]) + os.path.getsize(files["part"])
+
+def case_b3dremove(files, workDir):
+    remove_b3d.b3dremove(files["b3d"], os.path.join(workDir, 'remove.b3d'), [], ['root*5'], useIndex=False)
+    return os.path.getsize(files["b3d"])
+
+CASES = {
+    "read_roots": case_read_roots,
+    "read_block": case_read_block,
+    "b3dlist": case_b3dlist,
+    "b3dextract": case_b3dextract,
+    "b3dmerge": case_b3dmerge,
+    "b3dremove": case_b3dremove,
+}
+
+def peak_rss():
+    """Peak resident set size of current process in bytes, None where it can't be measured."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_case(caseName, corpusDir, resultFilename):
+    """Runs one case in current process and writes its measurement to resultFilename."""
+    files = corpus_files(corpusDir)
+    workDir = os.path.join(corpusDir, 'work_{}'.format(caseName))
+    if not os.path.exists(workDir):
+        os.makedirs(workDir)
+    try:
+        t1 = time.perf_counter()
+        size = CASES[caseName](files, workDir)
+        wall = time.perf_counter() - t1
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    result = {
+        "wall": wall,
+        "peak_rss": peak_rss(),
+        "bytes": size,
+    }
+    with open(resultFilename, 'w', encoding='utf-8') as file:
+        json.dump(result, file)
+
+def spawn_case(caseName, corpusDir):
+    resultFilename = os.path.join(corpusDir, 'result_{}.json'.format(caseName))
+    cmd = [sys.executable, '-m', 'bench.suite', '--case', caseName, '--corpus-dir', corpusDir, '--result', resultFilename]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # case logs are not interesting here
+    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    with open(resultFilename, 'r', encoding='utf-8') as file:
+        result = json.load(file)
+    os.remove(resultFilename)
+    return result
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+def run_suite(corpusDir, caseNames, repeat, corpusConfig):
+    corpusDir = os.path.abspath(corpusDir)
+    meta = prepare_corpus(corpusDir, corpusConfig)
+
+    results = {}
+    for caseName in caseNames:
+        runs = [spawn_case(caseName, corpusDir) for _ in range(repeat)]
+        wall = median([run["wall"] for run in runs])
+        rss = [run["peak_rss"] for run in runs if run["peak_rss"] is not None]
+        size = runs[0]["bytes"]
+        results[caseName] = {
+            "wall": wall,
+            "walls": [run["wall"] for run in runs],
+            "peak_rss": max(rss) if rss else None,
+            "bytes": size,
+            "mb_per_s": size / (1 << 20) / wall if wall > 0 else None,
+        }
+        log.info('{}: {:.3f} s, {:.1f} MB/s'.format(caseName, wall, results[caseName]["mb_per_s"] or 0))
+
+    return {
+        "version": RESULTS_VERSION,
+        "date": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {key: value for key, value in meta.items() if key != "selected"},
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(results, baseline, tolerance):
+    """Compares wall time and peak RSS of every case present in both runs.
+
+    Returns list of rows (case, metric, baseline, current, change, status),
+    status is 'SLOWER'/'LARGER' when value grew more than tolerance (0.1 = 10%).
+    """
+    rows = []
+    if baseline["corpus"]["config"] != results["corpus"]["config"]:
+        log.warning('Baseline was measured on different corpus, comparison is not meaningful')
+    for caseName, current in results["results"].items():
+        base = baseline["results"].get(caseName)
+        if base is None:
+            continue
+        for metric, worse in (("wall", "SLOWER"), ("peak_rss", "LARGER")):
+            old = base.get(metric)
+            new = current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > tolerance:
+                status = worse
+            elif change < -tolerance:
+                status = 'BETTER'
+            else:
+                status = 'OK'
+            rows.append((caseName, metric, old, new, change, status))
+    return rows
+
+def format_comparison(rows):
+    lines = ['{:<12} {:<9} {:>14} {:>14} {:>8}  {}'.format('case', 'metric', 'baseline', 'current', 'change', 'status')]
+    for caseName, metric, old, new, change, status in rows:
+        if metric == 'wall':
+            old_text, new_text = '{:.3f} s'.format(old), '{:.3f} s'.format(new)
+        else:
+            old_text, new_text = '{:.1f} MB'.format(old / (1 << 20)), '{:.1f} MB'.format(new / (1 << 20))
+        lines.append('{:<12} {:<9} {:>14} {:>14} {:>+7.1f}%  {}'.format(caseName, metric, old_text, new_text, change * 100, status))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks b3d parsers and commands over generated corpus")
+    parser.add_argument('--corpus-dir', help="Folder of generated corpus. It is generated on first run", default='bench_corpus')
+    parser.add_argument('--size', help="Corpus .b3d size (e.g. 20M, 1G)", type=corpus.parse_size, default=DEFAULT_CORPUS["size"])
+    parser.add_argument('--seed', help="Corpus random seed", type=int, default=DEFAULT_CORPUS["seed"])
+    parser.add_argument('--cases', help="Cases to run. All by default", nargs="+", choices=list(CASES.keys()))
+    parser.add_argument('--repeat', help="Runs of each case, median wall time is reported. Default is 3", type=int, default=3)
+    parser.add_argument('--o', help="Path to results .json file")
+    parser.add_argument('--baseline', help="Path to results .json file to compare with")
+    parser.add_argument('--tolerance', help="Allowed growth of wall time and peak RSS over baseline. Default is 0.1 (10%%)", type=float, default=0.1)
+    # internal: single case in child process
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        run_case(args.case, args.corpus_dir, args.result)
+        return 0
+
+    corpusConfig = {"seed": args.seed, "size": args.size}
+    caseNames = args.cases if args.cases else list(CASES.keys())
+    results = run_suite(args.corpus_dir, caseNames, args.repeat, corpusConfig)
+
+    if args.o:
+        with open(args.o, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        rows = compare(results, baseline, args.tolerance)
+        print(format_comparison(rows))
+        if any(row[5] in ('SLOWER', 'LARGER') for row in rows):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
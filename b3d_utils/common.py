@@ -1,50 +1,88 @@
+import sys
 import struct
+import logging
 import fnmatch
 import os
 from pathlib import Path
 from io import BytesIO
+from array import array
+from collections import Counter
 
 import parsing.read_b3d as b3dr
 import parsing.read_res as res
+import parsing.index_b3d as b3di
 
 from consts import SECTIONS
 
-class Graph:
-
-    def __init__(self, graph):
-        self.graph = graph
-
-    def DFSUtil(self, val, visited):
+log = logging.getLogger("common")
 
-        visited[val]["in"] += 1
-        for v in self.graph[val]:
-            if self.graph.get(v) is not None:
-                visited[val]["out"] += 1
-                self.DFSUtil(v, visited)
+EMPTY_NAME = ''
 
-    def DFS(self, start=None):
-        V = len(self.graph)  #total vertices
-
-        visited = {}
-        for val in self.graph.keys():
-            visited[val] = {
-                "in": 0,
-                "out": 0
-            }
-
-        searchIn = []
-        if start is not None:
-            searchIn.append(start.name)
-        else:
-            searchIn = self.graph.keys()
+class Graph:
+    """Graph of roots, edge goes from root to every root it adds with block 18.
 
-        for val in searchIn:
-            for v in self.graph[val]:
-                if self.graph.get(v) is not None:
-                    visited[val]["out"] += 1
-                    self.DFSUtil(v, visited)
+    Everything is computed iteratively, so deep or heavily shared reference
+    chains cost O(nodes + edges) and never hit the recursion limit.
+    """
 
-        return visited
+    def __init__(self, graph):
+        # edges to names that are not nodes of the graph are dropped
+        self.graph = {
+            val: [v for v in edges if v in graph]
+            for val, edges in graph.items()
+        }
+
+    @classmethod
+    def from_references(cls, refObjs):
+        return cls({key: [cn.add_name for cn in refs] for key, refs in refObjs.items()})
+
+    def in_degrees(self):
+        degrees = dict.fromkeys(self.graph, 0)
+        for edges in self.graph.values():
+            for v in edges:
+                degrees[v] += 1
+        return degrees
+
+    def topological_order(self):
+        """Returns (order, cyclic). Every node in order comes before nodes it references.
+
+        cyclic - nodes that lie on reference cycles (they and nodes between cycles can't be ordered).
+        """
+        degrees = self.in_degrees()
+        order = [val for val, degree in degrees.items() if degree == 0]
+        i = 0
+        while i < len(order):
+            for v in self.graph[order[i]]:
+                degrees[v] -= 1
+                if degrees[v] == 0:
+                    order.append(v)
+            i += 1
+
+        if len(order) == len(self.graph):
+            return order, []
+
+        # drop nodes that only lead out of remaining part (cycle descendants), cycles stay
+        ordered = set(order)
+        rest = [val for val in self.graph if val not in ordered]
+        rest_set = set(rest)
+        parents = {val: [] for val in rest}
+        out_degrees = {}
+        for val in rest:
+            edges = [v for v in self.graph[val] if v in rest_set]
+            out_degrees[val] = len(edges)
+            for v in edges:
+                parents[v].append(val)
+        sinks = [val for val in rest if out_degrees[val] == 0]
+        removed = set()
+        while sinks:
+            val = sinks.pop()
+            removed.add(val)
+            for p in parents[val]:
+                out_degrees[p] -= 1
+                if out_degrees[p] == 0:
+                    sinks.append(p)
+
+        return order, [val for val in rest if val not in removed]
 
 def unmask_template(templ):
     offset = 0
@@ -83,19 +121,116 @@ def unmask_bits(num, bytes_cnt=2):
     return bitmask
 
 def getHierarchyRoots(refObjs):
+    """Returns roots that add other roots and are not added by any root."""
 
-    graph = {}
-    for key in refObjs.keys():
-        graph[key] = [cn['add_name'] for cn in refObjs[key]]
+    zgraph = Graph.from_references(refObjs)
+    degrees = zgraph.in_degrees()
+    roots = [cn for cn in zgraph.graph.keys() if (degrees[cn] == 0) and (len(zgraph.graph[cn]) > 0)]
 
-    zgraph = Graph(graph)
-    visited = zgraph.DFS()
-    roots = [cn for cn in visited.keys() if (visited[cn]["in"] == 0) and (visited[cn]["out"] > 0)]
+    order, cyclic = zgraph.topological_order()
+    if len(cyclic) > 0:
+        log.warning('reference cycles between roots: {}'.format(', '.join(cyclic)))
 
     return roots
 
 SECTIONS = ["PALETTEFILES", "SOUNDFILES", "BACKFILES", "MASKFILES", "TEXTUREFILES", "COLORS", "MATERIALS", "SOUNDS"]
 
+def build_reference_closures(refObjs):
+    """Returns transitive references of every root as bitsets over names list.
+
+    nodes[root] - root itself and all roots it adds (directly or through other roots)
+    spaces[root] - space names used by block 18 in all these roots
+    Closures are merged in reverse topological order, so shared subtrees are computed once.
+    """
+    names = list(refObjs.keys())
+    name_indexes = {name: i for i, name in enumerate(names)}
+
+    def name_bit(name):
+        idx = name_indexes.get(name)
+        if idx is None:
+            idx = len(names)
+            names.append(name)
+            name_indexes[name] = idx
+        return 1 << idx
+
+    own_nodes = {}
+    own_spaces = {}
+    for root_name, refs in refObjs.items():
+        nodes = name_bit(root_name)
+        spaces = 0
+        for ref in refs:
+            if ref.space_name != EMPTY_NAME:
+                spaces |= name_bit(ref.space_name)
+            # names that are not roots are kept too, write_output_b3d raises ValueError naming them
+            if ref.add_name not in refObjs:
+                nodes |= name_bit(ref.add_name)
+        own_nodes[root_name] = nodes
+        own_spaces[root_name] = spaces
+
+    zgraph = Graph.from_references(refObjs)
+    order, cyclic = zgraph.topological_order()
+
+    closure_nodes = {}
+    closure_spaces = {}
+
+    # roots on cycles (and roots they add) can't be ordered, each one is walked separately
+    ordered = set(order)
+    for root_name in refObjs.keys():
+        if root_name in ordered:
+            continue
+        nodes = 0
+        spaces = 0
+        visited = {root_name}
+        stack = [root_name]
+        while stack:
+            val = stack.pop()
+            nodes |= own_nodes[val]
+            spaces |= own_spaces[val]
+            for v in zgraph.graph[val]:
+                if v not in visited:
+                    visited.add(v)
+                    stack.append(v)
+        closure_nodes[root_name] = nodes
+        closure_spaces[root_name] = spaces
+
+    for root_name in reversed(order):
+        nodes = own_nodes[root_name]
+        spaces = own_spaces[root_name]
+        for v in zgraph.graph[root_name]:
+            nodes |= closure_nodes[v]
+            spaces |= closure_spaces[v]
+        closure_nodes[root_name] = nodes
+        closure_spaces[root_name] = spaces
+
+    return {
+        "names": names,
+        "nodes": {root_name: closure_nodes[root_name] for root_name in refObjs.keys()},
+        "spaces": {root_name: closure_spaces[root_name] for root_name in refObjs.keys()}
+    }
+
+def get_reference_closures(b3dFilename, stream, refObjs, useIndex=True):
+    """Same result as build_reference_closures, stored in .b3didx sidecar."""
+    if not useIndex:
+        return build_reference_closures(refObjs)
+
+    payload = b3di.read_index_section(b3dFilename, stream, b3di.SECTION_CLOSURES)
+    if payload is not None:
+        try:
+            closures = b3di.unpack_closures(payload)
+            if closures["nodes"].keys() == refObjs.keys():
+                return closures
+        except (struct.error, UnicodeDecodeError, IndexError):
+            pass
+        log.warning('reference closures in root index are corrupted, rebuilding')
+
+    closures = build_reference_closures(refObjs)
+    b3di.write_index_section(b3dFilename, stream, b3di.SECTION_CLOSURES, b3di.pack_closures(closures))
+    return closures
+
+def get_closure_names(closures, bits):
+    names = closures["names"]
+    return [names[i] for i in b3di.bits_to_indexes(bits)]
+
 def get_res_params(
     sections, 
     inc_soundfiles, ref_soundfiles, 
@@ -145,42 +280,160 @@ def write_size(io, ms, size):
     io.seek(end_ms, 0)
 
     
-def write_output_b3d(all_roots, all_roots_order, material_list):
-    outBuffer = BytesIO()
-    
-    outBuffer.write(b'b3d\x00')
-    ms_file_size = reserve_size_byte(outBuffer)
-    ms_materials = reserve_size_byte(outBuffer)
-    ms_materials_size = reserve_size_byte(outBuffer)
-    ms_nodes = reserve_size_byte(outBuffer)
-    ms_nodes_size = reserve_size_byte(outBuffer)
-
-    cp_materials = int(outBuffer.tell()/4)
-
-    outBuffer.write(struct.pack("<i", len(material_list))) #Material count
-    for mat_name in material_list:
-        b3dr.write_name(outBuffer, mat_name)
-        
-    cp_nodes = int(outBuffer.tell()/4)
-    
-    outBuffer.write(b'\x4D\x01\x00\x00') #BeginChunks
-    
-    for root_name in all_roots_order:
-        root = all_roots[root_name]
-        temp = root["data"].getvalue()
-        outBuffer.write(temp)
-
-    outBuffer.write(b'\xde\x00\00\00') #EndChunks
-
-    cp_eof = int(outBuffer.tell()/4)
-
-    write_size(outBuffer, ms_file_size, cp_eof)
-    write_size(outBuffer, ms_materials, cp_materials)
-    write_size(outBuffer, ms_materials_size, cp_nodes - cp_materials)
-    write_size(outBuffer, ms_nodes, cp_nodes)
-    write_size(outBuffer, ms_nodes_size, cp_eof - cp_nodes)
-
-    return outBuffer
+def read_root_data(b3dFile, all_roots):
+    for root in all_roots.values():
+        root.data = b3dFile.root_slice(root)
+
+def release_root_data(all_roots):
+    for root in all_roots.values():
+        if isinstance(root.data, memoryview):
+            root.data.release()
+        root.data = None
+
+class MaterialUsage:
+    """Material usage index built from texnum columns of read_roots.
+
+    Texnum is index into material list. Count of a root is number of its texnums
+    pointing to material (one per polygon and one per block 35).
+    """
+
+    def __init__(self, materials_list, root_counts):
+        self.materials_list = materials_list
+        # {root_name: {texnum: count}}
+        self.root_counts = root_counts
+        # {texnum: {root_name: count}}
+        self.texnum_roots = {}
+        for root_name, counts in root_counts.items():
+            for texnum, count in counts.items():
+                self.texnum_roots.setdefault(texnum, {})[root_name] = count
+
+    @classmethod
+    def build(cls, materials_list, all_roots):
+        return cls(materials_list, {
+            root_name: dict(Counter(root.texnums))
+            for root_name, root in all_roots.items()
+        })
+
+    def texnums(self, root_names):
+        """Set of texnum values used by listed roots."""
+        texnums = set()
+        for root_name in root_names:
+            counts = self.root_counts.get(root_name)
+            if counts is not None:
+                texnums.update(counts.keys())
+        return texnums
+
+    def roots(self, mat_index):
+        """{root_name: count} of roots using material."""
+        return self.texnum_roots.get(mat_index, {})
+
+    def unused(self, root_names=None):
+        """Indexes of materials not used by listed roots (by any root if not set)."""
+        if root_names is None:
+            used = self.texnum_roots.keys()
+        else:
+            used = self.texnums(root_names)
+        return [idx for idx in range(len(self.materials_list)) if idx not in used]
+
+    def invalid(self):
+        """{root_name: [texnums]} of texnums out of material list."""
+        mat_count = len(self.materials_list)
+        return {
+            root_name: sorted(texnum for texnum in counts if texnum >= mat_count)
+            for root_name, counts in self.root_counts.items()
+            if any(texnum >= mat_count for texnum in counts)
+        }
+
+    def to_json(self):
+        materials = []
+        for idx, mat_name in enumerate(self.materials_list):
+            roots = self.roots(idx)
+            materials.append({
+                "index": idx,
+                "name": mat_name,
+                "texnums": sum(roots.values()),
+                "roots": dict(sorted(roots.items()))
+            })
+        return {
+            "materials": materials,
+            "unused": [self.materials_list[idx] for idx in self.unused()],
+            "invalid_texnums": self.invalid()
+        }
+
+def remap_texnums(root, mat_index_mapping, shift=0):
+    """Returns copy of root data with remapped texnums or None if no texnum changes."""
+    old_texnums = root.texnums
+    new_texnums = array('I', [mat_index_mapping[val - shift] for val in old_texnums])
+    if new_texnums == old_texnums:
+        return None
+    data = bytearray(root.data)
+    positions = root.texnum_pos
+    # texnums are little-endian uint32, native word view only on little-endian hosts
+    # and only when every texnum lies on word boundary of the root
+    if len(data) % 4 == 0 and sys.byteorder == 'little' and all(pos & 3 == 0 for pos in positions):
+        words = memoryview(data).cast('I')
+        for pos, new_texnum in zip(positions, new_texnums):
+            words[pos >> 2] = new_texnum
+        words.release()
+    else:
+        for pos, new_texnum in zip(positions, new_texnums):
+            struct.pack_into("<I", data, pos, new_texnum)
+    return data
+
+def write_output_b3d(outFilename, all_roots, all_roots_order, material_list, texnum_mappings=None):
+    """Streams b3d file into temporary file next to outFilename and returns its name.
+
+    Root data is written straight from source slices, sizes in header are filled in at the end.
+    Output may be one of source files, so caller moves it in place with replace_output after closing sources.
+    texnum_mappings - {root_name: (mat_index_mapping, shift)}, texnums of these roots are remapped in written copy.
+    """
+    tmpFilename = outFilename + '.tmp'
+    try:
+        with open(tmpFilename, 'wb') as outFile:
+            outFile.write(b'b3d\x00')
+            ms_file_size = reserve_size_byte(outFile)
+            ms_materials = reserve_size_byte(outFile)
+            ms_materials_size = reserve_size_byte(outFile)
+            ms_nodes = reserve_size_byte(outFile)
+            ms_nodes_size = reserve_size_byte(outFile)
+
+            cp_materials = int(outFile.tell()/4)
+
+            outFile.write(struct.pack("<i", len(material_list))) #Material count
+            for mat_name in material_list:
+                b3dr.write_name(outFile, mat_name)
+
+            cp_nodes = int(outFile.tell()/4)
+
+            outFile.write(b'\x4D\x01\x00\x00') #BeginChunks
+
+            for root_name in all_roots_order:
+                root = all_roots.get(root_name)
+                if root is None:
+                    raise ValueError('Root {} is not found in b3d file'.format(root_name))
+                data = None
+                if texnum_mappings and root_name in texnum_mappings:
+                    data = remap_texnums(root, *texnum_mappings[root_name])
+                outFile.write(root.data if data is None else data)
+
+            outFile.write(b'\xde\x00\00\00') #EndChunks
+
+            cp_eof = int(outFile.tell()/4)
+
+            write_size(outFile, ms_file_size, cp_eof)
+            write_size(outFile, ms_materials, cp_materials)
+            write_size(outFile, ms_materials_size, cp_nodes - cp_materials)
+            write_size(outFile, ms_nodes, cp_nodes)
+            write_size(outFile, ms_nodes_size, cp_eof - cp_nodes)
+    except BaseException:
+        if os.path.exists(tmpFilename):
+            os.remove(tmpFilename)
+        raise
+
+    return tmpFilename
+
+def replace_output(tmpFilename, outFilename):
+    os.replace(tmpFilename, outFilename)
 
 def create_missing_folders(filepath):
     binfile_base = os.path.dirname(filepath)
@@ -9,10 +9,14 @@ import io
 # from common import reserve_size_byte, write_size
 import parsing.read_b3d as b3dr 
 import parsing.skip_b3d as b3ds 
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
 from io import BytesIO
 from io import SEEK_CUR
+from concurrent.futures import ProcessPoolExecutor
 
 import extract_res
+import query_b3d
 import common as c
 
 # Compiling HardTruck2B3d:
@@ -24,64 +28,87 @@ log = logging.getLogger("extract_b3d")
 log.setLevel(logging.DEBUG)
 
 
+def get_name(obj):
+    return obj.rstrip('\00')
 
+EMPTY_NAME = ''
 
-class Graph:
-
-    def __init__(self, graph):
-        self.graph = graph
-
-    def DFSUtil(self, val, visited):
-
-        visited[val]["in"] += 1
-        for v in self.graph[val]:
-            if self.graph.get(v) is not None:
-                visited[val]["out"] += 1
-                self.DFSUtil(v, visited)
-
-    def DFS(self, start=None):
-        V = len(self.graph)  #total vertices
-
-        visited = {}
-        for val in self.graph.keys():
-            visited[val] = {
-                "in": 0,
-                "out": 0
-            }
-
-        searchIn = []
-        if start is not None:
-            searchIn.append(start.name)
-        else:
-            searchIn = self.graph.keys()
-
-        for val in searchIn:
-            for v in self.graph[val]:
-                if self.graph.get(v) is not None:
-                    visited[val]["out"] += 1
-                    self.DFSUtil(v, visited)
+def write_extract(all_roots, usage, outpath, extFilename, entry, res_params):
+    """Writes one extracted b3d (and res if set) with materials remapped to the used ones.
 
-        return visited
+    usage - common.MaterialUsage of all_roots
+    """
+    resFilename, ref_materials, selected_sections, section_records = res_params
 
-def getHierarchyRoots(refObjs):
+    materials_list = usage.materials_list
+    idx_to_mat = {idx:mat for idx, mat in enumerate(materials_list)}
 
-    graph = {}
-    for key in refObjs.keys():
-        graph[key] = [cn['add_name'] for cn in refObjs[key]]
+    root_objs = entry["nodes"]
+    spaces = entry["spaces"]
+    current_texnums = usage.texnums(root_objs)
 
-    zgraph = Graph(graph)
-    visited = zgraph.DFS()
-    roots = [cn for cn in visited.keys() if (visited[cn]["in"] == 0) and (visited[cn]["out"] > 0)]
+    used_materials = sorted([idx_to_mat[idx] for idx in list(current_texnums)])
 
-    return roots
+    og_mat_indexes = {f:i for i, f in enumerate(materials_list)}
+    new_mat_indexes = {f:(i+1) for i, f in enumerate(used_materials)}
+    mat_index_mapping = {og_mat_indexes[k]: new_mat_indexes[k] for k in og_mat_indexes if k in new_mat_indexes}            
 
-def get_name(obj):
-    return obj.rstrip('\00')
+    #replace with new texture indexes in b3d file
 
-EMPTY_NAME = ''
+    # replace texnum indexes. Roots are remapped in their own copy while written, source slices stay untouched for next outputs
+    texnum_mappings = {obj: (mat_index_mapping, 0) for obj in root_objs}
 
-
-def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeRefs, ref_materials, selected_sections, section_records):
+    outfilename = os.path.join(outpath, '{}.b3d'.format(extFilename))
+    
+    all_roots_order = sorted(spaces) + sorted(root_objs)
+
+    tmpFilename = c.write_output_b3d(outfilename, all_roots, all_roots_order, used_materials, texnum_mappings)
+    c.replace_output(tmpFilename, outfilename)
+
+    if(resFilename):
+
+        if(ref_materials):   
+            section_records = dict(section_records)
+            section_records["MATERIALS"] = used_materials
+
+        outresfilename = os.path.join(outpath, '{}.res'.format(extFilename))
+        extract_res.resextract(resFilename, outresfilename, selected_sections, section_records)
+
+# State of --jobs worker process, set once by init_extract_worker
+worker_state = {}
+
+def init_extract_worker(b3dFilename, all_roots, usage, outpath, res_params):
+    worker_state.update(
+        b3dFilename=b3dFilename,
+        all_roots=all_roots,
+        usage=usage,
+        outpath=outpath,
+        res_params=res_params
+    )
+
+def run_extract_worker(item):
+    extFilename, entry = item
+    all_roots = worker_state["all_roots"]
+    # file is mapped per output and only roots of the output are sliced, mapping is closed before return
+    written_roots = {name: all_roots[name] for name in entry["spaces"] + entry["nodes"] if name in all_roots}
+    with B3DFile(worker_state["b3dFilename"]) as source:
+        c.read_root_data(source, written_roots)
+        try:
+            write_extract(
+                all_roots,
+                worker_state["usage"],
+                worker_state["outpath"],
+                extFilename,
+                entry,
+                worker_state["res_params"]
+            )
+        finally:
+            c.release_root_data(written_roots)
+    return extFilename
+
+
+
+def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeRefs, ref_materials, selected_sections, section_records, useIndex=True, jobs=1, region=None, lastMatch=False):
 
     basename, ext = os.path.splitext(b3dFilename)
     outname = None
@@ -108,19 +135,19 @@ def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeR
     tt1 = time.mktime(datetime.datetime.now().timetuple())
     #Initial Kaitai Struct parsing
     log.info('initial parsing b3d start')
-    b3d_stream = None
-    with open(b3dFilename, 'rb') as file:
-        b3d_stream = BytesIO(file.read())
-    # read header
-    b3dr.read_file_header(b3d_stream)
+    source = B3DFile(b3dFilename)
+    b3d_stream = source.stream
     # read materials
-    materials_list = [m["name"] for m in b3dr.read_materials_list(b3d_stream)["mat_names"]]
-    # read start_blocks
-    begin_blocks = b3d_stream.read(4)
-    data_blocks_offset = b3d_stream.tell()
+    materials_list = source.read_materials()
+    # blocks start after BEGIN_BLOCKS
+    data_blocks_offset = source.seek_nodes()
     # read blocks
     
-    parsed_b3d = b3dr.read_roots(b3d_stream, data_blocks_offset)
+    if nodesFromCli and region is None and not toUseNodeRefs:
+        # only listed roots are written, scan can stop after the last of them
+        parsed_b3d = b3di.read_roots_until(b3dFilename, b3d_stream, data_blocks_offset, indlNodes, useIndex, lastMatch)
+    else:
+        parsed_b3d = b3di.read_roots_indexed(b3dFilename, b3d_stream, data_blocks_offset, useIndex)
 
     all_roots = parsed_b3d['roots']
     blocks18 = parsed_b3d['references']
@@ -129,44 +156,32 @@ def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeR
     # b3d.end_blocks = KaitaiStream.resolve_enum(HardTruck2B3d.Identifiers, b3d._io.read_u4le())
     log.info('initial parsing b3d end')
 
-    if nodesFromCli:
+    if region is not None:
+        in_region = query_b3d.read_region_roots(b3dFilename, source, region, useIndex)
+        if nodesFromCli:
+            in_region = set(in_region)
+            blocksToExtract = [name for name in indlNodes if name in in_region]
+        else:
+            blocksToExtract = in_region
+        log.info('{} roots in region'.format(len(blocksToExtract)))
+    elif nodesFromCli:
         blocksToExtract = indlNodes
     else:
-        blocksToExtract = getHierarchyRoots(blocks18)
+        blocksToExtract = c.getHierarchyRoots(blocks18)
 
     # log.info(blocksToExtract)
 
     mat_to_idx = {mat:idx for idx, mat in enumerate(materials_list)}
-    idx_to_mat = {idx:mat for idx, mat in enumerate(materials_list)}
-
-    read_from_buffer = None
-    with open(b3dFilename, 'rb') as file:
-        read_from_buffer = io.BytesIO(file.read())
 
     outFileData = {}
 
     # search for referenced blocks
     if (toUseNodeRefs):
+        closures = c.get_reference_closures(b3dFilename, b3d_stream, blocks18, useIndex)
         for extBlock in blocksToExtract:
 
-            g_spaces = set()
-            g_root_objs = set()
-            g_root_objs.add(extBlock)
-            curLevel = [extBlock]
-            # curLevel.append(extBlock)
-            root_objs = set()
-            while len(curLevel) > 0:
-                for add in curLevel:
-                    for block in blocks18[add]:
-                        g_spaces.add(block['space_name'])
-                        g_root_objs.add(block['add_name'])
-                        root_objs.add(block['add_name'])
-                curLevel = list(root_objs)
-                root_objs = set()
-
-            spaces = [cn for cn in list(g_spaces) if cn != EMPTY_NAME]
-
-            root_objs = list(g_root_objs)
+            spaces = c.get_closure_names(closures, closures["spaces"][extBlock])
+            root_objs = c.get_closure_names(closures, closures["nodes"][extBlock])
 
             spaces.sort()
             root_objs.sort(reverse=True)
@@ -184,8 +199,6 @@ def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeR
                 "spaces": []
             }
 
-    current_buffer = io.BytesIO(read_from_buffer.getvalue())
-
     #Replacing texnum in separate buffer
     if(not toSplit):
         root_objs = set()
@@ -198,56 +211,27 @@ def b3dextract(b3dFilename, resFilename, outpath, indlNodes, toSplit, toUseNodeR
             "spaces": []
         }
         
-    for root_name, root in all_roots.items():
-        current_buffer.seek(root["start"],0)
-        all_roots[root_name]["data"] = BytesIO(current_buffer.read(root["size"]))
-
-    for extFilename, entry in outFileData.items():
-
-        current_texnums = set()
-        root_objs = entry["nodes"]
-        spaces = entry["spaces"]
-        for obj in root_objs:
-            if all_roots[obj] is not None and len(all_roots[obj]["texnums"]) > 0:
-                texnums = [tx["val"] for tx in all_roots[obj]["texnums"]]
-                current_texnums.update(texnums)
-
-        used_materials = sorted([idx_to_mat[idx] for idx in list(current_texnums)])
-
-        og_mat_indexes = {f:i for i, f in enumerate(materials_list)}
-        new_mat_indexes = {f:(i+1) for i, f in enumerate(used_materials)}
-        mat_index_mapping = {og_mat_indexes[k]: new_mat_indexes[k] for k in og_mat_indexes if k in new_mat_indexes}            
-
-        #replace with new texture indexes in b3d file
-
-        # replace texnum indexes
-        for obj in root_objs:
-            current_buffer = all_roots[obj]["data"]
-            for texnum_obj in all_roots[obj]["texnums"]:
-                pos = texnum_obj["pos"]
-                texnum = texnum_obj["val"]
-                new_texnum = mat_index_mapping[texnum]
-                current_buffer.seek(pos, 0)
-                current_buffer.write(struct.pack("<I", new_texnum))
-
-        outfilename = os.path.join(outpath, '{}.b3d'.format(extFilename))
-        
-        all_roots_order = sorted(spaces) + sorted(root_objs)
-
-        outBuffer = c.write_output_b3d(all_roots, all_roots_order, used_materials)
-
-        with open(outfilename, 'wb') as outFile:
-            outFile.write(outBuffer.getvalue())
-
-        if(resFilename):
-
-            if(ref_materials):   
-                section_records["MATERIALS"] = used_materials
-
-            outresfilename = os.path.join(outpath, '{}.res'.format(extFilename))
-            extract_res.resextract(resFilename, outresfilename, selected_sections, section_records)
+    res_params = (resFilename, ref_materials, selected_sections, section_records)
+    usage = c.MaterialUsage.build(materials_list, all_roots)
+
+    if toSplit and jobs > 1 and len(outFileData) > 1:
+        # workers map the same file themselves, root table is sent once per worker
+        source.close()
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(outFileData)),
+            initializer=init_extract_worker,
+            initargs=(b3dFilename, all_roots, usage, outpath, res_params)
+        ) as executor:
+            for extFilename in executor.map(run_extract_worker, outFileData.items()):
+                log.info('extracted {}'.format(extFilename))
+    else:
+        c.read_root_data(source, all_roots)
 
+        for extFilename, entry in outFileData.items():
+            write_extract(all_roots, usage, outpath, extFilename, entry, res_params)
 
+        c.release_root_data(all_roots)
+        source.close()
 
     tt1 = time.mktime(datetime.datetime.now().timetuple()) - tt1
 
@@ -10,9 +10,15 @@ import json
 # from common import reserve_size_byte, write_size
 import parsing.read_b3d as b3dr 
 import parsing.skip_b3d as b3ds 
+import parsing.numpy_b3d as b3dnp
+import parsing.index_b3d as b3di
+import parsing.plan_b3d as b3dpl
+import common as c
 from parsing.read_b3d import ChunkType
+from parsing.source_b3d import B3DFile
 from io import BytesIO
 from io import SEEK_CUR
+from concurrent.futures import ProcessPoolExecutor
 
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -21,50 +27,88 @@ log.setLevel(logging.DEBUG)
 
 blocksWithChildren = [2,3,4,5,6,7,9,10,11,19,21,22,24,26,29,33,36,37,39]
 
-def b3dlist(b3dFilename, listType, outFilename):
-
-    rootObjects = {}
-    blocks18 = {}
-
-    b3d_stream = None
-    with open(b3dFilename, 'rb') as file:
-        b3d_stream = BytesIO(file.read())
-    # read header
-    b3dr.read_file_header(b3d_stream)
-    # read materials
-    materials_list = [mat["name"] for mat in b3dr.read_materials_list(b3d_stream)["mat_names"]]
-    # read start_blocks
-    b3dr.begin_blocks = b3d_stream.read(4)
-    data_blocks_offset = b3d_stream.tell()
-    # read blocks
-    
+# what every list type needs from .b3d, parse plan is chosen by it
+LIST_NEEDS = {
+    'MATERIALS': {b3dpl.MATERIALS},
+    'MATERIAL-USAGE': {b3dpl.MATERIALS, b3dpl.TEXNUMS},
+    'ROOTS': {b3dpl.ROOT_SPANS},
+    'FULL': {b3dpl.FULL_TREE},
+}
+
+class RootWriter:
+    """Writes parsed roots one by one as soon as they are read.
+
+    JSON mode gives the same text as json.dumps of the whole tree,
+    NDJSON mode writes one root per line.
+    """
+
+    def __init__(self, out, ndjson=False):
+        self.out = out
+        self.ndjson = ndjson
+        self.count = 0
+
+    def begin(self):
+        if not self.ndjson:
+            self.out.write('[[')
+
+    def write(self, root):
+        self.write_text(json.dumps(root, default=b3dnp.json_default))
+
+    def write_text(self, text):
+        """Writes root already converted to JSON text."""
+        if self.ndjson:
+            self.out.write(text)
+            self.out.write('\n')
+        else:
+            if self.count > 0:
+                self.out.write(', ')
+            self.out.write(text)
+        self.out.flush()
+        self.count += 1
+
+    def end(self):
+        if not self.ndjson:
+            self.out.write(']]')
+        self.out.flush()
+
+def write_output(output, outFilename):
+    if outFilename is not None:
+        with open(outFilename, 'wb') as outFile:
+            outFile.write(output.encode('utf-8'))
+    else:
+        print(output)
+
+def iter_root_trees(stream, start, end=None):
+    """Decodes roots one by one from start and yields their trees (block_data with bname, btype and children).
+
+    Stops at END_CHUNKS or, if end is set, at the first root starting at or after end.
+    """
+
     ex = 0
     level = 0
 
-    objName = ''
-    start_pos = data_blocks_offset
-    end_pos = 0
-
     chidren_arrays = []
 
     nodes = []
-    curNode = None
-    curObj = curNode
     chidren_arrays.append(nodes)
 
+    stream.seek(start)
+
     while ex != ChunkType.END_CHUNKS:
 
-        ex = b3dr.read_chunk_type(b3d_stream)
+        if level == 0 and end is not None and stream.tell() >= end:
+            break
+
+        ex = b3dr.read_chunk_type(stream)
         if ex == ChunkType.END_CHUNK:
             level -= 1
             if level+1 < len(chidren_arrays):
                 chidren_arrays.pop()
             if level == 0:
-                end_pos = b3d_stream.tell()
-                rootObjects[objName] = {
-                    "start": start_pos,
-                    "size": end_pos - start_pos
-                }
+                # root is complete: hand it out and drop its tree
+                for root in nodes:
+                    yield root
+                nodes.clear()
 
         elif ex == ChunkType.END_CHUNKS:
             break
@@ -72,144 +116,115 @@ def b3dlist(b3dFilename, listType, outFilename):
             continue
         elif ex == ChunkType.BEGIN_CHUNK:
 
-            if level == 0:
-                start_pos = b3d_stream.tell()-4
-
-                # if curNode is not None:
-                #     nodes.append(curNode)
-            
-            block_name = b3dr.read_name32(b3d_stream)
-            block_type, = struct.unpack('<I', b3d_stream.read(4))
-            block_data = None
+            block = b3dr.read_block(stream, vertex_arrays=b3dnp.HAS_NUMPY)
+            block_name = block['block_name']
+            block_type = block['block_type']
+            block_data = block['block_data']
 
-            if level == 0:
-                rootObjName = block_name['name']
-            
-            # Switch based on block_type
-            if block_type == 0:
-                block_data = b3dr.read_b_0(b3d_stream)
-            elif block_type == 1:
-                block_data = b3dr.read_b_1(b3d_stream)
-            elif block_type == 2:
-                block_data = b3dr.read_b_2(b3d_stream)
-            elif block_type == 3:
-                block_data = b3dr.read_b_3(b3d_stream)
-            elif block_type == 4:
-                block_data = b3dr.read_b_4(b3d_stream)
-            elif block_type == 5:
-                block_data = b3dr.read_b_5(b3d_stream)
-            elif block_type == 6:
-                block_data = b3dr.read_b_6(b3d_stream)
-            elif block_type == 7:
-                block_data = b3dr.read_b_7(b3d_stream)
-            elif block_type == 8:
-                block_data = b3dr.read_b_8(b3d_stream)
-            elif block_type == 9:
-                block_data = b3dr.read_b_9(b3d_stream)
-            elif block_type == 10:
-                block_data = b3dr.read_b_10(b3d_stream)
-            elif block_type == 11:
-                block_data = b3dr.read_b_11(b3d_stream)
-            elif block_type == 12:
-                block_data = b3dr.read_b_12(b3d_stream)
-            elif block_type == 13:
-                block_data = b3dr.read_b_13(b3d_stream)
-            elif block_type == 14:
-                block_data = b3dr.read_b_14(b3d_stream)
-            elif block_type == 15:
-                block_data = b3dr.read_b_15(b3d_stream)
-            elif block_type == 16:
-                block_data = b3dr.read_b_16(b3d_stream)
-            elif block_type == 17:
-                block_data = b3dr.read_b_17(b3d_stream)
-            elif block_type == 18:
-                block_data = b3dr.read_b_18(b3d_stream)
-            elif block_type == 19:
-                block_data = b3dr.read_b_19(b3d_stream)
-            elif block_type == 20:
-                block_data = b3dr.read_b_20(b3d_stream)
-            elif block_type == 21:
-                block_data = b3dr.read_b_21(b3d_stream)
-            elif block_type == 22:
-                block_data = b3dr.read_b_22(b3d_stream)
-            elif block_type == 23:
-                block_data = b3dr.read_b_23(b3d_stream)
-            elif block_type == 24:
-                block_data = b3dr.read_b_24(b3d_stream)
-            elif block_type == 25:
-                block_data = b3dr.read_b_25(b3d_stream)
-            elif block_type == 26:
-                block_data = b3dr.read_b_26(b3d_stream)
-            elif block_type == 27:
-                block_data = b3dr.read_b_27(b3d_stream)
-            elif block_type == 28:
-                block_data = b3dr.read_b_28(b3d_stream)
-            elif block_type == 29:
-                block_data = b3dr.read_b_29(b3d_stream)
-            elif block_type == 30:
-                block_data = b3dr.read_b_30(b3d_stream)
-            elif block_type == 31:
-                block_data = b3dr.read_b_31(b3d_stream)
-            elif block_type == 33:
-                block_data = b3dr.read_b_33(b3d_stream)
-            elif block_type == 34:
-                block_data = b3dr.read_b_34(b3d_stream)
-            elif block_type == 35:
-                block_data = b3dr.read_b_35(b3d_stream)
-            elif block_type == 36:
-                block_data = b3dr.read_b_36(b3d_stream)
-            elif block_type == 37:
-                block_data = b3dr.read_b_37(b3d_stream)
-            elif block_type == 39:
-                block_data = b3dr.read_b_39(b3d_stream)
-            elif block_type == 40:
-                block_data = b3dr.read_b_40(b3d_stream)
-
-            curObjName = block_name['name']
-            
-            
             if block_data.get('child_cnt') is not None and block_data.get('child_cnt') > 0:
                 block_data['children'] = []
                 chidren_arrays.append(block_data['children'])
 
             block_data['bname'] = block_name['name']
             block_data['btype'] = block_type
-            
-            chidren_arrays[level].append(block_data)
 
-            if level == 0:
-                objName = curObjName
-                blocks18[objName] = []
-            
-            # fill reference list
-            if block_type == 18:
-                blocks18[objName].append({
-                    "space_name" : block_data['space_name']['name'],
-                    "add_name" : block_data['add_name']['name'],
-                })
+            chidren_arrays[level].append(block_data)
 
             level += 1
 
-    output = ''
-    if listType == 'MATERIALS':
-        mat_list = ",\n".join(sorted(materials_list))
-        output = mat_list
-        # print(materials_list)
-    elif listType == 'ROOTS':
-        roots = sorted([n['bname'] for n in chidren_arrays[0]])
-        roots = ',\n'.join(roots)
-        # print(',\n'.join(roots))
-        output = roots
-    elif listType == 'FULL':
-        # print(nodes)
-        # nodes = []
-        # print(json.dumps(chidren_arrays[0]))
-        output = json.dumps(chidren_arrays)
-    
+# chunks per worker process, smaller chunks even out roots of different cost
+CHUNKS_PER_JOB = 4
+
+def split_spans(spans, chunkCount):
+    """Splits root spans (name, start, size) in file order into at most chunkCount
+    ranges (start, end) of consecutive roots with about the same byte size."""
+    total = sum(size for name, start, size in spans)
+    target = total / chunkCount
+    chunks = []
+    chunk_start = None
+    chunk_size = 0
+    for name, start, size in spans:
+        if chunk_start is None:
+            chunk_start = start
+        chunk_size += size
+        if chunk_size >= target:
+            chunks.append((chunk_start, start + size))
+            chunk_start = None
+            chunk_size = 0
+    if chunk_start is not None:
+        chunks.append((chunk_start, spans[-1][1] + spans[-1][2]))
+    return chunks
+
+# State of --jobs worker process, set once by init_list_worker
+worker_state = {}
+
+def init_list_worker(b3dFilename):
+    worker_state["b3dFilename"] = b3dFilename
+
+def run_list_worker(chunk):
+    start, end = chunk
+    # every worker maps the same file, pages are shared through OS cache
+    with B3DFile(worker_state["b3dFilename"]) as source:
+        return [json.dumps(root, default=b3dnp.json_default) for root in iter_root_trees(source.stream, start, end)]
+
+def write_roots_parallel(b3dFilename, source, writer, jobs):
+    """Decodes roots in worker processes by chunks of root spans and writes them in file order.
+    Returns False if file is too small to split, nothing is written then."""
+    spans = b3dr.skip_roots(source.stream, source.seek_nodes())
+    chunks = split_spans(spans, jobs * CHUNKS_PER_JOB) if len(spans) else []
+    if len(chunks) < 2:
+        return False
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(chunks)),
+        initializer=init_list_worker,
+        initargs=(b3dFilename,)
+    ) as executor:
+        for texts in executor.map(run_list_worker, chunks):
+            for text in texts:
+                writer.write_text(text)
+    return True
+
+def b3dlist(b3dFilename, listType, outFilename, ndjson=False, useIndex=True, jobs=1):
+
+    needs = LIST_NEEDS[listType]
+    if b3dpl.make_plan(needs) != b3dpl.PLAN_FULL:
+        with B3DFile(b3dFilename) as source:
+            parsed_b3d = b3dpl.read_planned(source, needs, useIndex)
+        if listType == 'MATERIALS':
+            output = ",\n".join(sorted(parsed_b3d["materials"]))
+        elif listType == 'ROOTS':
+            output = ',\n'.join(sorted(name for name, start, size in parsed_b3d["root_spans"]))
+        elif listType == 'MATERIAL-USAGE':
+            usage = c.MaterialUsage.build(parsed_b3d["materials"], parsed_b3d["roots"])
+            output = json.dumps(usage.to_json(), indent=2)
+        write_output(output, outFilename)
+        return
+
     if outFilename is not None:
-        with open(outFilename, 'wb') as outFile:
-            outFile.write(output.encode('utf-8'))
+        outFile = open(outFilename, 'w', encoding='utf-8', newline='\n')
+        writer = RootWriter(outFile, ndjson)
     else:
-        print(output)
-
-    # tt1 = time.mktime(datetime.datetime.now().timetuple()) - tt1
+        outFile = None
+        writer = RootWriter(sys.stdout, ndjson)
+
+    completed = False
+    try:
+        writer.begin()
+        with B3DFile(b3dFilename) as source:
+            written = False
+            if jobs > 1:
+                written = write_roots_parallel(b3dFilename, source, writer, jobs)
+            if not written:
+                for root in iter_root_trees(source.stream, source.seek_nodes()):
+                    writer.write(root)
+        writer.end()
+        completed = True
+    finally:
+        if outFile is not None:
+            outFile.close()
+            if not completed:
+                # list without closing brackets is not valid json, don't leave it
+                os.remove(outFilename)
+        elif completed:
+            print()
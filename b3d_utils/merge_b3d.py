@@ -6,6 +6,8 @@ import struct
 from io import BytesIO
 
 import parsing.read_b3d as b3dr
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
 import common as c
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -13,44 +15,34 @@ log = logging.getLogger("merge_b3d")
 log.setLevel(logging.DEBUG)
 
 
-def b3dmerge(b3dFromFilepath, b3dToFilepath, outFilepath, toReplace):
+def b3dmerge(b3dFromFilepath, b3dToFilepath, outFilepath, toReplace, useIndex=True):
 
-    b3d_from_read_stream = None
-    with open(b3dFromFilepath, 'rb') as file:
-        b3d_from_read_stream = BytesIO(file.read())
+    source_from = B3DFile(b3dFromFilepath)
+    b3d_from_read_stream = source_from.stream
 
-    b3d_into_read_stream = None
-    with open(b3dToFilepath, 'rb') as file:
-        b3d_into_read_stream = BytesIO(file.read())
+    source_into = B3DFile(b3dToFilepath)
+    b3d_into_read_stream = source_into.stream
         
     if not outFilepath:
         outFilepath = b3dToFilepath
 
-    b3dr.read_file_header(b3d_from_read_stream)
-    materials_list_from = [mat["name"] for mat in b3dr.read_materials_list(b3d_from_read_stream)["mat_names"]]
-    b3d_from_read_stream.read(4) # BEGIN_BLOCKS
-    data_blocks_off_from = b3d_from_read_stream.tell()
+    materials_list_from = source_from.read_materials()
+    data_blocks_off_from = source_from.seek_nodes()
     
-    parsed_from_b3d = b3dr.read_roots(b3d_from_read_stream, data_blocks_off_from)
+    parsed_from_b3d = b3di.read_roots_indexed(b3dFromFilepath, b3d_from_read_stream, data_blocks_off_from, useIndex)
 
-    b3dr.read_file_header(b3d_into_read_stream)
-    materials_list_into = [mat["name"] for mat in b3dr.read_materials_list(b3d_into_read_stream)["mat_names"]]
-    b3d_into_read_stream.read(4) # BEGIN_BLOCKS
-    data_blocks_off_into = b3d_into_read_stream.tell()
+    materials_list_into = source_into.read_materials()
+    data_blocks_off_into = source_into.seek_nodes()
     
-    parsed_into_b3d = b3dr.read_roots(b3d_into_read_stream, data_blocks_off_into)
+    parsed_into_b3d = b3di.read_roots_indexed(b3dToFilepath, b3d_into_read_stream, data_blocks_off_into, useIndex)
 
     # Read root data
     
     roots_from = parsed_from_b3d['roots']
-    for root_name, root in roots_from.items():
-        b3d_from_read_stream.seek(root["start"],0)
-        roots_from[root_name]["data"] = BytesIO(b3d_from_read_stream.read(root["size"]))
+    c.read_root_data(source_from, roots_from)
 
     roots_into = parsed_into_b3d['roots']
-    for root_name, root in roots_into.items():
-        b3d_into_read_stream.seek(root["start"],0)
-        roots_into[root_name]["data"] = BytesIO(b3d_into_read_stream.read(root["size"]))
+    c.read_root_data(source_into, roots_into)
 
     all_materials_order = sorted(list(set(materials_list_into + materials_list_from)))
     
@@ -64,33 +56,36 @@ def b3dmerge(b3dFromFilepath, b3dToFilepath, outFilepath, toReplace):
 
     all_roots = {}
     all_roots_order = []
+    # names of roots taken from b3dFrom
+    from_roots = set()
 
     for root_name, root in roots_into.items():
         all_roots[root_name] = root
-        all_roots[root_name]['is_from'] = False
     
     if toReplace:
         for root_name, root in roots_from.items():
             all_roots[root_name] = root
-            all_roots[root_name]['is_from'] = True
+            from_roots.add(root_name)
     else:
         for root_name, root in roots_from.items():
             if all_roots.get(root_name) is not None:
                 all_roots[root_name] = root
-                all_roots[root_name]['is_from'] = True
+                from_roots.add(root_name)
 
     all_roots_order = sorted(all_roots.keys())
 
+    texnum_mappings = {}
     for root_name, root in all_roots.items():
-        for i, tx in enumerate(root["texnums"]):
-            if root["is_from"]:
-                tx['val'] = from_mat_index_mapping[tx['val']-1]
-            else:
-                tx['val'] = into_mat_index_mapping[tx['val']-1]
-            root["data"].seek(tx["pos"], 0)
-            root["data"].write(struct.pack("<I", tx["val"]))
-
-    outBuffer = c.write_output_b3d(all_roots, all_roots_order, all_materials_order)
-
-    with open(outFilepath, 'wb') as outFile:
-        outFile.write(outBuffer.getvalue())
+        if root_name in from_roots:
+            texnum_mappings[root_name] = (from_mat_index_mapping, 1)
+        else:
+            texnum_mappings[root_name] = (into_mat_index_mapping, 1)
+
+    tmpFilename = c.write_output_b3d(outFilepath, all_roots, all_roots_order, all_materials_order, texnum_mappings)
+
+    c.release_root_data(roots_from)
+    c.release_root_data(roots_into)
+    source_from.close()
+    source_into.close()
+
+    c.replace_output(tmpFilename, outFilepath)
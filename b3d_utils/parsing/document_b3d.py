@@ -0,0 +1,280 @@
+from array import array
+from collections import OrderedDict
+
+import parsing.read_b3d as b3dr
+import parsing.polygon_b3d as b3dp
+from parsing.read_b3d import ChunkType
+from parsing.layout_b3d import BLOCK_HEADER
+from parsing.source_b3d import B3DFile
+
+# Lazy object model of .b3d
+#
+# B3DDocument walks the file once with skip functions of block types and keeps
+# only positions and tree links of blocks in flat arrays. B3DNode is a light
+# view over one block: name is decoded when asked for, block_data is decoded on
+# first access and kept in LRU cache of the document. Children of a block are
+# separate nodes, block_data has only the block's own body. Polygons of blocks
+# 8, 28 and 35 can be read as flat arrays by batched decoder of polygon_b3d.
+
+DEFAULT_CACHE_SIZE = 256
+
+BATCHED_POLYGON_READERS = {
+    8: b3dp.read_batched_b_8,
+    28: b3dp.read_batched_b_28,
+    35: b3dp.read_batched_b_35,
+}
+
+NO_NODE = -1
+
+class B3DNode:
+
+    __slots__ = ('document', 'index')
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, B3DNode) and self.document is other.document and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.document), self.index))
+
+    def __repr__(self):
+        return 'B3DNode({}, {}, type {})'.format(self.index, self.name, self.type)
+
+    @property
+    def name(self):
+        return self.document.node_name(self.index)
+
+    @property
+    def type(self):
+        return self.document.types[self.index]
+
+    @property
+    def start(self):
+        """Position of BEGIN_CHUNK of the block."""
+        return self.document.starts[self.index]
+
+    @property
+    def size(self):
+        """Bytes from BEGIN_CHUNK to END_CHUNK of the block, its children included."""
+        return self.document.ends[self.index] - self.document.starts[self.index]
+
+    @property
+    def group(self):
+        """Number of child group (separated by GROUP_CHUNK) the block belongs to in its parent."""
+        return self.document.groups[self.index]
+
+    @property
+    def parent(self):
+        parent = self.document.parents[self.index]
+        return None if parent == NO_NODE else B3DNode(self.document, parent)
+
+    @property
+    def root(self):
+        node = self
+        while node.document.parents[node.index] != NO_NODE:
+            node = node.parent
+        return node
+
+    @property
+    def level(self):
+        level = 0
+        parent = self.document.parents[self.index]
+        while parent != NO_NODE:
+            level += 1
+            parent = self.document.parents[parent]
+        return level
+
+    @property
+    def children(self):
+        return list(self.document.iter_children(self.index))
+
+    @property
+    def block_data(self):
+        """Decoded body of the block as read_b3d.read_block returns it (without children)."""
+        return self.document.decode(self.index)
+
+    @property
+    def polygons(self):
+        """Polygons of block 8, 28 or 35 as flat arrays (see polygon_b3d), None for other blocks."""
+        return self.document.decode_polygons(self.index)
+
+    def walk(self):
+        """The block and all its descendants in file order."""
+        return self.document.iter_nodes(self.index)
+
+class B3DDocument:
+    """Lazy view of .b3d file.
+
+    roots - root nodes in file order
+    root(name) - first root with given name
+    materials - material names, read on first access
+    """
+
+    def __init__(self, filename, cacheSize=DEFAULT_CACHE_SIZE, vertex_arrays=False):
+        self.file = B3DFile(filename)
+        self.cache_size = cacheSize
+        self.vertex_arrays = vertex_arrays
+        self.cache = OrderedDict()
+        self._materials = None
+        self._root_names = None
+        try:
+            self.index_blocks()
+        except (ValueError, KeyError):
+            self.file.close()
+            raise
+
+    def index_blocks(self):
+        """Single skip pass over node section: positions, types and tree links of all blocks."""
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.types = array('I')
+        self.groups = array('I')
+        self.parents = array('i')
+        self.first_children = array('i')
+        self.next_siblings = array('i')
+        self.root_indexes = array('I')
+
+        stream = self.file.stream
+        read = stream.read
+        tell = stream.tell
+        header_size = BLOCK_HEADER.size
+        unpack_header = BLOCK_HEADER.unpack
+
+        # open blocks, current child group and last added child of each of them
+        opened = []
+        group_stack = [0]
+        last_stack = [NO_NODE]
+
+        self.file.seek_nodes()
+        ex = 0
+        while ex != ChunkType.END_CHUNKS:
+
+            ex = b3dr.read_chunk_type(stream)
+            if ex == ChunkType.END_CHUNK:
+                if len(opened) == 0:
+                    raise ValueError('Unexpected END_CHUNK at {}'.format(tell() - 4))
+                self.ends[opened.pop()] = tell()
+                group_stack.pop()
+                last_stack.pop()
+
+            elif ex == ChunkType.END_CHUNKS:
+                break
+            elif ex == ChunkType.GROUP_CHUNK:
+                group_stack[-1] += 1
+            elif ex == ChunkType.BEGIN_CHUNK:
+
+                start = tell() - 4
+                raw_name, block_type = unpack_header(read(header_size))
+
+                index = len(self.types)
+                parent = opened[-1] if len(opened) else NO_NODE
+                self.starts.append(start)
+                self.ends.append(0)
+                self.types.append(block_type)
+                self.groups.append(group_stack[-1])
+                self.parents.append(parent)
+                self.first_children.append(NO_NODE)
+                self.next_siblings.append(NO_NODE)
+
+                if parent == NO_NODE:
+                    self.root_indexes.append(index)
+                elif last_stack[-1] == NO_NODE:
+                    self.first_children[parent] = index
+                if last_stack[-1] != NO_NODE:
+                    self.next_siblings[last_stack[-1]] = index
+                last_stack[-1] = index
+
+                b3dr.get_block_type(block_type).skip(stream)
+
+                opened.append(index)
+                group_stack.append(0)
+                last_stack.append(NO_NODE)
+
+        if len(opened):
+            raise ValueError('{} blocks are not closed at end of node section'.format(len(opened)))
+
+    @property
+    def node_count(self):
+        return len(self.types)
+
+    @property
+    def materials(self):
+        if self._materials is None:
+            self._materials = self.file.read_materials()
+        return self._materials
+
+    @property
+    def roots(self):
+        return [B3DNode(self, index) for index in self.root_indexes]
+
+    def root(self, name):
+        if self._root_names is None:
+            self._root_names = {}
+            for index in self.root_indexes:
+                self._root_names.setdefault(self.node_name(index), index)
+        index = self._root_names.get(name)
+        return None if index is None else B3DNode(self, index)
+
+    def node(self, index):
+        return B3DNode(self, index)
+
+    def node_name(self, index):
+        start = self.starts[index] + 4
+        return b3dr.decode_name(bytes(self.file.slice(start, 32)))
+
+    def iter_children(self, index):
+        child = self.first_children[index]
+        while child != NO_NODE:
+            yield B3DNode(self, child)
+            child = self.next_siblings[child]
+
+    def iter_nodes(self, index=None):
+        """Nodes in file order: all of them, or the block index with its descendants."""
+        if index is None:
+            first, last = 0, len(self.types)
+        else:
+            # descendants follow the block and start before it ends
+            first, last = index, index + 1
+            end = self.ends[index]
+            while last < len(self.types) and self.starts[last] < end:
+                last += 1
+        for i in range(first, last):
+            yield B3DNode(self, i)
+
+    def cached(self, key, read):
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+            return value
+
+        stream = self.file.stream
+        stream.seek(self.starts[key[1]] + 4 + BLOCK_HEADER.size)
+        value = read(stream)
+
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return value
+
+    def decode(self, index):
+        entry = b3dr.get_block_type(self.types[index])
+        return self.cached(('block', index), entry.read_arrays if self.vertex_arrays else entry.read)
+
+    def decode_polygons(self, index):
+        read_batched = BATCHED_POLYGON_READERS.get(self.types[index])
+        if read_batched is None:
+            return None
+        return self.cached(('polygons', index), lambda stream: read_batched(stream)['polygons'])
+
+    def close(self):
+        self.cache.clear()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
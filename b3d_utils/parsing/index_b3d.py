@@ -0,0 +1,404 @@
+import os
+import sys
+import struct
+import hashlib
+import logging
+from io import BytesIO
+from array import array
+
+import parsing.read_b3d as b3dr
+import parsing.spatial_b3d as b3dsp
+
+log = logging.getLogger("index_b3d")
+
+# Root index sidecar (.b3didx)
+#
+# Stores the result of read_b3d.read_roots next to the .b3d, so that commands
+# run on an unchanged file don't have to rescan it.
+#
+# Layout (little-endian):
+#   magic 'B3DI', version u32
+#   key: file size u64, mtime_ns u64, content hash 16 bytes
+#   sections until EOF: tag 4 bytes, payload length u32, payload
+#   ROOT section: per root name, start, size, texnum count, texnum values and positions as u32 arrays
+#   CLOS section: reference closures, name table and per root sorted u32 arrays of name indexes
+#   GRID section: spatial grid over root bounds (see spatial_b3d)
+
+INDEX_MAGIC = b'B3DI'
+INDEX_VERSION = 2
+INDEX_EXT = '.b3didx'
+
+SECTION_ROOTS = b'ROOT'
+SECTION_REFERENCES = b'REFS'
+SECTION_CLOSURES = b'CLOS'
+SECTION_SPATIAL = b'GRID'
+
+INDEX_HEADER = struct.Struct('<4sIQQ16s')
+SECTION_HEADER = struct.Struct('<4sI')
+ROOT_ENTRY = struct.Struct('<III')
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+GRID_HEADER = struct.Struct('<4dIII')
+BOX = struct.Struct('<6d')
+
+HASH_SAMPLE_SIZE = 64 * 1024
+HASH_SAMPLE_COUNT = 16
+
+def get_index_path(b3dFilename):
+    return os.path.splitext(b3dFilename)[0] + INDEX_EXT
+
+def content_hash(stream, file_size):
+    # Hashes head, tail and evenly spaced samples of the file instead of the
+    # whole content: size and mtime are checked too, and a full hash would
+    # cost as much as the scan the index is supposed to save.
+    h = hashlib.blake2b(digest_size=16)
+    stream.seek(0, 0)
+    h.update(stream.read(HASH_SAMPLE_SIZE))
+    if file_size > HASH_SAMPLE_SIZE:
+        step = file_size // (HASH_SAMPLE_COUNT + 1)
+        for i in range(1, HASH_SAMPLE_COUNT + 1):
+            stream.seek(i * step, 0)
+            h.update(stream.read(4096))
+        stream.seek(max(file_size - HASH_SAMPLE_SIZE, 0), 0)
+        h.update(stream.read(HASH_SAMPLE_SIZE))
+    return h.digest()
+
+def get_file_key(b3dFilename, stream):
+    st = os.stat(b3dFilename)
+    pos = stream.tell()
+    digest = content_hash(stream, st.st_size)
+    stream.seek(pos, 0)
+    return (st.st_size, st.st_mtime_ns, digest)
+
+def write_str(stream, txt):
+    raw = txt.encode('utf-8')
+    stream.write(U16.pack(len(raw)))
+    stream.write(raw)
+
+def read_str(stream):
+    length, = U16.unpack(stream.read(2))
+    return stream.read(length).decode('utf-8')
+
+def write_section(stream, tag, payload):
+    stream.write(SECTION_HEADER.pack(tag, len(payload)))
+    stream.write(payload)
+
+def pack_uint_array(values):
+    values = array('I', values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+def unpack_uint_array(raw):
+    values = array('I', raw)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def pack_roots(roots):
+    out = BytesIO()
+    out.write(U32.pack(len(roots)))
+    for root_name, root in roots.items():
+        write_str(out, root_name)
+        out.write(ROOT_ENTRY.pack(root.start, root.size, len(root.texnums)))
+        out.write(pack_uint_array(root.texnums))
+        out.write(pack_uint_array(root.texnum_pos))
+    return out.getvalue()
+
+def unpack_roots(payload):
+    stream = BytesIO(payload)
+    roots = {}
+    root_count, = U32.unpack(stream.read(4))
+    for _ in range(root_count):
+        root_name = sys.intern(read_str(stream))
+        start, size, texnum_count = ROOT_ENTRY.unpack(stream.read(ROOT_ENTRY.size))
+        roots[root_name] = b3dr.RootEntry(
+            start,
+            size,
+            unpack_uint_array(stream.read(4 * texnum_count)),
+            unpack_uint_array(stream.read(4 * texnum_count))
+        )
+    return roots
+
+def pack_references(references):
+    out = BytesIO()
+    out.write(U32.pack(len(references)))
+    for root_name, refs in references.items():
+        write_str(out, root_name)
+        out.write(U32.pack(len(refs)))
+        for ref in refs:
+            write_str(out, ref.space_name)
+            write_str(out, ref.add_name)
+    return out.getvalue()
+
+def unpack_references(payload):
+    stream = BytesIO(payload)
+    references = {}
+    root_count, = U32.unpack(stream.read(4))
+    for _ in range(root_count):
+        root_name = sys.intern(read_str(stream))
+        ref_count, = U32.unpack(stream.read(4))
+        references[root_name] = [
+            b3dr.Reference(read_str(stream), read_str(stream))
+            for _ in range(ref_count)
+        ]
+    return references
+
+def bits_to_indexes(bits):
+    indexes = array('I')
+    while bits:
+        low = bits & -bits
+        indexes.append(low.bit_length() - 1)
+        bits ^= low
+    return indexes
+
+def indexes_to_bits(indexes):
+    bits = 0
+    for i in indexes:
+        bits |= 1 << i
+    return bits
+
+def pack_closures(closures):
+    out = BytesIO()
+    names = closures["names"]
+    name_indexes = {name: i for i, name in enumerate(names)}
+    out.write(U32.pack(len(names)))
+    for name in names:
+        write_str(out, name)
+    out.write(U32.pack(len(closures["nodes"])))
+    for root_name, nodes in closures["nodes"].items():
+        out.write(U32.pack(name_indexes[root_name]))
+        for bits in (nodes, closures["spaces"][root_name]):
+            indexes = bits_to_indexes(bits)
+            out.write(U32.pack(len(indexes)))
+            out.write(pack_uint_array(indexes))
+    return out.getvalue()
+
+def unpack_closures(payload):
+    stream = BytesIO(payload)
+    name_count, = U32.unpack(stream.read(4))
+    names = [read_str(stream) for _ in range(name_count)]
+    nodes = {}
+    spaces = {}
+    root_count, = U32.unpack(stream.read(4))
+    for _ in range(root_count):
+        root_name = names[U32.unpack(stream.read(4))[0]]
+        for closure in (nodes, spaces):
+            count, = U32.unpack(stream.read(4))
+            closure[root_name] = indexes_to_bits(unpack_uint_array(stream.read(4 * count)))
+    return {
+        "names": names,
+        "nodes": nodes,
+        "spaces": spaces
+    }
+
+def pack_spatial(grid):
+    out = BytesIO()
+    out.write(GRID_HEADER.pack(*grid.origin, grid.cell_size, *grid.dims))
+    out.write(U32.pack(len(grid.names)))
+    for name, box in zip(grid.names, grid.boxes):
+        write_str(out, name)
+        out.write(BOX.pack(*box))
+    for values in (grid.cell_starts, grid.cell_items, grid.large):
+        out.write(U32.pack(len(values)))
+        out.write(pack_uint_array(values))
+    return out.getvalue()
+
+def unpack_spatial(payload):
+    stream = BytesIO(payload)
+    v = GRID_HEADER.unpack(stream.read(GRID_HEADER.size))
+    names = []
+    boxes = []
+    name_count, = U32.unpack(stream.read(4))
+    for _ in range(name_count):
+        names.append(read_str(stream))
+        boxes.append(BOX.unpack(stream.read(BOX.size)))
+    arrays = []
+    for _ in range(3):
+        count, = U32.unpack(stream.read(4))
+        arrays.append(unpack_uint_array(stream.read(4 * count)))
+    return b3dsp.SpatialGrid(names, boxes, v[0:3], v[3], v[4:7], *arrays)
+
+def write_index(indexFilename, key, sections):
+    out = BytesIO()
+    out.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, *key))
+    for tag, payload in sections.items():
+        write_section(out, tag, payload)
+
+    # write to temp file first so an interrupted run never leaves a broken index
+    tmpFilename = indexFilename + '.tmp'
+    with open(tmpFilename, 'wb') as outFile:
+        outFile.write(out.getvalue())
+    os.replace(tmpFilename, indexFilename)
+
+def read_index(indexFilename, key):
+    """Returns sections of the index as {tag: payload}, or None if index is missing, stale or of other version."""
+    if not os.path.isfile(indexFilename):
+        return None
+    with open(indexFilename, 'rb') as file:
+        data = file.read()
+    if len(data) < INDEX_HEADER.size:
+        return None
+    magic, version, file_size, mtime_ns, digest = INDEX_HEADER.unpack_from(data, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    if (file_size, mtime_ns, digest) != key:
+        return None
+
+    sections = {}
+    pos = INDEX_HEADER.size
+    while pos < len(data):
+        if pos + SECTION_HEADER.size > len(data):
+            return None
+        tag, length = SECTION_HEADER.unpack_from(data, pos)
+        pos += SECTION_HEADER.size
+        if pos + length > len(data):
+            return None
+        sections[tag] = data[pos:pos+length]
+        pos += length
+    return sections
+
+def load_roots(indexFilename, key):
+    """Roots and references from .b3didx or None if it's missing, stale or corrupted."""
+    try:
+        sections = read_index(indexFilename, key)
+        if sections is not None and SECTION_ROOTS in sections and SECTION_REFERENCES in sections:
+            log.info('using root index {}'.format(indexFilename))
+            return {
+                "roots": unpack_roots(sections[SECTION_ROOTS]),
+                "references": unpack_references(sections[SECTION_REFERENCES])
+            }
+    except (struct.error, UnicodeDecodeError):
+        log.warning('root index {} is corrupted, rebuilding'.format(indexFilename))
+    return None
+
+def read_roots_indexed(b3dFilename, stream, nodesOffset, useIndex=True):
+    """Roots and references as read_b3d.read_roots returns them, loaded from .b3didx sidecar when it matches the file."""
+    if not useIndex:
+        return b3dr.read_roots(stream, nodesOffset)
+
+    indexFilename = get_index_path(b3dFilename)
+    key = get_file_key(b3dFilename, stream)
+
+    parsed_b3d = load_roots(indexFilename, key)
+    if parsed_b3d is not None:
+        return parsed_b3d
+
+    parsed_b3d = b3dr.read_roots(stream, nodesOffset)
+    write_roots_index(indexFilename, key, parsed_b3d)
+    return parsed_b3d
+
+def write_roots_index(indexFilename, key, parsed_b3d, grid=None):
+    """Writes new index with all root sections from read_roots result, other sections are dropped."""
+    if grid is None:
+        grid = b3dsp.SpatialGrid.build(parsed_b3d["bounds"])
+    try:
+        write_index(indexFilename, key, {
+            SECTION_ROOTS: pack_roots(parsed_b3d["roots"]),
+            SECTION_REFERENCES: pack_references(parsed_b3d["references"]),
+            SECTION_SPATIAL: pack_spatial(grid)
+        })
+    except OSError as e:
+        log.warning('could not write root index {}: {}'.format(indexFilename, e))
+
+def read_roots_until(b3dFilename, stream, nodesOffset, names, useIndex=True, lastMatch=False):
+    """Like read_roots_indexed for listed roots only, without index the scan stops as soon as all names are seen.
+
+    Only roots of names are in the result then (references too), index is not written
+    (it would be incomplete). First root of each name is taken, while read_roots and
+    up to date index keep the last one. With lastMatch rest of the file is walked with
+    skip functions, so a later root with one of the names replaces the found one.
+    """
+    if useIndex:
+        parsed_b3d = load_roots(get_index_path(b3dFilename), get_file_key(b3dFilename, stream))
+        if parsed_b3d is not None:
+            return parsed_b3d
+
+    wanted = set(names)
+    roots = {}
+    references = {}
+    left = set(wanted)
+    for rootName, root, rootReferences, rootBounds in b3dr.iter_roots(stream, nodesOffset):
+        if rootName not in wanted:
+            continue
+        roots[rootName] = root
+        references[rootName] = rootReferences
+        left.discard(rootName)
+        if len(left) == 0:
+            break
+
+    if len(left) == 0 and not lastMatch:
+        log.warning('all {} roots found at {} bytes, rest of file is not read: first root of each name is taken. '
+            'Use --last-match to take the last one as full read does'.format(len(roots), stream.tell()))
+    elif len(left) == 0:
+        log.info('all {} roots found at {} bytes, rest of file is only skipped'.format(len(roots), stream.tell()))
+        later = {}
+        for rootName, start, size in b3dr.skip_roots(stream, stream.tell()):
+            if rootName in wanted:
+                later[rootName] = start
+        for rootName, start in later.items():
+            stream.seek(start)
+            rootName, root, rootReferences, rootBounds = next(b3dr.iter_roots(stream, start))
+            roots[rootName] = root
+            references[rootName] = rootReferences
+
+    return {
+        "roots": roots,
+        "references": references
+    }
+
+def read_index_section(b3dFilename, stream, tag):
+    """Returns payload of tag section from .b3didx sidecar or None if it's missing or index is stale."""
+    sections = read_index(get_index_path(b3dFilename), get_file_key(b3dFilename, stream))
+    if sections is None:
+        return None
+    return sections.get(tag)
+
+def write_index_section(b3dFilename, stream, tag, payload):
+    """Adds (or replaces) tag section in up to date .b3didx sidecar, other sections are kept.
+
+    Index of other file content is not updated: it would get current key with only
+    this section. Such index is removed, next read_roots_indexed writes a full one.
+    Returns True if section was written.
+    """
+    indexFilename = get_index_path(b3dFilename)
+    key = get_file_key(b3dFilename, stream)
+    sections = read_index(indexFilename, key)
+    try:
+        if sections is None:
+            if os.path.exists(indexFilename):
+                log.info('root index {} is out of date, removed'.format(indexFilename))
+                os.remove(indexFilename)
+            return False
+        sections[tag] = payload
+        write_index(indexFilename, key, sections)
+    except OSError as e:
+        log.warning('could not write root index {}: {}'.format(indexFilename, e))
+        return False
+    return True
+
+def read_spatial_indexed(b3dFilename, stream, nodesOffset, useIndex=True):
+    """Returns spatial_b3d.SpatialGrid over root bounds, loaded from .b3didx sidecar when it matches the file."""
+    if useIndex:
+        try:
+            payload = read_index_section(b3dFilename, stream, SECTION_SPATIAL)
+            if payload is not None:
+                log.info('using spatial index {}'.format(get_index_path(b3dFilename)))
+                return unpack_spatial(payload)
+        except (struct.error, UnicodeDecodeError, ValueError):
+            log.warning('spatial index in {} is corrupted, rebuilding'.format(get_index_path(b3dFilename)))
+
+    pos = stream.tell()
+    parsed_b3d = b3dr.read_roots(stream, nodesOffset)
+    grid = b3dsp.SpatialGrid.build(parsed_b3d["bounds"])
+    stream.seek(pos, 0)
+
+    if useIndex:
+        indexFilename = get_index_path(b3dFilename)
+        key = get_file_key(b3dFilename, stream)
+        if read_index(indexFilename, key) is None:
+            # missing or stale index: the scan above has everything for a full one
+            write_roots_index(indexFilename, key, parsed_b3d, grid)
+        else:
+            write_index_section(b3dFilename, stream, SECTION_SPATIAL, pack_spatial(grid))
+    return grid
@@ -0,0 +1,78 @@
+import struct
+
+# Precompiled layouts shared by read_b3d and skip_b3d.
+# HEAD_B_* describe the fixed-size part of each block body, i.e. everything
+# up to the first variable-length array (or the whole body if there is none).
+
+UINT = struct.Struct('<I')
+UINT2 = struct.Struct('<II')
+UINT3 = struct.Struct('<III')
+UINT4 = struct.Struct('<IIII')
+FLOAT = struct.Struct('<f')
+UV = struct.Struct('<ff')
+POINT = struct.Struct('<fff')
+SPHERE = struct.Struct('<ffff')
+NAME32 = struct.Struct('<32s')
+BLOCK_HEADER = struct.Struct('<32sI')
+FILE_HEADER = struct.Struct('<4B5I')
+
+POLYGON_HEAD = struct.Struct('<IfIII')  # format_raw, unk_f, unk_i, texnum, vert_count
+UNK_FI = struct.Struct('<fI')
+UNK_3FI = struct.Struct('<fffI')
+
+HEAD_B_0 = struct.Struct('<11f')
+HEAD_B_1 = struct.Struct('<32s32s')
+HEAD_B_2 = struct.Struct('<4f4fI')
+HEAD_B_3 = struct.Struct('<4fI')
+HEAD_B_4 = struct.Struct('<4f32s32sI')
+HEAD_B_5 = struct.Struct('<4f32sI')
+HEAD_B_6 = struct.Struct('<4f32s32sI')
+HEAD_B_7 = struct.Struct('<4f32sI')
+HEAD_B_8 = struct.Struct('<4fI')
+HEAD_B_9 = struct.Struct('<4f4fI')
+HEAD_B_10 = struct.Struct('<4f4fI')
+HEAD_B_11 = struct.Struct('<4f4fI')
+HEAD_B_12 = struct.Struct('<4f4f3I')
+HEAD_B_13 = struct.Struct('<4f3I')
+HEAD_B_14 = struct.Struct('<4f4f3I')
+HEAD_B_15 = struct.Struct('<4f3I')
+HEAD_B_16 = struct.Struct('<4f3f3f2f3I')
+HEAD_B_17 = struct.Struct('<4f3f3f2f3I')
+HEAD_B_18 = struct.Struct('<4f32s32s')
+HEAD_B_19 = struct.Struct('<I')
+HEAD_B_20 = struct.Struct('<4f4I')
+HEAD_B_21 = struct.Struct('<4f3I')
+HEAD_B_22 = struct.Struct('<4f4fI')
+HEAD_B_23 = struct.Struct('<3I')
+HEAD_B_24 = struct.Struct('<12f2I')
+HEAD_B_25 = struct.Struct('<f2I32s3f3f5f')
+HEAD_B_26 = struct.Struct('<4f9fI')
+HEAD_B_27 = struct.Struct('<4fI3fI')
+HEAD_B_28 = struct.Struct('<4f3fI')
+HEAD_B_29 = struct.Struct('<4f2I4f')
+HEAD_B_30 = struct.Struct('<4f32s3f3f')
+HEAD_B_31 = struct.Struct('<4fI4fI3f')
+HEAD_B_33 = struct.Struct('<4f3I3f3f6f3fI')
+HEAD_B_34 = struct.Struct('<4f2I')
+HEAD_B_35 = struct.Struct('<4f3I')
+HEAD_B_36 = struct.Struct('<4f32s32s2I')
+HEAD_B_37 = struct.Struct('<4f32s2I')
+HEAD_B_39 = struct.Struct('<4fI4fII')
+HEAD_B_40 = struct.Struct('<4f32s32s3I')
+
+def read_struct(stream, layout):
+    return layout.unpack(stream.read(layout.size))
+
+_float_arrays = {}
+
+def float_array(count):
+    layout = _float_arrays.get(count)
+    if layout is None:
+        layout = struct.Struct('<{}f'.format(count))
+        _float_arrays[count] = layout
+    return layout
+
+def read_floats(stream, count):
+    if count == 0:
+        return []
+    return list(read_struct(stream, float_array(count)))
@@ -0,0 +1,97 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Optional NumPy decoding of vertex arrays of blocks 6, 7, 36 and 37.
+# Vertex stride is fixed per block (by format_raw for 36/37), so whole array is
+# decoded with single frombuffer call into structured array instead of dict per vertex.
+
+HAS_NUMPY = np is not None
+
+def require_numpy():
+    if not HAS_NUMPY:
+        raise ImportError('numpy is required to decode vertices into arrays')
+
+_dtypes = {}
+
+def simple_vert_dtype():
+    require_numpy()
+    dtype = _dtypes.get('simple')
+    if dtype is None:
+        dtype = np.dtype([
+            ('vert_coord', '<f4', (3,)),
+            ('uv_coord', '<f4', (2,)),
+        ])
+        _dtypes['simple'] = dtype
+    return dtype
+
+def complex_vert_dtype(uv_count, normal_switch):
+    require_numpy()
+    key = (uv_count, normal_switch)
+    dtype = _dtypes.get(key)
+    if dtype is not None:
+        return dtype
+    fields = [
+        ('vert_coord', '<f4', (3,)),
+        ('uv_coord', '<f4', (2,)),
+        ('uv_coord_extra', '<f4', (uv_count, 2)),
+    ]
+    if normal_switch == 0:
+        fields.append(('normal1', '<f4', (3,)))
+    else:
+        fields.append(('normal_off1', '<f4'))
+    dtype = np.dtype(fields)
+    _dtypes[key] = dtype
+    return dtype
+
+def read_verts(stream, dtype, count):
+    data = stream.read(dtype.itemsize * count)
+    return np.frombuffer(data, dtype=dtype, count=count)
+
+def read_simple_verts(stream, count):
+    return read_verts(stream, simple_vert_dtype(), count)
+
+def read_complex_verts(stream, count, uv_count, normal_switch):
+    return read_verts(stream, complex_vert_dtype(uv_count, normal_switch), count)
+
+def is_vertex_array(obj):
+    return HAS_NUMPY and isinstance(obj, np.ndarray) and obj.dtype.names is not None
+
+def vertices_to_list(vertices):
+    """Converts vertex array to the same list of dicts that read_simple_vert/read_complex_vert return."""
+    names = vertices.dtype.names
+    coords = vertices['vert_coord'].tolist()
+    uvs = vertices['uv_coord'].tolist()
+    if 'uv_coord_extra' not in names:
+        return [
+            {'vert_coord': {'x': p[0], 'y': p[1], 'z': p[2]}, 'uv_coord': {'u': uv[0], 'v': uv[1]}}
+            for p, uv in zip(coords, uvs)
+        ]
+
+    extras = vertices['uv_coord_extra'].tolist()
+    if 'normal1' in names:
+        normals = [
+            {'p_normal_switch': 0, 'normal1': {'x': n[0], 'y': n[1], 'z': n[2]}}
+            for n in vertices['normal1'].tolist()
+        ]
+    else:
+        normals = [
+            {'p_normal_switch': 1, 'normal_off1': n}
+            for n in vertices['normal_off1'].tolist()
+        ]
+    return [
+        {
+            'vert_coord': {'x': p[0], 'y': p[1], 'z': p[2]},
+            'uv_coord': {'u': uv[0], 'v': uv[1]},
+            'uv_coord_extra': [{'u': e[0], 'v': e[1]} for e in extra],
+            'vert_normal': normal
+        }
+        for p, uv, extra, normal in zip(coords, uvs, extras, normals)
+    ]
+
+def json_default(obj):
+    """json.dump default hook for trees read with vertex_arrays=True."""
+    if is_vertex_array(obj):
+        return vertices_to_list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
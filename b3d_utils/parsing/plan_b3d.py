@@ -0,0 +1,125 @@
+import struct
+import logging
+
+import parsing.read_b3d as b3dr
+import parsing.index_b3d as b3di
+
+log = logging.getLogger("plan_b3d")
+
+# Parse plans
+#
+# A command declares what it needs from .b3d and gets it by the cheapest way:
+#
+#   header    - file header only
+#   materials - header and materials list, blocks are not touched
+#   skip      - roots walked with skip functions of block types, only root names are decoded
+#   scan      - read_roots (or .b3didx): texnums, references and bounds of roots
+#   full      - everything is decoded, that is left to the command itself
+
+# needs
+HEADER = 'header'
+MATERIALS = 'materials'
+ROOT_SPANS = 'root_spans'
+REFERENCES = 'references'
+TEXNUMS = 'texnums'
+FULL_TREE = 'full_tree'
+
+NEEDS = (HEADER, MATERIALS, ROOT_SPANS, REFERENCES, TEXNUMS, FULL_TREE)
+
+# plans, cheapest first
+PLAN_HEADER = 'header'
+PLAN_MATERIALS = 'materials'
+PLAN_SKIP = 'skip'
+PLAN_SCAN = 'scan'
+PLAN_FULL = 'full'
+
+def make_plan(needs):
+    unknown = set(needs) - set(NEEDS)
+    if len(unknown):
+        raise ValueError('Unknown parse needs: {}'.format(', '.join(sorted(unknown))))
+    if FULL_TREE in needs:
+        return PLAN_FULL
+    if REFERENCES in needs or TEXNUMS in needs:
+        return PLAN_SCAN
+    if ROOT_SPANS in needs:
+        return PLAN_SKIP
+    if MATERIALS in needs:
+        return PLAN_MATERIALS
+    return PLAN_HEADER
+
+GROUP_CHUNK = b'\xbc\x01\x00\x00'
+
+def spans_cover_nodes(b3dFile, spans):
+    """True if spans (in file order) cover the whole node section, only GROUP_CHUNK markers may lie between them.
+
+    Index keeps one root per name, so a root with repeated name leaves a gap.
+    """
+    pos = b3dFile.nodes_offset
+    for name, start, size in spans:
+        while pos < start:
+            if b3dFile.slice(pos, len(GROUP_CHUNK)) != GROUP_CHUNK:
+                return False
+            pos += len(GROUP_CHUNK)
+        if pos != start:
+            return False
+        pos = start + size
+    return pos == b3dFile.nodes_end
+
+def read_indexed_spans(b3dFile):
+    """Root spans from up to date .b3didx, None if there is no such index or it misses some roots.
+    Index is not written here."""
+    try:
+        payload = b3di.read_index_section(b3dFile.filename, b3dFile.stream, b3di.SECTION_ROOTS)
+        if payload is None:
+            return None
+        roots = b3di.unpack_roots(payload)
+        for root in roots.values():
+            b3dFile.check_root(root)
+    except (struct.error, UnicodeDecodeError, ValueError):
+        log.warning('root index {} does not match the file, roots are scanned'.format(b3di.get_index_path(b3dFile.filename)))
+        return None
+    spans = sorted(((name, root.start, root.size) for name, root in roots.items()), key=lambda span: span[1])
+    if not spans_cover_nodes(b3dFile, spans):
+        log.info('root index {} has one root per name, roots are scanned'.format(b3di.get_index_path(b3dFile.filename)))
+        return None
+    log.info('using root index {}'.format(b3di.get_index_path(b3dFile.filename)))
+    return spans
+
+def read_planned(b3dFile, needs, useIndex=True):
+    """Reads what needs ask for from source_b3d.B3DFile with the cheapest plan.
+
+    Returns dict with plan and header (checked on open, offsets in bytes), plus:
+        materials  - names of materials (all plans but header)
+        nodes_offset - position of first block (all plans but header)
+        root_spans - list of (name, start, size) (skip plan)
+        roots, references - as read_b3d.read_roots returns them (scan plan)
+    For full plan stream is left at first block, decoding is up to the caller.
+    """
+    plan = make_plan(needs)
+    result = {
+        "plan": plan,
+        "header": b3dFile.header
+    }
+    if plan == PLAN_HEADER:
+        return result
+
+    result["materials"] = b3dFile.read_materials()
+    if plan == PLAN_MATERIALS:
+        return result
+
+    nodesOffset = b3dFile.nodes_offset
+    result["nodes_offset"] = nodesOffset
+
+    if plan == PLAN_SKIP:
+        spans = read_indexed_spans(b3dFile) if useIndex else None
+        if spans is None:
+            spans = b3dr.skip_roots(b3dFile.stream, b3dFile.seek_nodes())
+        result["root_spans"] = spans
+    elif plan == PLAN_SCAN:
+        parsed_b3d = b3di.read_roots_indexed(b3dFile.filename, b3dFile.stream, b3dFile.seek_nodes(), useIndex)
+        result["roots"] = parsed_b3d["roots"]
+        result["references"] = parsed_b3d["references"]
+    else:
+        b3dFile.seek_nodes()
+
+    return result
@@ -0,0 +1,194 @@
+import struct
+from array import array
+
+from parsing.layout_b3d import *
+
+# Batched polygon decoding for blocks 8, 28 and 35.
+#
+# Vertex stride of a polygon depends only on its format_raw, so polygons are
+# read head by head and vertex data of each run of same-format polygons is
+# decoded at once. Result is a dict of flat arrays instead of a dict per
+# polygon and per vertex:
+#
+#   per polygon: format_raw, unk_f, unk_i, texnum, texnum_pos, vert_count,
+#                vert_start (offset into per-vertex arrays),
+#                uv_start, normal_start (offsets into uvs/normals)
+#   per vertex:  indices (block 8/35) or scales (block 28, 2 per vertex),
+#                uvs (u, v pairs, uv_count pairs per vertex),
+#                normals (3 floats for normal_switch 0, 1 float for normal_switch 1)
+
+class PolygonLayout:
+
+    def __init__(self, vert_layout, uv_count, normal_size):
+        self.vert_layout = vert_layout
+        self.stride = vert_layout.size
+        self.uv_count = uv_count
+        self.normal_size = normal_size
+
+_layouts_8 = {}
+_layouts_28 = {}
+
+def get_polygon_8_layout(format_raw):
+    layout = _layouts_8.get(format_raw)
+    if layout is None:
+        format = format_raw ^ 1
+        use_uv = (format & 0b10) > 0
+        use_normal = ((format & 0b100000) > 0) and ((format & 0b10000) > 0)
+        uv_count = ((format & 0xff00) >> 8) + (1 if use_uv else 0)
+        if not use_uv:
+            uv_count = 0
+        normal_size = 0
+        if use_normal:
+            normal_size = 3 if (format & 1) > 0 else 1
+        layout = PolygonLayout(struct.Struct('<I' + 'ff' * uv_count + 'f' * normal_size), uv_count, normal_size)
+        _layouts_8[format_raw] = layout
+    return layout
+
+def get_polygon_28_layout(format_raw):
+    layout = _layouts_28.get(format_raw)
+    if layout is None:
+        use_uv = (format_raw & 0b10) > 0
+        uv_count = ((format_raw & 0xff00) >> 8) + 1 if use_uv else 0
+        layout = PolygonLayout(struct.Struct('<II' + 'ff' * uv_count), uv_count, 0)
+        _layouts_28[format_raw] = layout
+    return layout
+
+def new_batch():
+    return {
+        'format_raw': array('I'),
+        'unk_f': array('f'),
+        'unk_i': array('I'),
+        'texnum': array('I'),
+        'texnum_pos': array('I'),
+        'vert_count': array('I'),
+        'vert_start': array('I'),
+        'uv_start': array('I'),
+        'normal_start': array('I'),
+        'indices': array('I'),
+        'scales': array('I'),
+        'uvs': array('f'),
+        'normals': array('f'),
+    }
+
+def decode_run(batch, layout, raw, is_28):
+    indices = batch['scales'] if is_28 else batch['indices']
+    uvs = batch['uvs']
+    normals = batch['normals']
+    index_size = 2 if is_28 else 1
+    uv_end = index_size + layout.uv_count * 2
+    for vert in layout.vert_layout.iter_unpack(raw):
+        indices.extend(vert[:index_size])
+        if layout.uv_count:
+            uvs.extend(vert[index_size:uv_end])
+        if layout.normal_size:
+            normals.extend(vert[uv_end:])
+
+def read_polygons(stream, poly_count, is_28=False, decode_verts=True):
+    """Reads poly_count polygons of block 8/35 (or 28 if is_28) into flat arrays.
+
+    With decode_verts=False vertex data is skipped with a single seek per polygon
+    and only per-polygon arrays are filled (enough to locate texnums).
+    """
+    get_layout = get_polygon_28_layout if is_28 else get_polygon_8_layout
+    batch = new_batch()
+    formats = batch['format_raw']
+    unk_fs = batch['unk_f']
+    unk_is = batch['unk_i']
+    texnums = batch['texnum']
+    texnum_positions = batch['texnum_pos']
+    vert_counts = batch['vert_count']
+
+    read = stream.read
+    head_size = POLYGON_HEAD.size
+    unpack_head = POLYGON_HEAD.unpack
+
+    if not decode_verts:
+        seek = stream.seek
+        tell = stream.tell
+        for _ in range(poly_count):
+            format_raw, unk_f, unk_i, texnum, vert_count = unpack_head(read(head_size))
+            formats.append(format_raw)
+            unk_fs.append(unk_f)
+            unk_is.append(unk_i)
+            texnums.append(texnum)
+            texnum_positions.append(tell() - 8)
+            vert_counts.append(vert_count)
+            seek(get_layout(format_raw).stride * vert_count, 1)
+        return batch
+
+    vert_starts = batch['vert_start']
+    uv_starts = batch['uv_start']
+    normal_starts = batch['normal_start']
+
+    run_layout = None
+    run_data = []
+    vert_total = 0
+    uv_total = 0
+    normal_total = 0
+
+    for _ in range(poly_count):
+        format_raw, unk_f, unk_i, texnum, vert_count = unpack_head(read(head_size))
+        layout = get_layout(format_raw)
+        if layout is not run_layout:
+            if run_data:
+                decode_run(batch, run_layout, b''.join(run_data), is_28)
+            run_layout = layout
+            run_data = []
+
+        formats.append(format_raw)
+        unk_fs.append(unk_f)
+        unk_is.append(unk_i)
+        texnums.append(texnum)
+        texnum_positions.append(stream.tell() - 8)
+        vert_counts.append(vert_count)
+        vert_starts.append(vert_total)
+        uv_starts.append(uv_total)
+        normal_starts.append(normal_total)
+
+        vert_total += vert_count
+        uv_total += vert_count * layout.uv_count * 2
+        normal_total += vert_count * layout.normal_size
+        run_data.append(read(layout.stride * vert_count))
+
+    if run_data:
+        decode_run(batch, run_layout, b''.join(run_data), is_28)
+
+    return batch
+
+def read_batched_b_8(stream, decode_verts=True):
+    v = read_struct(stream, HEAD_B_8)
+    return {
+        'bound1': v[0:4],
+        'poly_count': v[4],
+        'polygons': read_polygons(stream, v[4], False, decode_verts)
+    }
+
+def read_batched_b_28(stream, decode_verts=True):
+    v = read_struct(stream, HEAD_B_28)
+    return {
+        'bound1': v[0:4],
+        'sprite_center': v[4:7],
+        'poly_count': v[7],
+        'polygons': read_polygons(stream, v[7], True, decode_verts)
+    }
+
+def read_batched_b_35(stream, decode_verts=True):
+    v = read_struct(stream, HEAD_B_35)
+    texnum_pos = stream.tell() - 8
+    return {
+        'bound1': v[0:4],
+        'mtype': v[4],
+        'texnum': v[5],
+        'texnum_pos': texnum_pos,
+        'poly_count': v[6],
+        'polygons': read_polygons(stream, v[6], False, decode_verts)
+    }
+
+def scan_b_8(stream):
+    return read_batched_b_8(stream, False)
+
+def scan_b_28(stream):
+    return read_batched_b_28(stream, False)
+
+def scan_b_35(stream):
+    return read_batched_b_35(stream, False)
@@ -1,52 +1,106 @@
 import struct
 import re
 import enum
+from sys import intern
+from functools import partial
+from array import array
 
-import parsing.skip_b3d as b3ds 
+import parsing.skip_b3d as b3ds
+import parsing.numpy_b3d as b3dnp
+import parsing.polygon_b3d as b3dp
+import parsing.spatial_b3d as b3dsp
+from parsing.layout_b3d import *
 
 class ChunkType(enum.Enum):
     END_CHUNK = 0
     END_CHUNKS = 1
     BEGIN_CHUNK = 2
     GROUP_CHUNK = 3
-    
+
+CHUNK_TYPES = {
+    b'\x4D\x01\x00\x00': ChunkType.BEGIN_CHUNK, # Begin_Chunk(333)
+    b'\x2B\x02\x00\x00': ChunkType.END_CHUNK, # End_Chunk(555)
+    b'\xbc\x01\x00\x00': ChunkType.GROUP_CHUNK, # Group_Chunk(444)
+    b'\xde\x00\x00\x00': ChunkType.END_CHUNKS, # End_Chunks(222)
+}
+
+class RootEntry:
+    """Root found by read_roots: its place in file and texnums as parallel uint32 columns.
+
+    texnum_pos are relative to root start. data is set by common.read_root_data.
+    """
+    __slots__ = ('start', 'size', 'texnums', 'texnum_pos', 'data')
+
+    def __init__(self, start=None, size=None, texnums=None, texnum_pos=None):
+        self.start = start
+        self.size = size
+        self.texnums = array('I') if texnums is None else texnums
+        self.texnum_pos = array('I') if texnum_pos is None else texnum_pos
+        self.data = None
+
+class Reference:
+    """Block 18 of a root. Names are interned, the same root is usually referenced many times."""
+    __slots__ = ('space_name', 'add_name')
+
+    def __init__(self, space_name, add_name):
+        self.space_name = intern(space_name)
+        self.add_name = intern(add_name)
+
 def read_chunk_type(_io):
     oc = _io.read(4)
-    # print(oc)
-    if (oc == (b'\x4D\x01\x00\x00')): # Begin_Chunk(111)
-        return ChunkType.BEGIN_CHUNK
-    elif oc == (b'\x2B\x02\x00\x00'): # End_Chunk(555)
-        return ChunkType.END_CHUNK
-    elif oc == (b'\xbc\x01\x00\x00'): # Group_Chunk(444)
-        return ChunkType.GROUP_CHUNK
-    elif oc == (b'\xde\x00\x00\x00'): # End_Chunks(222)
-        return ChunkType.END_CHUNKS
-    else:
-        print(_io.tell())
-        raise Exception()
+    chunk_type = CHUNK_TYPES.get(oc)
+    if chunk_type is None:
+        raise ValueError(f'Invalid chunk identifier {oc} at {_io.tell() - 4}')
+    return chunk_type
+
+def sphere_dict(v, i=0):
+    return {'x': v[i], 'y': v[i+1], 'z': v[i+2], 'r': v[i+3]}
+
+def point_dict(v, i=0):
+    return {'x': v[i], 'y': v[i+1], 'z': v[i+2]}
+
+def color_dict(v, i=0):
+    return {'r': v[i], 'g': v[i+1], 'b': v[i+2]}
+
+# names are stored in cp1251, up to first NUL (bytes after it are garbage)
+NAME_ENCODING = 'cp1251'
+NAME_CACHE_LIMIT = 1 << 16
+
+_names = {}
+
+def decode_name(raw):
+    """Decodes 32 byte name field. Results are interned and cached by raw bytes,
+    most names (empty, '~', space and material names) repeat a lot."""
+    name = _names.get(raw)
+    if name is None:
+        end = raw.find(b'\x00')
+        name = intern((raw if end == -1 else raw[:end]).decode(NAME_ENCODING))
+        if len(_names) < NAME_CACHE_LIMIT:
+            _names[bytes(raw)] = name
+    return name
+
+def name_dict(raw):
+    return {'name': decode_name(raw)}
 
 def read_uv(stream):
-    u, v = struct.unpack('<ff', stream.read(8))
+    u, v = read_struct(stream, UV)
     return {'u': u, 'v': v}
 
 def read_point(stream):
-    x, y, z = struct.unpack('<fff', stream.read(12))
-    return {'x': x, 'y': y, 'z': z}
+    return point_dict(read_struct(stream, POINT))
 
 def read_color(stream):
-    r, g, b = struct.unpack('<fff', stream.read(12))
-    return {'r': r, 'g': g, 'b': b}
+    return color_dict(read_struct(stream, POINT))
 
 def read_sphere(stream):
-    x, y, z, r = struct.unpack('<ffff', stream.read(16))
-    return {'x': x, 'y': y, 'z': z, 'r': r}
+    return sphere_dict(read_struct(stream, SPHERE))
 
 def read_name32(stream):
-    name = stream.read(32).decode('utf-8').rstrip('\x00')
-    return {'name': name}
+    return name_dict(stream.read(32))
+
+re_is_empty = re.compile('~')
 
 def is_empty_name(name):
-    re_is_empty = re.compile(r'.*{}.*'.format('~'))
     return re_is_empty.search(name)
 
 def write_name(stream, name):
@@ -55,17 +109,17 @@ def write_name(stream, name):
         obj_name = name
     name_len = len(obj_name)
     if name_len <= 32:
-        stream.write(obj_name.encode("cp1251"))
+        stream.write(obj_name.encode(NAME_ENCODING))
     stream.write(bytearray(b'\00'*(32-name_len)))
     return
 
 def read_normal(stream):
-    p_normal_switch, = struct.unpack('<I', stream.read(4))
+    p_normal_switch, = read_struct(stream, UINT)
     if p_normal_switch == 0:
         normal1 = read_point(stream)
         return {'p_normal_switch': p_normal_switch, 'normal1': normal1}
     elif p_normal_switch == 1:
-        normal_off1, = struct.unpack('<f', stream.read(4))
+        normal_off1, = read_struct(stream, FLOAT)
         return {'p_normal_switch': p_normal_switch, 'normal_off1': normal_off1}
     else:
         raise ValueError(f'Invalid p_normal_switch value: {p_normal_switch}')
@@ -76,7 +130,7 @@ def read_simple_vert(stream):
     return {'vert_coord': vert_coord, 'uv_coord': uv_coord}
 
 def read_vertex_8(stream, p_use_uv, p_use_normal, p_uv_count, p_normal_switch):
-    vert_ind, = struct.unpack('<I', stream.read(4))
+    vert_ind, = read_struct(stream, UINT)
     result = {'vert_ind': vert_ind}
 
     if p_use_uv:
@@ -94,18 +148,14 @@ def read_normal_param(stream, p_normal_switch):
         normal1 = read_point(stream)
         return {'p_normal_switch': p_normal_switch, 'normal1': normal1}
     elif p_normal_switch == 1:
-        normal_off1, = struct.unpack('<f', stream.read(4))
+        normal_off1, = read_struct(stream, FLOAT)
         return {'p_normal_switch': p_normal_switch, 'normal_off1': normal_off1}
     else:
         return {'p_normal_switch': p_normal_switch}
 
 def read_polygon_8(stream):
-    format_raw, = struct.unpack('<I', stream.read(4))
-    unk_f, = struct.unpack('<f', stream.read(4))
-    unk_i, = struct.unpack('<I', stream.read(4))
-    texnum_pos = stream.tell()
-    texnum, = struct.unpack('<I', stream.read(4))
-    vert_count, = struct.unpack('<I', stream.read(4))
+    format_raw, unk_f, unk_i, texnum, vert_count = read_struct(stream, POLYGON_HEAD)
+    texnum_pos = stream.tell() - 8
 
     format = format_raw ^ 1
     use_uv = (format & 0b10) > 0
@@ -135,7 +185,7 @@ def read_polygon_8(stream):
 
 
 def read_vertex_28(stream, p_use_uv, p_uv_count):
-    scale_u, scale_v = struct.unpack('<II', stream.read(8))
+    scale_u, scale_v = read_struct(stream, UINT2)
     result = {
         'scale_u': scale_u,
         'scale_v': scale_v,
@@ -150,12 +200,8 @@ def read_vertex_28(stream, p_use_uv, p_uv_count):
     return result
 
 def read_polygon_28(stream):
-    format_raw, = struct.unpack('<I', stream.read(4))
-    unk_f, = struct.unpack('<f', stream.read(4))
-    unk_i, = struct.unpack('<I', stream.read(4))
-    texnum_pos = stream.tell()
-    texnum, = struct.unpack('<I', stream.read(4))
-    vert_count, = struct.unpack('<I', stream.read(4))
+    format_raw, unk_f, unk_i, texnum, vert_count = read_struct(stream, POLYGON_HEAD)
+    texnum_pos = stream.tell() - 8
 
     format = format_raw
     use_uv = (format & 0b10) > 0
@@ -197,276 +243,242 @@ def read_complex_vert(stream, p_uv_count, p_normal_switch):
     }
 
 def read_unk_3fi(stream):
-    unk_3f = read_point(stream)  
-    unk_i, = struct.unpack('<I', stream.read(4)) 
+    v = read_struct(stream, UNK_3FI)
     return {
-        'unk_3f': unk_3f,
-        'unk_i': unk_i
+        'unk_3f': point_dict(v),
+        'unk_i': v[3]
     }
-    
+
 def read_unk_fi(stream):
-    unkf, = struct.unpack('<f', stream.read(4))
-    unki, = struct.unpack('<I', stream.read(4))
+    unkf, unki = read_struct(stream, UNK_FI)
     return {
         'unkf': unkf,
         'unki': unki
     }
 
 def read_b_0(stream):
-    content = list(struct.unpack('<11f', stream.read(44)))
+    content = list(read_struct(stream, HEAD_B_0))
     return {'content': content}
 
 def read_b_1(stream):
-    name1 = read_name32(stream)
-    name2 = read_name32(stream)
-    return {'name1': name1, 'name2': name2}
+    v = read_struct(stream, HEAD_B_1)
+    return {'name1': name_dict(v[0]), 'name2': name_dict(v[1])}
 
 def read_b_2(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {'bound1': bound1, 'unk1': unk1, 'child_cnt': child_cnt}
+    v = read_struct(stream, HEAD_B_2)
+    return {'bound1': sphere_dict(v), 'unk1': sphere_dict(v, 4), 'child_cnt': v[8]}
 
 def read_b_3(stream):
-    bound1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {'bound1': bound1, 'child_cnt': child_cnt}
+    v = read_struct(stream, HEAD_B_3)
+    return {'bound1': sphere_dict(v), 'child_cnt': v[4]}
 
 def read_b_4(stream):
-    bound1 = read_sphere(stream)
-    name1 = read_name32(stream)
-    name2 = read_name32(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {'bound1': bound1, 'name1': name1, 'name2': name2, 'child_cnt': child_cnt}
+    v = read_struct(stream, HEAD_B_4)
+    return {'bound1': sphere_dict(v), 'name1': name_dict(v[4]), 'name2': name_dict(v[5]), 'child_cnt': v[6]}
 
 def read_b_5(stream):
-    bound1 = read_sphere(stream)
-    name1 = read_name32(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {'bound1': bound1, 'name1': name1, 'child_cnt': child_cnt}
-
-def read_b_6(stream):
-    bound1 = read_sphere(stream)
-    name1 = read_name32(stream)
-    name2 = read_name32(stream)
-    vert_count, = struct.unpack('<I', stream.read(4))
-    vertices = [read_simple_vert(stream) for _ in range(vert_count)]
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'bound1': bound1,
-        'name1': name1,
-        'name2': name2,
+    v = read_struct(stream, HEAD_B_5)
+    return {'bound1': sphere_dict(v), 'name1': name_dict(v[4]), 'child_cnt': v[5]}
+
+def read_b_6(stream, vertex_arrays=False):
+    v = read_struct(stream, HEAD_B_6)
+    vert_count = v[6]
+    if vertex_arrays:
+        vertices = b3dnp.read_simple_verts(stream, vert_count)
+    else:
+        vertices = [read_simple_vert(stream) for _ in range(vert_count)]
+    child_cnt, = read_struct(stream, UINT)
+    return {
+        'bound1': sphere_dict(v),
+        'name1': name_dict(v[4]),
+        'name2': name_dict(v[5]),
         'vert_count': vert_count,
         'vertices': vertices,
         'child_cnt': child_cnt
     }
 
-def read_b_7(stream):
-    bound1 = read_sphere(stream)
-    group_name = read_name32(stream)
-    vert_count, = struct.unpack('<I', stream.read(4))
-    vertices = [read_simple_vert(stream) for _ in range(vert_count)]
-    child_cnt, = struct.unpack('<I', stream.read(4))
+def read_b_7(stream, vertex_arrays=False):
+    v = read_struct(stream, HEAD_B_7)
+    vert_count = v[5]
+    if vertex_arrays:
+        vertices = b3dnp.read_simple_verts(stream, vert_count)
+    else:
+        vertices = [read_simple_vert(stream) for _ in range(vert_count)]
+    child_cnt, = read_struct(stream, UINT)
     return {
-        'bound1': bound1,
-        'group_name': group_name,
+        'bound1': sphere_dict(v),
+        'group_name': name_dict(v[4]),
         'vert_count': vert_count,
         'vertices': vertices,
         'child_cnt': child_cnt
     }
 
 def read_b_8(stream):
-    bound1 = read_sphere(stream)
-    poly_count, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_8)
+    poly_count = v[4]
     polygons = [read_polygon_8(stream) for _ in range(poly_count)]
     return {
-        'bound1': bound1,
+        'bound1': sphere_dict(v),
         'poly_count': poly_count,
         'polygons': polygons
     }
 
 def read_b_9(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_9)
     return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'child_cnt': child_cnt
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'child_cnt': v[8]
     }
 
 def read_b_10(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_10)
     return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'child_cnt': child_cnt
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'child_cnt': v[8]
     }
 
 
 def read_b_11(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_11)
     return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'child_cnt': child_cnt
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'child_cnt': v[8]
     }
 
 def read_b_12(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    unk_i1, unk_i2, unk_count = struct.unpack('<III', stream.read(12))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+    v = read_struct(stream, HEAD_B_12)
+    unk_count = v[10]
+    unk_floats = read_floats(stream, unk_count)
+    return {
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'unk_i1': v[8],
+        'unk_i2': v[9],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_13(stream):
-    bound1 = read_sphere(stream)
-    unk_i1, unk_i2, unk_count = struct.unpack('<III', stream.read(12))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
+    v = read_struct(stream, HEAD_B_13)
+    unk_count = v[6]
+    unk_floats = read_floats(stream, unk_count)
     return {
-        'bound1': bound1,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+        'bound1': sphere_dict(v),
+        'unk_i1': v[4],
+        'unk_i2': v[5],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_14(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    unk_i1, unk_i2, unk_count = struct.unpack('<III', stream.read(12))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+    v = read_struct(stream, HEAD_B_14)
+    unk_count = v[10]
+    unk_floats = read_floats(stream, unk_count)
+    return {
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'unk_i1': v[8],
+        'unk_i2': v[9],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_15(stream):
-    bound1 = read_sphere(stream)
-    unk_i1, unk_i2, unk_count = struct.unpack('<III', stream.read(12))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
+    v = read_struct(stream, HEAD_B_15)
+    unk_count = v[6]
+    unk_floats = read_floats(stream, unk_count)
     return {
-        'bound1': bound1,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+        'bound1': sphere_dict(v),
+        'unk_i1': v[4],
+        'unk_i2': v[5],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_16(stream):
-    bound1 = read_sphere(stream)
-    point1 = read_point(stream)
-    point2 = read_point(stream)
-    unk_f1, unk_f2 = struct.unpack('<ff', stream.read(8))
-    unk_i1, unk_i2 = struct.unpack('<II', stream.read(8))
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    return {
-        'bound1': bound1,
-        'point1': point1,
-        'point2': point2,
-        'unk_f1': unk_f1,
-        'unk_f2': unk_f2,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+    v = read_struct(stream, HEAD_B_16)
+    unk_count = v[14]
+    unk_floats = read_floats(stream, unk_count)
+    return {
+        'bound1': sphere_dict(v),
+        'point1': point_dict(v, 4),
+        'point2': point_dict(v, 7),
+        'unk_f1': v[10],
+        'unk_f2': v[11],
+        'unk_i1': v[12],
+        'unk_i2': v[13],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_17(stream):
-    bound1 = read_sphere(stream)
-    point1 = read_point(stream)
-    point2 = read_point(stream)
-    unk_f1, unk_f2 = struct.unpack('<ff', stream.read(8))
-    unk_i1, unk_i2 = struct.unpack('<II', stream.read(8))
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    return {
-        'bound1': bound1,
-        'point1': point1,
-        'point2': point2,
-        'unk_f1': unk_f1,
-        'unk_f2': unk_f2,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+    v = read_struct(stream, HEAD_B_17)
+    unk_count = v[14]
+    unk_floats = read_floats(stream, unk_count)
+    return {
+        'bound1': sphere_dict(v),
+        'point1': point_dict(v, 4),
+        'point2': point_dict(v, 7),
+        'unk_f1': v[10],
+        'unk_f2': v[11],
+        'unk_i1': v[12],
+        'unk_i2': v[13],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_18(stream):
-    bound1 = read_sphere(stream)
-    space_name = read_name32(stream)
-    add_name = read_name32(stream)
+    v = read_struct(stream, HEAD_B_18)
     return {
-        'bound1': bound1,
-        'space_name': space_name,
-        'add_name': add_name
+        'bound1': sphere_dict(v),
+        'space_name': name_dict(v[4]),
+        'add_name': name_dict(v[5])
     }
 
 def read_b_19(stream):
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    child_cnt, = read_struct(stream, HEAD_B_19)
     return {'child_cnt': child_cnt}
 
 def read_b_20(stream):
-    bound1 = read_sphere(stream)
-    coords_count, = struct.unpack('<I', stream.read(4))
-    unk_i1, unk_i2 = struct.unpack('<II', stream.read(8))
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
+    v = read_struct(stream, HEAD_B_20)
+    coords_count = v[4]
+    unk_count = v[7]
+    unk_floats = read_floats(stream, unk_count)
     coords = [read_point(stream) for _ in range(coords_count)]
     return {
-        'bound1': bound1,
+        'bound1': sphere_dict(v),
         'coords_count': coords_count,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+        'unk_i1': v[5],
+        'unk_i2': v[6],
         'unk_count': unk_count,
         'unk_floats': unk_floats,
         'coords': coords
     }
 
 def read_b_21(stream):
-    bound1 = read_sphere(stream)
-    group_cnt, = struct.unpack('<I', stream.read(4))
-    unk_i1, = struct.unpack('<I', stream.read(4))
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_21)
     return {
-        'bound1': bound1,
-        'group_cnt': group_cnt,
-        'unk_i1': unk_i1,
-        'child_cnt': child_cnt
+        'bound1': sphere_dict(v),
+        'group_cnt': v[4],
+        'unk_i1': v[5],
+        'child_cnt': v[6]
     }
 
 def read_b_22(stream):
-    bound1 = read_sphere(stream)
-    unk1 = read_sphere(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_22)
     return {
-        'bound1': bound1,
-        'unk1': unk1,
-        'child_cnt': child_cnt
+        'bound1': sphere_dict(v),
+        'unk1': sphere_dict(v, 4),
+        'child_cnt': v[8]
     }
 
 def read_b_23(stream):
-    unk_i1, = struct.unpack('<I', stream.read(4))
-    surface, = struct.unpack('<I', stream.read(4))
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    verts_count, = struct.unpack('<I', stream.read(4))
+    unk_i1, surface, unk_count = read_struct(stream, HEAD_B_23)
+    unk_floats = read_floats(stream, unk_count)
+    verts_count, = read_struct(stream, UINT)
     verts = [read_vert_23(stream) for _ in range(verts_count)]
     return {
         'unk_i1': unk_i1,
@@ -478,215 +490,184 @@ def read_b_23(stream):
     }
 
 def read_vert_23(stream):
-    vert_count, = struct.unpack('<I', stream.read(4))
+    vert_count, = read_struct(stream, UINT)
     verts = [read_point(stream) for _ in range(vert_count)]
     return {'vert_count': vert_count, 'verts': verts}
 
 def read_b_24(stream):
-    coord1 = read_point(stream)
-    coord2 = read_point(stream)
-    coord3 = read_point(stream)
-    pos = read_point(stream)
-    flag, = struct.unpack('<I', stream.read(4))
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'coord1': coord1,
-        'coord2': coord2,
-        'coord3': coord3,
-        'pos': pos,
-        'flag': flag,
-        'child_cnt': child_cnt
+    v = read_struct(stream, HEAD_B_24)
+    return {
+        'coord1': point_dict(v),
+        'coord2': point_dict(v, 3),
+        'coord3': point_dict(v, 6),
+        'pos': point_dict(v, 9),
+        'flag': v[12],
+        'child_cnt': v[13]
     }
 
 def read_b_25(stream):
-    unk_i1, = struct.unpack('<f', stream.read(4))
-    unk_i2, unk_i3 = struct.unpack('<II', stream.read(8))
-    unk_name = read_name32(stream)
-    unk_p1 = read_point(stream)
-    unk_p2 = read_point(stream)
-    unk_f11, unk_f12, unk_f13, unk_f14, unk_f15 = struct.unpack('<fffff', stream.read(20))
+    v = read_struct(stream, HEAD_B_25)
     return {
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
-        'unk_i3': unk_i3,
-        'unk_name': unk_name,
-        'unk_p1': unk_p1,
-        'unk_p2': unk_p2,
-        'unk_f11': unk_f11,
-        'unk_f12': unk_f12,
-        'unk_f13': unk_f13,
-        'unk_f14': unk_f14,
-        'unk_f15': unk_f15
+        'unk_i1': v[0],
+        'unk_i2': v[1],
+        'unk_i3': v[2],
+        'unk_name': name_dict(v[3]),
+        'unk_p1': point_dict(v, 4),
+        'unk_p2': point_dict(v, 7),
+        'unk_f11': v[10],
+        'unk_f12': v[11],
+        'unk_f13': v[12],
+        'unk_f14': v[13],
+        'unk_f15': v[14]
     }
 
 def read_b_26(stream):
-    bound1 = read_sphere(stream)
-    unk_p1 = read_point(stream)
-    unk_p2 = read_point(stream)
-    unk_p3 = read_point(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'bound1': bound1,
-        'unk_p1': unk_p1,
-        'unk_p2': unk_p2,
-        'unk_p3': unk_p3,
-        'child_cnt': child_cnt
+    v = read_struct(stream, HEAD_B_26)
+    return {
+        'bound1': sphere_dict(v),
+        'unk_p1': point_dict(v, 4),
+        'unk_p2': point_dict(v, 7),
+        'unk_p3': point_dict(v, 10),
+        'child_cnt': v[13]
     }
 
 def read_b_27(stream):
-    bound1 = read_sphere(stream)
-    flag, = struct.unpack('<I', stream.read(4))
-    unk_p1 = read_point(stream)
-    material, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_27)
     return {
-        'bound1': bound1,
-        'flag': flag,
-        'unk_p1': unk_p1,
-        'material': material
+        'bound1': sphere_dict(v),
+        'flag': v[4],
+        'unk_p1': point_dict(v, 5),
+        'material': v[8]
     }
 
 def read_b_28(stream):
-    bound1 = read_sphere(stream)
-    sprite_center = read_point(stream)
-    poly_count, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_28)
+    poly_count = v[7]
     polygons = [read_polygon_28(stream) for _ in range(poly_count)]
     return {
-        'bound1': bound1,
-        'sprite_center': sprite_center,
+        'bound1': sphere_dict(v),
+        'sprite_center': point_dict(v, 4),
         'poly_count': poly_count,
         'polygons': polygons
     }
 
 def read_b_29(stream):
-    bound1 = read_sphere(stream)
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_i1, = struct.unpack('<I', stream.read(4))
-    unk_1 = read_sphere(stream)
-    unk_floats = list(struct.unpack(f'<{unk_count}f', stream.read(4 * unk_count)))
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'bound1': bound1,
-        'unk_i1': unk_i1,
-        'unk_1': unk_1,
+    v = read_struct(stream, HEAD_B_29)
+    unk_count = v[4]
+    unk_floats = read_floats(stream, unk_count)
+    child_cnt, = read_struct(stream, UINT)
+    return {
+        'bound1': sphere_dict(v),
+        'unk_i1': v[5],
+        'unk_1': sphere_dict(v, 6),
         'unk_count': unk_count,
         'unk_floats': unk_floats,
         'child_cnt': child_cnt
     }
 
 def read_b_30(stream):
-    bound1 = read_sphere(stream)
-    room_name = read_name32(stream)
-    point1 = read_point(stream)
-    point2 = read_point(stream)
+    v = read_struct(stream, HEAD_B_30)
     return {
-        'bound1': bound1,
-        'room_name': room_name,
-        'point1': point1,
-        'point2': point2
+        'bound1': sphere_dict(v),
+        'room_name': name_dict(v[4]),
+        'point1': point_dict(v, 5),
+        'point2': point_dict(v, 8)
     }
 
 def read_b_31(stream):
-    bound1 = read_sphere(stream)
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk1 = read_sphere(stream)
-    int2, = struct.unpack('<I', stream.read(4))
-    unk_p2 = read_point(stream)
+    v = read_struct(stream, HEAD_B_31)
+    unk_count = v[4]
     unk_floats = [read_unk_fi(stream) for _ in range(unk_count)]
     return {
-        'bound1': bound1,
+        'bound1': sphere_dict(v),
         'unk_count': unk_count,
-        'unk1': unk1,
-        'int2': int2,
-        'unk_p2': unk_p2,
+        'unk1': sphere_dict(v, 5),
+        'int2': v[9],
+        'unk_p2': point_dict(v, 10),
         'unk_floats': unk_floats
     }
 
 def read_b_33(stream):
-    bound1 = read_sphere(stream)
-    use_lights, light_type, flag = struct.unpack('<III', stream.read(12))
-    unk_p1 = read_point(stream)
-    unk_p2 = read_point(stream)
-    unk_f1, unk_f2, light_radius, intensity, unk_f3, unk_f4 = struct.unpack('<ffffff', stream.read(24))
-    rgb = read_color(stream)
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'bound1': bound1,
-        'use_lights': use_lights,
-        'light_type': light_type,
-        'flag': flag,
-        'unk_p1': unk_p1,
-        'unk_p2': unk_p2,
-        'unk_f1': unk_f1,
-        'unk_f2': unk_f2,
-        'light_radius': light_radius,
-        'intensity': intensity,
-        'unk_f3': unk_f3,
-        'unk_f4': unk_f4,
-        'rgb': rgb,
-        'child_cnt': child_cnt
+    v = read_struct(stream, HEAD_B_33)
+    return {
+        'bound1': sphere_dict(v),
+        'use_lights': v[4],
+        'light_type': v[5],
+        'flag': v[6],
+        'unk_p1': point_dict(v, 7),
+        'unk_p2': point_dict(v, 10),
+        'unk_f1': v[13],
+        'unk_f2': v[14],
+        'light_radius': v[15],
+        'intensity': v[16],
+        'unk_f3': v[17],
+        'unk_f4': v[18],
+        'rgb': color_dict(v, 19),
+        'child_cnt': v[22]
     }
 
 def read_b_34(stream):
-    bound1 = read_sphere(stream)
-    unk_i1, unk_count = struct.unpack('<II', stream.read(8))
+    v = read_struct(stream, HEAD_B_34)
+    unk_count = v[5]
     unk_floats = [read_unk_3fi(stream) for _ in range(unk_count)]
     return {
-        'bound1': bound1,
-        'unk_i1': unk_i1,
+        'bound1': sphere_dict(v),
+        'unk_i1': v[4],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
 def read_b_35(stream):
-    bound1 = read_sphere(stream)
-    mtype, = struct.unpack('<I', stream.read(4))
-    texnum_pos = stream.tell()
-    texnum, = struct.unpack('<I', stream.read(4))
-    poly_count, = struct.unpack('<I', stream.read(4))
+    v = read_struct(stream, HEAD_B_35)
+    texnum_pos = stream.tell() - 8
+    poly_count = v[6]
     polygons = [read_polygon_8(stream) for _ in range(poly_count)]
     return {
-        'bound1': bound1,
-        'mtype': mtype,
+        'bound1': sphere_dict(v),
+        'mtype': v[4],
         'texnum_pos': texnum_pos,
-        'texnum': texnum,
+        'texnum': v[5],
         'poly_count': poly_count,
         'polygons': polygons
     }
 
-def read_b_36(stream):
-    bound1 = read_sphere(stream)
-    name1 = read_name32(stream)
-    name2 = read_name32(stream)
-    format_raw, = struct.unpack('<I', stream.read(4))
+def read_b_36(stream, vertex_arrays=False):
+    v = read_struct(stream, HEAD_B_36)
+    format_raw = v[6]
     format_ = format_raw & 0xff
-    vert_count, = struct.unpack('<I', stream.read(4))
+    vert_count = v[7]
     uv_count = format_raw >> 8
     normal_switch = 0 if (format_ == 1 or format_ == 2) else 1
-    vertices = [read_complex_vert(stream, uv_count, normal_switch) for _ in range(vert_count)]
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    if vertex_arrays:
+        vertices = b3dnp.read_complex_verts(stream, vert_count, uv_count, normal_switch)
+    else:
+        vertices = [read_complex_vert(stream, uv_count, normal_switch) for _ in range(vert_count)]
+    child_cnt, = read_struct(stream, UINT)
     return {
-        'bound1': bound1,
-        'name1': name1,
-        'name2': name2,
+        'bound1': sphere_dict(v),
+        'name1': name_dict(v[4]),
+        'name2': name_dict(v[5]),
         'format_raw': format_raw,
         'vert_count': vert_count,
         'vertices': vertices,
         'child_cnt': child_cnt
     }
 
-def read_b_37(stream):
-    bound1 = read_sphere(stream)
-    group_name = read_name32(stream)
-    format_raw, = struct.unpack('<I', stream.read(4))
-    format_ = format_raw & 0xff 
-    vert_count, = struct.unpack('<I', stream.read(4))
+def read_b_37(stream, vertex_arrays=False):
+    v = read_struct(stream, HEAD_B_37)
+    format_raw = v[5]
+    format_ = format_raw & 0xff
+    vert_count = v[6]
     uv_count = format_raw >> 8
     normal_switch = 0 if (format_ == 1 or format_ == 2) else 1
-    vertices = [read_complex_vert(stream, uv_count, normal_switch) for _ in range(vert_count)]
-    child_cnt, = struct.unpack('<I', stream.read(4))
+    if vertex_arrays:
+        vertices = b3dnp.read_complex_verts(stream, vert_count, uv_count, normal_switch)
+    else:
+        vertices = [read_complex_vert(stream, uv_count, normal_switch) for _ in range(vert_count)]
+    child_cnt, = read_struct(stream, UINT)
     return {
-        'bound1': bound1,
-        'group_name': group_name,
+        'bound1': sphere_dict(v),
+        'group_name': name_dict(v[4]),
         'format_raw': format_raw,
         'vert_count': vert_count,
         'vertices': vertices,
@@ -694,125 +675,113 @@ def read_b_37(stream):
     }
 
 def read_b_39(stream):
-    bound1 = read_sphere(stream)
-    color_r, = struct.unpack('<I', stream.read(4))
-    unk_f1, unk_f2 = struct.unpack('<ff', stream.read(8))
-    fog_start, fog_end = struct.unpack('<ff', stream.read(8))
-    color_id, = struct.unpack('<I', stream.read(4))
-    child_cnt, = struct.unpack('<I', stream.read(4))
-    return {
-        'bound1': bound1,
-        'color_r': color_r,
-        'unk_f1': unk_f1,
-        'unk_f2': unk_f2,
-        'fog_start': fog_start,
-        'fog_end': fog_end,
-        'color_id': color_id,
-        'child_cnt': child_cnt
+    v = read_struct(stream, HEAD_B_39)
+    return {
+        'bound1': sphere_dict(v),
+        'color_r': v[4],
+        'unk_f1': v[5],
+        'unk_f2': v[6],
+        'fog_start': v[7],
+        'fog_end': v[8],
+        'color_id': v[9],
+        'child_cnt': v[10]
     }
 
 def read_b_40(stream):
-    bound1 = read_sphere(stream)
-    name1 = read_name32(stream)
-    name2 = read_name32(stream)
-    unk_i1, unk_i2 = struct.unpack('<II', stream.read(8))
-    unk_count, = struct.unpack('<I', stream.read(4))
-    unk_floats = [struct.unpack('<f', stream.read(4))[0] for _ in range(unk_count)]
-    return {
-        'bound1': bound1,
-        'name1': name1,
-        'name2': name2,
-        'unk_i1': unk_i1,
-        'unk_i2': unk_i2,
+    v = read_struct(stream, HEAD_B_40)
+    unk_count = v[8]
+    unk_floats = read_floats(stream, unk_count)
+    return {
+        'bound1': sphere_dict(v),
+        'name1': name_dict(v[4]),
+        'name2': name_dict(v[5]),
+        'unk_i1': v[6],
+        'unk_i2': v[7],
         'unk_count': unk_count,
         'unk_floats': unk_floats
     }
 
-def read_block(stream):
-    block_name = read_name32(stream)
-    block_type, = struct.unpack('<I', stream.read(4))
-    block_data = None
-    
-    # Switch based on block_type
-    if block_type == 0:
-        block_data = read_b_0(stream)
-    elif block_type == 1:
-        block_data = read_b_1(stream)
-    elif block_type == 2:
-        block_data = read_b_2(stream)
-    elif block_type == 3:
-        block_data = read_b_3(stream)
-    elif block_type == 4:
-        block_data = read_b_4(stream)
-    elif block_type == 5:
-        block_data = read_b_5(stream)
-    elif block_type == 6:
-        block_data = read_b_6(stream)
-    elif block_type == 7:
-        block_data = read_b_7(stream)
-    elif block_type == 8:
-        block_data = read_b_8(stream)
-    elif block_type == 9:
-        block_data = read_b_9(stream)
-    elif block_type == 10:
-        block_data = read_b_10(stream)
-    elif block_type == 11:
-        block_data = read_b_11(stream)
-    elif block_type == 12:
-        block_data = read_b_12(stream)
-    elif block_type == 13:
-        block_data = read_b_13(stream)
-    elif block_type == 14:
-        block_data = read_b_14(stream)
-    elif block_type == 15:
-        block_data = read_b_15(stream)
-    elif block_type == 16:
-        block_data = read_b_16(stream)
-    elif block_type == 17:
-        block_data = read_b_17(stream)
-    elif block_type == 18:
-        block_data = read_b_18(stream)
-    elif block_type == 19:
-        block_data = read_b_19(stream)
-    elif block_type == 20:
-        block_data = read_b_20(stream)
-    elif block_type == 21:
-        block_data = read_b_21(stream)
-    elif block_type == 22:
-        block_data = read_b_22(stream)
-    elif block_type == 23:
-        block_data = read_b_23(stream)
-    elif block_type == 24:
-        block_data = read_b_24(stream)
-    elif block_type == 25:
-        block_data = read_b_25(stream)
-    elif block_type == 26:
-        block_data = read_b_26(stream)
-    elif block_type == 27:
-        block_data = read_b_27(stream)
-    elif block_type == 28:
-        block_data = read_b_28(stream)
-    elif block_type == 29:
-        block_data = read_b_29(stream)
-    elif block_type == 30:
-        block_data = read_b_30(stream)
-    elif block_type == 31:
-        block_data = read_b_31(stream)
-    elif block_type == 33:
-        block_data = read_b_33(stream)
-    elif block_type == 34:
-        block_data = read_b_34(stream)
-    elif block_type == 35:
-        block_data = read_b_35(stream)
-    elif block_type == 36:
-        block_data = read_b_36(stream)
-    elif block_type == 37:
-        block_data = read_b_37(stream)
-    elif block_type == 39:
-        block_data = read_b_39(stream)
-    elif block_type == 40:
-        block_data = read_b_40(stream)
-    
+class BlockType:
+    """Registry entry for one block type.
+
+    read - full decoder, returns block_data dict
+    skip - moves the stream past the block body without decoding it
+    scan - what read_roots runs for this block type (skip unless the scan needs data from the block)
+    head - precompiled layout of the fixed-size part of the block body
+    read_arrays - full decoder that returns vertices as numpy structured array (see numpy_b3d)
+    """
+
+    def __init__(self, read, skip, head, scan=None, read_arrays=None):
+        self.read = read
+        self.skip = skip
+        self.head = head
+        self.scan = scan if scan is not None else skip
+        self.read_arrays = read_arrays if read_arrays is not None else read
+
+BLOCK_TYPES = {
+    0: BlockType(read_b_0, b3ds.skip_b_0, HEAD_B_0),
+    1: BlockType(read_b_1, b3ds.skip_b_1, HEAD_B_1),
+    2: BlockType(read_b_2, b3ds.skip_b_2, HEAD_B_2),
+    3: BlockType(read_b_3, b3ds.skip_b_3, HEAD_B_3),
+    4: BlockType(read_b_4, b3ds.skip_b_4, HEAD_B_4),
+    5: BlockType(read_b_5, b3ds.skip_b_5, HEAD_B_5),
+    6: BlockType(read_b_6, b3ds.skip_b_6, HEAD_B_6, read_arrays=partial(read_b_6, vertex_arrays=True)),
+    7: BlockType(read_b_7, b3ds.skip_b_7, HEAD_B_7, read_arrays=partial(read_b_7, vertex_arrays=True)),
+    8: BlockType(read_b_8, b3ds.skip_b_8, HEAD_B_8, scan=b3dp.scan_b_8),
+    9: BlockType(read_b_9, b3ds.skip_b_9, HEAD_B_9),
+    10: BlockType(read_b_10, b3ds.skip_b_10, HEAD_B_10),
+    11: BlockType(read_b_11, b3ds.skip_b_11, HEAD_B_11),
+    12: BlockType(read_b_12, b3ds.skip_b_12, HEAD_B_12),
+    13: BlockType(read_b_13, b3ds.skip_b_13, HEAD_B_13),
+    14: BlockType(read_b_14, b3ds.skip_b_14, HEAD_B_14),
+    15: BlockType(read_b_15, b3ds.skip_b_15, HEAD_B_15),
+    16: BlockType(read_b_16, b3ds.skip_b_16, HEAD_B_16),
+    17: BlockType(read_b_17, b3ds.skip_b_17, HEAD_B_17),
+    18: BlockType(read_b_18, b3ds.skip_b_18, HEAD_B_18, scan=read_b_18),
+    19: BlockType(read_b_19, b3ds.skip_b_19, HEAD_B_19),
+    20: BlockType(read_b_20, b3ds.skip_b_20, HEAD_B_20),
+    21: BlockType(read_b_21, b3ds.skip_b_21, HEAD_B_21),
+    22: BlockType(read_b_22, b3ds.skip_b_22, HEAD_B_22),
+    23: BlockType(read_b_23, b3ds.skip_b_23, HEAD_B_23),
+    24: BlockType(read_b_24, b3ds.skip_b_24, HEAD_B_24),
+    25: BlockType(read_b_25, b3ds.skip_b_25, HEAD_B_25),
+    26: BlockType(read_b_26, b3ds.skip_b_26, HEAD_B_26),
+    27: BlockType(read_b_27, b3ds.skip_b_27, HEAD_B_27),
+    28: BlockType(read_b_28, b3ds.skip_b_28, HEAD_B_28, scan=b3dp.scan_b_28),
+    29: BlockType(read_b_29, b3ds.skip_b_29, HEAD_B_29),
+    30: BlockType(read_b_30, b3ds.skip_b_30, HEAD_B_30),
+    31: BlockType(read_b_31, b3ds.skip_b_31, HEAD_B_31),
+    33: BlockType(read_b_33, b3ds.skip_b_33, HEAD_B_33),
+    34: BlockType(read_b_34, b3ds.skip_b_34, HEAD_B_34),
+    35: BlockType(read_b_35, b3ds.skip_b_35, HEAD_B_35, scan=b3dp.scan_b_35),
+    36: BlockType(read_b_36, b3ds.skip_b_36, HEAD_B_36, read_arrays=partial(read_b_36, vertex_arrays=True)),
+    37: BlockType(read_b_37, b3ds.skip_b_37, HEAD_B_37, read_arrays=partial(read_b_37, vertex_arrays=True)),
+    39: BlockType(read_b_39, b3ds.skip_b_39, HEAD_B_39),
+    40: BlockType(read_b_40, b3ds.skip_b_40, HEAD_B_40),
+}
+
+# block types which body starts with bound1 sphere
+BOUND_BLOCK_TYPES = frozenset(BLOCK_TYPES.keys()) - {0, 1, 19, 23, 24, 25}
+
+def get_block_type(block_type):
+    entry = BLOCK_TYPES.get(block_type)
+    if entry is None:
+        raise ValueError(f'Unknown block type: {block_type}')
+    return entry
+
+def read_block_header(stream):
+    raw_name, block_type = read_struct(stream, BLOCK_HEADER)
+    return name_dict(raw_name), block_type
+
+def read_block(stream, vertex_arrays=False):
+    """vertex_arrays - decode vertices of blocks 6, 7, 36, 37 into numpy structured arrays (requires numpy)"""
+    block_name, block_type = read_block_header(stream)
+    entry = get_block_type(block_type)
+    if vertex_arrays:
+        block_data = entry.read_arrays(stream)
+    else:
+        block_data = entry.read(stream)
+
     return {
         'block_name': block_name,
         'block_type': block_type,
@@ -820,77 +789,53 @@ def read_block(stream):
     }
 
 def read_file_header(stream):
-    magic = struct.unpack('<4B', stream.read(4))
-    len_file, ofc_materials, len_materials_section, ofc_nodes, len_nodes = struct.unpack('<5I', stream.read(20))
+    v = read_struct(stream, FILE_HEADER)
     return {
-        'magic': magic,
-        'len_file': len_file,
-        'ofc_materials': ofc_materials,
-        'len_materials_section': len_materials_section,
-        'ofc_nodes': ofc_nodes,
-        'len_nodes': len_nodes
+        'magic': v[0:4],
+        'len_file': v[4],
+        'ofc_materials': v[5],
+        'len_materials_section': v[6],
+        'ofc_nodes': v[7],
+        'len_nodes': v[8]
     }
 
 def read_materials_list(stream):
-    mat_count, = struct.unpack('<I', stream.read(4))
+    mat_count, = read_struct(stream, UINT)
     mat_names = [read_name32(stream) for _ in range(mat_count)]
     return {
         'mat_count': mat_count,
         'mat_names': mat_names
     }
 
-class ChunkType(enum.Enum):
-    END_CHUNK = 0
-    END_CHUNKS = 1
-    BEGIN_CHUNK = 2
-    GROUP_CHUNK = 3
+def iter_roots(stream, nodesOffset):
+    """Yields (name, root, references, bounds) of every root as soon as its END_CHUNK is read.
+
+    root - RootEntry with span and texnums, references - list of Reference,
+    bounds - box around bound spheres of its blocks (see spatial_b3d).
+    Consumer may stop at any root, the rest of the file is not read then.
+    """
 
-def openclose(_io):
-    oc = _io.read(4)
-    # print(oc)
-    if (oc == (b'\x4D\x01\x00\x00')): # Begin_Chunk(111)
-        return ChunkType.BEGIN_CHUNK
-    elif oc == (b'\x2B\x02\x00\x00'): # End_Chunk(555)
-        return ChunkType.END_CHUNK
-    elif oc == (b'\xbc\x01\x00\x00'): # Group_Chunk(444)
-        return ChunkType.GROUP_CHUNK
-    elif oc == (b'\xde\x00\x00\x00'): # End_Chunks(222)
-        return ChunkType.END_CHUNKS
-    else:
-        # log.debug(file.tell())
-        raise Exception()
-    
-def read_roots(stream, nodesOffset):
-    
     ex = 0
     level = 0
-    
-    roots = {}
-    references = {}
 
-    objName = ''
     rootObjName = ''
     start_pos = nodesOffset
     end_pos = 0
 
-
-    def fill_texnum(obj_name, block_data):
-        texnum = block_data['texnum']
-        texpos = block_data['texnum_pos']
-        roots[obj_name]["texnums"].append({
-            "val": texnum,
-            "pos": texpos - start_pos
-        })
+    rootEntry = None
+    rootReferences = None
+    rootBounds = None
 
     while ex != ChunkType.END_CHUNKS:
 
-        ex = openclose(stream)
+        ex = read_chunk_type(stream)
         if ex == ChunkType.END_CHUNK:
             level -= 1
             if level == 0:
                 end_pos = stream.tell()
-                roots[rootObjName]["start"] = start_pos
-                roots[rootObjName]["size"] = end_pos - start_pos
+                rootEntry.start = start_pos
+                rootEntry.size = end_pos - start_pos
+                yield rootObjName, rootEntry, rootReferences, rootBounds
 
         elif ex == ChunkType.END_CHUNKS:
             break
@@ -900,123 +845,100 @@ def read_roots(stream, nodesOffset):
 
             if level == 0:
                 start_pos = stream.tell()-4
-            
-            
-            block_name = read_name32(stream)
-            block_type, = struct.unpack('<I', stream.read(4))
-            block_data = None
 
-            if level == 0:
-                rootObjName = block_name['name']
-                roots[rootObjName] = {
-                    "start": None,
-                    "size": None,
-                    "texnums": []
-                }
-            
-            # Switch based on block_type
-            if block_type == 0:
-                block_data = b3ds.skip_b_0(stream)
-            elif block_type == 1:
-                block_data = b3ds.skip_b_1(stream)
-            elif block_type == 2:
-                block_data = b3ds.skip_b_2(stream)
-            elif block_type == 3:
-                block_data = b3ds.skip_b_3(stream)
-            elif block_type == 4:
-                block_data = b3ds.skip_b_4(stream)
-            elif block_type == 5:
-                block_data = b3ds.skip_b_5(stream)
-            elif block_type == 6:
-                block_data = b3ds.skip_b_6(stream)
-            elif block_type == 7:
-                block_data = b3ds.skip_b_7(stream)
-            elif block_type == 8:
-                block_data = read_b_8(stream)
-            elif block_type == 9:
-                block_data = b3ds.skip_b_9(stream)
-            elif block_type == 10:
-                block_data = b3ds.skip_b_10(stream)
-            elif block_type == 11:
-                block_data = b3ds.skip_b_11(stream)
-            elif block_type == 12:
-                block_data = b3ds.skip_b_12(stream)
-            elif block_type == 13:
-                block_data = b3ds.skip_b_13(stream)
-            elif block_type == 14:
-                block_data = b3ds.skip_b_14(stream)
-            elif block_type == 15:
-                block_data = b3ds.skip_b_15(stream)
-            elif block_type == 16:
-                block_data = b3ds.skip_b_16(stream)
-            elif block_type == 17:
-                block_data = b3ds.skip_b_17(stream)
-            elif block_type == 18:
-                block_data = read_b_18(stream)
-            elif block_type == 19:
-                block_data = b3ds.skip_b_19(stream)
-            elif block_type == 20:
-                block_data = b3ds.skip_b_20(stream)
-            elif block_type == 21:
-                block_data = b3ds.skip_b_21(stream)
-            elif block_type == 22:
-                block_data = b3ds.skip_b_22(stream)
-            elif block_type == 23:
-                block_data = b3ds.skip_b_23(stream)
-            elif block_type == 24:
-                block_data = b3ds.skip_b_24(stream)
-            elif block_type == 25:
-                block_data = b3ds.skip_b_25(stream)
-            elif block_type == 26:
-                block_data = b3ds.skip_b_26(stream)
-            elif block_type == 27:
-                block_data = b3ds.skip_b_27(stream)
-            elif block_type == 28:
-                block_data = read_b_28(stream)
-            elif block_type == 29:
-                block_data = b3ds.skip_b_29(stream)
-            elif block_type == 30:
-                block_data = b3ds.skip_b_30(stream)
-            elif block_type == 31:
-                block_data = b3ds.skip_b_31(stream)
-            elif block_type == 33:
-                block_data = b3ds.skip_b_33(stream)
-            elif block_type == 34:
-                block_data = b3ds.skip_b_34(stream)
-            elif block_type == 35:
-                block_data = read_b_35(stream)
-            elif block_type == 36:
-                block_data = b3ds.skip_b_36(stream)
-            elif block_type == 37:
-                block_data = b3ds.skip_b_37(stream)
-            elif block_type == 39:
-                block_data = b3ds.skip_b_39(stream)
-            elif block_type == 40:
-                block_data = b3ds.skip_b_40(stream)
-
-            curObjName = block_name['name']
+
+            block_name, block_type = read_block_header(stream)
 
             if level == 0:
-                objName = curObjName
-                references[objName] = []
-            
+                rootObjName = intern(block_name['name'])
+                rootEntry = RootEntry()
+                rootReferences = []
+                rootBounds = b3dsp.new_box()
+
+            # root bounds cover bound spheres of all blocks of the root
+            if block_type in BOUND_BLOCK_TYPES:
+                pos = stream.tell()
+                b3dsp.add_sphere(rootBounds, *read_struct(stream, SPHERE))
+                stream.seek(pos, 0)
+
+            block_data = get_block_type(block_type).scan(stream)
+
             # fill reference list
             if block_type == 18:
-                references[objName].append({
-                    "space_name" : block_data['space_name']['name'],
-                    "add_name" : block_data['add_name']['name'],
-                })
+                rootReferences.append(Reference(
+                    block_data['space_name']['name'],
+                    block_data['add_name']['name']
+                ))
 
-            # fill texnum list
+            # fill texnum columns, positions relative to root start
             if block_type in [8,28,35]:
                 if(block_type == 35):
-                    fill_texnum(rootObjName, block_data)
-                for poly in block_data['polygons']:
-                    fill_texnum(rootObjName, poly)
+                    rootEntry.texnums.append(block_data['texnum'])
+                    rootEntry.texnum_pos.append(block_data['texnum_pos'] - start_pos)
+                polygons = block_data['polygons']
+                rootEntry.texnums.extend(polygons['texnum'])
+                rootEntry.texnum_pos.extend(pos - start_pos for pos in polygons['texnum_pos'])
 
             level += 1
 
+def read_roots(stream, nodesOffset):
+
+    roots = {}
+    references = {}
+    bounds = {}
+
+    for rootName, root, rootReferences, rootBounds in iter_roots(stream, nodesOffset):
+        roots[rootName] = root
+        references[rootName] = rootReferences
+        bounds[rootName] = rootBounds
+
     return {
         "roots": roots,
-        "references": references
+        "references": references,
+        "bounds": bounds
     }
+
+def skip_roots(stream, nodesOffset):
+    """Root names and spans only: every block body is skipped, names are decoded for roots only.
+
+    Returns list of (name, start, size) in file order, duplicate root names are kept.
+    """
+
+    ex = 0
+    level = 0
+
+    spans = []
+
+    rootName = ''
+    start_pos = nodesOffset
+
+    read = stream.read
+    tell = stream.tell
+    header_size = BLOCK_HEADER.size
+    unpack_header = BLOCK_HEADER.unpack
+
+    while ex != ChunkType.END_CHUNKS:
+
+        ex = read_chunk_type(stream)
+        if ex == ChunkType.END_CHUNK:
+            level -= 1
+            if level == 0:
+                end_pos = tell()
+                spans.append((rootName, start_pos, end_pos - start_pos))
+
+        elif ex == ChunkType.END_CHUNKS:
+            break
+        elif ex == ChunkType.GROUP_CHUNK: #skip
+            continue
+        elif ex == ChunkType.BEGIN_CHUNK:
+
+            raw_name, block_type = unpack_header(read(header_size))
+            if level == 0:
+                start_pos = tell() - header_size - 4
+                rootName = decode_name(raw_name)
+
+            get_block_type(block_type).skip(stream)
+
+            level += 1
+
+    return spans
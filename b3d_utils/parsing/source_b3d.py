@@ -0,0 +1,136 @@
+import os
+import mmap
+import logging
+from io import BytesIO
+
+import parsing.read_b3d as b3dr
+from parsing.layout_b3d import FILE_HEADER, UINT
+
+log = logging.getLogger("source_b3d")
+
+B3D_MAGIC = b'b3d\x00'
+BEGIN_CHUNKS = b'\x4D\x01\x00\x00'
+END_CHUNKS = b'\xde\x00\x00\x00'
+MATERIAL_NAME_SIZE = 32
+
+class B3DSource:
+    """Read-only view of a b3d file backed by mmap.
+
+    stream - seekable stream over the whole file for the parsers
+    slice(start, size) - zero-copy memoryview of file bytes
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size > 0:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.stream = self.buffer
+        else:
+            # mmap can't map empty files
+            self.buffer = b''
+            self.stream = BytesIO(self.buffer)
+
+    def slice(self, start, size):
+        if start < 0 or start + size > self.size:
+            raise ValueError(f'Range {start}:{start+size} is out of file bounds ({self.size} bytes)')
+        return memoryview(self.buffer)[start:start+size]
+
+    def close(self):
+        try:
+            if isinstance(self.buffer, mmap.mmap):
+                self.buffer.close()
+        except BufferError:
+            # root slices are still referenced, mapping is released together with them
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+class B3DFile(B3DSource):
+    """B3DSource which sections are found by header offsets instead of reading the file in order.
+
+    Offsets and lengths of header are in 4-byte words. They are checked against
+    file size on open, so truncated or corrupted file fails before any scan.
+
+    header - dict of read_b3d.read_file_header, offsets converted to bytes
+    materials_offset, materials_size - material table (u32 count + 32-byte names)
+    nodes_offset - position of first block (right after BEGIN_CHUNKS marker)
+    nodes_end - position of END_CHUNKS marker
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        try:
+            self.header = self.check_header()
+        except ValueError:
+            self.close()
+            raise
+        self.materials_offset = self.header["ofc_materials"]
+        self.materials_size = self.header["len_materials_section"]
+        self.nodes_offset = self.header["ofc_nodes"] + len(BEGIN_CHUNKS)
+        self.nodes_end = self.header["ofc_nodes"] + self.header["len_nodes"] - len(END_CHUNKS)
+
+    def error(self, text):
+        return ValueError('{}: {}'.format(self.filename, text))
+
+    def check_header(self):
+        if self.size < FILE_HEADER.size:
+            raise self.error('file is too short for b3d header ({} bytes)'.format(self.size))
+        self.stream.seek(0)
+        raw = b3dr.read_file_header(self.stream)
+        if bytes(raw["magic"]) != B3D_MAGIC:
+            raise self.error('not a b3d file (magic {})'.format(bytes(raw["magic"])))
+
+        header = {key: value * 4 if key != "magic" else value for key, value in raw.items()}
+        if header["len_file"] > self.size:
+            raise self.error('file is truncated: header says {} bytes, file has {}'.format(header["len_file"], self.size))
+        if header["len_file"] < self.size:
+            log.warning('{}: {} bytes after end of b3d data'.format(self.filename, self.size - header["len_file"]))
+
+        materials_end = header["ofc_materials"] + header["len_materials_section"]
+        nodes_end = header["ofc_nodes"] + header["len_nodes"]
+        if header["ofc_materials"] < FILE_HEADER.size or header["len_materials_section"] < UINT.size or materials_end > header["ofc_nodes"]:
+            raise self.error('material section {}:{} is out of place'.format(header["ofc_materials"], materials_end))
+        if header["len_nodes"] < len(BEGIN_CHUNKS) + len(END_CHUNKS) or nodes_end > header["len_file"]:
+            raise self.error('node section {}:{} is out of file bounds ({} bytes)'.format(header["ofc_nodes"], nodes_end, header["len_file"]))
+
+        mat_count, = UINT.unpack(self.slice(header["ofc_materials"], UINT.size))
+        if UINT.size + mat_count * MATERIAL_NAME_SIZE != header["len_materials_section"]:
+            raise self.error('material section of {} bytes does not fit {} materials'.format(header["len_materials_section"], mat_count))
+        if self.slice(header["ofc_nodes"], len(BEGIN_CHUNKS)) != BEGIN_CHUNKS:
+            raise self.error('no BEGIN_CHUNKS marker at node section offset {}'.format(header["ofc_nodes"]))
+        if self.slice(nodes_end - len(END_CHUNKS), len(END_CHUNKS)) != END_CHUNKS:
+            raise self.error('no END_CHUNKS marker at end of node section ({})'.format(nodes_end - len(END_CHUNKS)))
+        return header
+
+    def read_materials(self):
+        """Names of materials, read straight from material table."""
+        self.stream.seek(self.materials_offset)
+        return [mat["name"] for mat in b3dr.read_materials_list(self.stream)["mat_names"]]
+
+    def seek_nodes(self):
+        """Moves stream to first block, returns its position (nodesOffset of read_roots and others)."""
+        self.stream.seek(self.nodes_offset)
+        return self.nodes_offset
+
+    def check_root(self, root):
+        """Checks that root span (RootEntry, e.g. from .b3didx) lies in node section."""
+        if root.start < self.nodes_offset or root.start + root.size > self.nodes_end:
+            raise self.error('root {}:{} is out of node section {}:{}'.format(root.start, root.start + root.size, self.nodes_offset, self.nodes_end))
+
+    def seek_root(self, root):
+        """Moves stream to BEGIN_CHUNK of root, returns its position."""
+        self.check_root(root)
+        self.stream.seek(root.start)
+        return root.start
+
+    def root_slice(self, root):
+        """Zero-copy memoryview of root bytes."""
+        self.check_root(root)
+        return self.slice(root.start, root.size)
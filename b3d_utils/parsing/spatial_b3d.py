@@ -0,0 +1,132 @@
+import math
+from array import array
+
+# Spatial index of roots
+#
+# Every root gets an axis-aligned box around bound spheres (bound1) of all its
+# blocks. Boxes are put into uniform grid, so a region lookup only tests roots
+# registered in cells the region overlaps. Roots that span too many cells
+# (terrain, sky) are kept in separate list and tested on every lookup.
+
+MAX_CELLS_PER_ROOT = 64
+GRID_CELLS_PER_ROOT = 4
+
+NO_BOX = (math.inf, math.inf, math.inf, -math.inf, -math.inf, -math.inf)
+
+def add_sphere(box, x, y, z, r):
+    """Extends box (list of min xyz, max xyz) with sphere. Unset (all zero) and invalid spheres are ignored."""
+    if (x == 0.0 and y == 0.0 and z == 0.0 and r == 0.0) or not (r >= 0.0):
+        return
+    if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z) and math.isfinite(r)):
+        return
+    if x - r < box[0]: box[0] = x - r
+    if y - r < box[1]: box[1] = y - r
+    if z - r < box[2]: box[2] = z - r
+    if x + r > box[3]: box[3] = x + r
+    if y + r > box[4]: box[4] = y + r
+    if z + r > box[5]: box[5] = z + r
+
+def new_box():
+    return list(NO_BOX)
+
+def is_empty_box(box):
+    return box[0] > box[3]
+
+def sphere_intersects_box(x, y, z, r, box):
+    dist = 0.0
+    for c, lo, hi in ((x, box[0], box[3]), (y, box[1], box[4]), (z, box[2], box[5])):
+        if c < lo:
+            dist += (lo - c) ** 2
+        elif c > hi:
+            dist += (c - hi) ** 2
+    return dist <= r * r
+
+class SpatialGrid:
+
+    def __init__(self, names, boxes, origin, cell_size, dims, cell_starts, cell_items, large):
+        self.names = names
+        self.boxes = boxes
+        self.origin = origin
+        self.cell_size = cell_size
+        self.dims = dims
+        # cells in CSR form: roots of cell i are cell_items[cell_starts[i]:cell_starts[i+1]]
+        self.cell_starts = cell_starts
+        self.cell_items = cell_items
+        self.large = large
+
+    @classmethod
+    def build(cls, bounds):
+        """bounds - {root_name: box}, box is [min x, min y, min z, max x, max y, max z]."""
+        names = list(bounds.keys())
+        boxes = [tuple(bounds[name]) for name in names]
+        placed = [i for i, box in enumerate(boxes) if not is_empty_box(box)]
+
+        if len(placed) == 0:
+            return cls(names, boxes, (0.0, 0.0, 0.0), 1.0, (1, 1, 1), array('I', [0, 0]), array('I'), array('I'))
+
+        lo = [min(boxes[i][a] for i in placed) for a in range(3)]
+        hi = [max(boxes[i][a+3] for i in placed) for a in range(3)]
+        extent = [max(hi[a] - lo[a], 1e-6) for a in range(3)]
+
+        # about one root per cell: cell volume is total volume divided by root count.
+        # Flat maps give tiny volume, so cell is grown until grid has at most GRID_CELLS_PER_ROOT cells per root
+        max_cells = max(64, GRID_CELLS_PER_ROOT * len(placed))
+        cell_size = (extent[0] * extent[1] * extent[2] / len(placed)) ** (1/3)
+        while True:
+            dims = tuple(max(1, int(math.ceil(extent[a] / cell_size))) for a in range(3))
+            if dims[0] * dims[1] * dims[2] <= max_cells:
+                break
+            cell_size *= 1.25
+        origin = tuple(lo)
+
+        grid = cls(names, boxes, origin, cell_size, dims, None, None, array('I'))
+
+        cells = {}
+        for i in placed:
+            ranges = grid.cell_ranges(boxes[i])
+            count = 1
+            for r in ranges:
+                count *= len(r)
+            if count > MAX_CELLS_PER_ROOT:
+                grid.large.append(i)
+                continue
+            for cx in ranges[0]:
+                for cy in ranges[1]:
+                    for cz in ranges[2]:
+                        cells.setdefault(grid.cell_id(cx, cy, cz), []).append(i)
+
+        cell_count = dims[0] * dims[1] * dims[2]
+        cell_starts = array('I', [0]) * (cell_count + 1)
+        cell_items = array('I')
+        for cell in range(cell_count):
+            cell_items.extend(cells.get(cell, ()))
+            cell_starts[cell + 1] = len(cell_items)
+
+        grid.cell_starts = cell_starts
+        grid.cell_items = cell_items
+        return grid
+
+    def cell_id(self, cx, cy, cz):
+        return (cx * self.dims[1] + cy) * self.dims[2] + cz
+
+    def cell_ranges(self, box):
+        ranges = []
+        for a in range(3):
+            first = int(math.floor((box[a] - self.origin[a]) / self.cell_size))
+            last = int(math.floor((box[a+3] - self.origin[a]) / self.cell_size))
+            ranges.append(range(max(first, 0), min(last, self.dims[a] - 1) + 1))
+        return ranges
+
+    def query(self, x, y, z, r):
+        """Returns names of roots whose box intersects sphere, in root order."""
+        candidates = set(self.large)
+        ranges = self.cell_ranges((x - r, y - r, z - r, x + r, y + r, z + r))
+        for cx in ranges[0]:
+            for cy in ranges[1]:
+                for cz in ranges[2]:
+                    cell = self.cell_id(cx, cy, cz)
+                    candidates.update(self.cell_items[self.cell_starts[cell]:self.cell_starts[cell+1]])
+        return [
+            self.names[i] for i in sorted(candidates)
+            if sphere_intersects_box(x, y, z, r, self.boxes[i])
+        ]
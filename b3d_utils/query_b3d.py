@@ -0,0 +1,31 @@
+import logging
+import sys
+
+import parsing.read_b3d as b3dr
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+log = logging.getLogger("query_b3d")
+log.setLevel(logging.DEBUG)
+
+def read_region_roots(b3dFilename, b3dFile, region, useIndex=True):
+    """Returns names of roots which bounds intersect region (x, y, z, r), in file order."""
+    data_blocks_offset = b3dFile.seek_nodes()
+
+    grid = b3di.read_spatial_indexed(b3dFilename, b3dFile.stream, data_blocks_offset, useIndex)
+    return grid.query(*region)
+
+def b3dquery(b3dFilename, region, outFilename, useIndex=True):
+
+    source = B3DFile(b3dFilename)
+    roots = read_region_roots(b3dFilename, source, region, useIndex)
+    source.close()
+
+    output = ',\n'.join(sorted(roots))
+
+    if outFilename is not None:
+        with open(outFilename, 'wb') as outFile:
+            outFile.write(output.encode('utf-8'))
+    else:
+        print(output)
@@ -6,45 +6,75 @@ import struct
 from io import BytesIO
 
 import parsing.read_b3d as b3dr
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
 import common as c
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 log = logging.getLogger("remove_b3d")
 log.setLevel(logging.DEBUG)
 
-def b3dremove(b3dFilepath, outFilepath, remMaterials, remNodes):
-    b3d_read_stream = None
-    with open(b3dFilepath, 'rb') as file:
-        b3d_read_stream = BytesIO(file.read())
+def remove_materials(materials_list, kept_roots, remMaterials):
+    """Drops matching materials that no kept root uses, texnums of kept roots are shifted to new indexes.
+    Returns new material list and texnum mappings for write_output_b3d."""
+    usage = c.MaterialUsage.build(materials_list, kept_roots)
+    unused = set(usage.unused())
+
+    removed = set()
+    for idx, mat_name in enumerate(materials_list):
+        if any(fnmatch.fnmatch(mat_name, pattern) for pattern in remMaterials):
+            if idx in unused:
+                removed.add(idx)
+            else:
+                log.warning('Material {} is used by {} and is kept'.format(mat_name, ', '.join(sorted(usage.roots(idx)))))
+
+    mat_index_mapping = {}
+    for idx in range(len(materials_list)):
+        if idx not in removed:
+            mat_index_mapping[idx] = len(mat_index_mapping)
+    # texnums out of material list are left as they are
+    for texnums in usage.invalid().values():
+        mat_index_mapping.update({texnum: texnum for texnum in texnums})
+
+    log.info('Removed {} materials'.format(len(removed)))
+    new_materials_list = [mat_name for idx, mat_name in enumerate(materials_list) if idx not in removed]
+    texnum_mappings = {root_name: (mat_index_mapping, 0) for root_name in kept_roots}
+    return new_materials_list, texnum_mappings
+
+def b3dremove(b3dFilepath, outFilepath, remMaterials, remNodes, useIndex=True):
+    source = B3DFile(b3dFilepath)
+    b3d_read_stream = source.stream
 
         
     if not outFilepath:
         outFilepath = b3dFilepath
 
-    b3dr.read_file_header(b3d_read_stream)
-    materials_list = [mat["name"] for mat in b3dr.read_materials_list(b3d_read_stream)["mat_names"]]
-    b3d_read_stream.read(4) # BEGIN_BLOCKS
-    data_blocks_off = b3d_read_stream.tell()
+    materials_list = source.read_materials()
+    data_blocks_off = source.seek_nodes()
     
-    parsed_b3d = b3dr.read_roots(b3d_read_stream, data_blocks_off)
+    parsed_b3d = b3di.read_roots_indexed(b3dFilepath, b3d_read_stream, data_blocks_off, useIndex)
 
     # Read root data
     
     all_roots = parsed_b3d['roots']
-    for root_name, root in all_roots.items():
-        b3d_read_stream.seek(root["start"],0)
-        all_roots[root_name]["data"] = BytesIO(b3d_read_stream.read(root["size"]))
+    c.read_root_data(source, all_roots)
 
-    matching_names = [f 
+    matching_names = set(f 
         for f in all_roots.keys() #all imported names
         if any(fnmatch.fnmatch(f, pattern) 
-            for pattern in remNodes) #user defined wildcards or just names
-    ]
+            for pattern in remNodes or []) #user defined wildcards or just names
+    )
+
+    kept_roots = {key:value for key, value in all_roots.items() if key not in matching_names}
+    all_roots_order = sorted(kept_roots.keys())
+
+    texnum_mappings = None
+    if remMaterials:
+        materials_list, texnum_mappings = remove_materials(materials_list, kept_roots, remMaterials)
 
-    all_roots = {key:value for key, value in all_roots.items() if key not in matching_names}
-    all_roots_order = sorted(all_roots.keys())
+    tmpFilename = c.write_output_b3d(outFilepath, kept_roots, all_roots_order, materials_list, texnum_mappings)
 
-    outBuffer = c.write_output_b3d(all_roots, all_roots_order, materials_list)
+    c.release_root_data(all_roots)
+    source.close()
 
-    with open(outFilepath, 'wb') as outFile:
-        outFile.write(outBuffer.getvalue())
\ No newline at end of file
+    c.replace_output(tmpFilename, outFilepath)
\ No newline at end of file
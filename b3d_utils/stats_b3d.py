@@ -0,0 +1,160 @@
+import logging
+import sys
+import json
+import time
+
+import parsing.read_b3d as b3dr
+from parsing.read_b3d import ChunkType
+from parsing.source_b3d import B3DFile
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+log = logging.getLogger("stats_b3d")
+log.setLevel(logging.DEBUG)
+
+# index of vert_count in head of vertex blocks
+VERT_COUNT_FIELDS = {6: 6, 7: 5, 36: 7, 37: 6}
+POLYGON_BLOCKS = [8, 28, 35]
+
+def new_counters():
+    return {
+        "count": 0,
+        "bytes": 0,
+        "verts": 0,
+        "polys": 0,
+        "time": 0.0
+    }
+
+def read_stats(stream, nodesOffset):
+    """Same scan as read_b3d.read_roots, collects counters per block type and per root.
+
+    bytes of block are its header and body without children, time is time spent scanning the body.
+    """
+    block_types = {}
+    roots = {}
+
+    ex = 0
+    level = 0
+    rootObjName = ''
+    root = None
+    start_pos = nodesOffset
+    clock = time.perf_counter
+
+    while ex != ChunkType.END_CHUNKS:
+
+        ex = b3dr.read_chunk_type(stream)
+        if ex == ChunkType.END_CHUNK:
+            level -= 1
+            if level == 0:
+                root["size"] = stream.tell() - start_pos
+
+        elif ex == ChunkType.END_CHUNKS:
+            break
+        elif ex == ChunkType.GROUP_CHUNK: #skip
+            continue
+        elif ex == ChunkType.BEGIN_CHUNK:
+
+            block_start = stream.tell()
+            if level == 0:
+                start_pos = block_start - 4
+
+            block_name, block_type = b3dr.read_block_header(stream)
+
+            if level == 0:
+                rootObjName = block_name['name']
+                root = new_counters()
+                root["size"] = 0
+                roots[rootObjName] = root
+
+            entry = b3dr.get_block_type(block_type)
+            verts = 0
+            polys = 0
+            if block_type in VERT_COUNT_FIELDS:
+                pos = stream.tell()
+                verts = entry.head.unpack(stream.read(entry.head.size))[VERT_COUNT_FIELDS[block_type]]
+                stream.seek(pos, 0)
+
+            t = clock()
+            block_data = entry.scan(stream)
+            t = clock() - t
+
+            if block_type in POLYGON_BLOCKS:
+                polys = block_data['poly_count']
+                verts = sum(block_data['polygons']['vert_count'])
+
+            stats = block_types.get(block_type)
+            if stats is None:
+                stats = new_counters()
+                block_types[block_type] = stats
+            for counters in (stats, root):
+                counters["count"] += 1
+                counters["bytes"] += stream.tell() - block_start
+                counters["verts"] += verts
+                counters["polys"] += polys
+                counters["time"] += t
+
+            level += 1
+
+    return {
+        "block_types": block_types,
+        "roots": roots
+    }
+
+def format_table(header, rows):
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        lines.append('  '.join(str(val).rjust(widths[i]) for i, val in enumerate(row)))
+    return '\n'.join(lines)
+
+def b3dstats(b3dFilename, outFormat, outFilename, topRoots=20):
+
+    source = B3DFile(b3dFilename)
+    b3d_stream = source.stream
+    b3d_stream.seek(source.materials_offset)
+    materials_list = b3dr.read_materials_list(b3d_stream)["mat_names"]
+    data_blocks_offset = source.seek_nodes()
+
+    t = time.perf_counter()
+    stats = read_stats(b3d_stream, data_blocks_offset)
+    scan_time = time.perf_counter() - t
+    file_size = source.size
+    source.close()
+
+    block_types = stats["block_types"]
+    heaviest = sorted(stats["roots"].items(), key=lambda item: item[1]["size"], reverse=True)[:topRoots]
+
+    if outFormat == 'JSON':
+        output = json.dumps({
+            "file_size": file_size,
+            "materials": len(materials_list),
+            "roots": len(stats["roots"]),
+            "scan_time": scan_time,
+            "block_types": {str(block_type): block_types[block_type] for block_type in sorted(block_types)},
+            "heaviest_roots": [dict(counters, name=root_name) for root_name, counters in heaviest]
+        }, indent=2)
+    else:
+        total_bytes = sum(counters["bytes"] for counters in block_types.values()) or 1
+        rows = [
+            [
+                block_type, counters["count"], counters["bytes"],
+                '{:.1f}'.format(100 * counters["bytes"] / total_bytes),
+                counters["verts"], counters["polys"], '{:.2f}'.format(1000 * counters["time"])
+            ]
+            for block_type, counters in sorted(block_types.items(), key=lambda item: item[1]["bytes"], reverse=True)
+        ]
+        root_rows = [
+            [root_name, counters["size"], counters["count"], counters["verts"], counters["polys"], '{:.2f}'.format(1000 * counters["time"])]
+            for root_name, counters in heaviest
+        ]
+        output = '\n\n'.join([
+            'file size: {} bytes, materials: {}, roots: {}, scan time: {:.2f} ms'.format(
+                file_size, len(materials_list), len(stats["roots"]), 1000 * scan_time),
+            format_table(['type', 'count', 'bytes', 'bytes %', 'verts', 'polys', 'time ms'], rows),
+            'heaviest roots:\n' + format_table(['root', 'size', 'blocks', 'verts', 'polys', 'time ms'], root_rows)
+        ])
+
+    if outFilename is not None:
+        with open(outFilename, 'wb') as outFile:
+            outFile.write(output.encode('utf-8'))
+    else:
+        print(output)
@@ -0,0 +1,52 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+# commands import modules relative to b3d_utils folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench.corpus as corpus
+import parsing.read_b3d as b3dr
+from parsing.source_b3d import B3DFile
+
+CORPUS_CONFIG = {
+    "seed": 7,
+    "roots": 40,
+    "ref_density": 1.0,
+}
+
+@pytest.fixture(scope='session')
+def corpus_dir(tmp_path_factory):
+    outpath = str(tmp_path_factory.mktemp('corpus'))
+    corpus.generate_corpus(outpath, 'corpus', corpus.make_config(**CORPUS_CONFIG))
+    return outpath
+
+def root_spans(b3dFilename):
+    with B3DFile(b3dFilename) as source:
+        return b3dr.skip_roots(source.stream, source.seek_nodes())
+
+def rename_root(srcFilename, dstFilename, oldName, newName):
+    """Copies b3d with every root oldName renamed to newName (names are 32 bytes, sizes don't change)."""
+    data = bytearray(open(srcFilename, 'rb').read())
+    for name, start, size in root_spans(srcFilename):
+        if name == oldName:
+            # BEGIN_CHUNK, then name32 of root block
+            data[start+4:start+36] = newName.encode('cp1251').ljust(32, b'\0')
+    with open(dstFilename, 'wb') as file:
+        file.write(data)
+
+@pytest.fixture
+def b3d_file(corpus_dir, tmp_path):
+    """Own copy of corpus b3d, so .b3didx of one test doesn't leak into another."""
+    filename = str(tmp_path / 'map.b3d')
+    shutil.copyfile(os.path.join(corpus_dir, 'corpus.b3d'), filename)
+    return filename
+
+@pytest.fixture
+def dup_b3d_file(corpus_dir, tmp_path):
+    """Corpus copy where root000002 is renamed to root000001, so two roots share a name."""
+    filename = str(tmp_path / 'dup.b3d')
+    rename_root(os.path.join(corpus_dir, 'corpus.b3d'), filename, 'root000002', 'root000001')
+    return filename
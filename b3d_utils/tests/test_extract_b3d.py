@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import extract_b3d
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
+from conftest import root_spans
+
+def extract_split(b3dFilename, outpath, useIndex, jobs=1):
+    os.makedirs(outpath)
+    extract_b3d.b3dextract(b3dFilename, None, outpath, None, True, True, False, [], {}, useIndex=useIndex, jobs=jobs)
+    return read_folder(outpath)
+
+def extract_nodes(b3dFilename, outFilename, nodes, useIndex, lastMatch=False):
+    extract_b3d.b3dextract(b3dFilename, None, outFilename, nodes, False, False, False, [], {}, useIndex=useIndex, lastMatch=lastMatch)
+    with open(outFilename, 'rb') as file:
+        return file.read()
+
+def read_folder(path):
+    result = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as file:
+            result[name] = file.read()
+    return result
+
+def test_split_same_with_and_without_index(b3d_file, tmp_path):
+    without_index = extract_split(b3d_file, str(tmp_path / 'no_index'), False)
+    assert not os.path.exists(b3di.get_index_path(b3d_file))
+    assert len(without_index) > 1
+
+    # first run writes the index, second one reads it
+    writing_index = extract_split(b3d_file, str(tmp_path / 'writing_index'), True)
+    assert os.path.exists(b3di.get_index_path(b3d_file))
+    reading_index = extract_split(b3d_file, str(tmp_path / 'reading_index'), True)
+
+    assert writing_index == without_index
+    assert reading_index == without_index
+
+def test_split_parallel_is_same_as_serial(b3d_file, tmp_path):
+    serial = extract_split(b3d_file, str(tmp_path / 'serial'), False)
+    parallel = extract_split(b3d_file, str(tmp_path / 'parallel'), False, jobs=2)
+    assert parallel == serial
+
+def extracted_sizes(b3dFilename, name):
+    return [size for rootName, start, size in root_spans(b3dFilename) if rootName == name]
+
+@pytest.mark.parametrize('nodes', [['root000001'], ['root000001', 'root000005']])
+def test_repeated_root_name_last_match_same_as_index(dup_b3d_file, tmp_path, nodes):
+    last_match = extract_nodes(dup_b3d_file, str(tmp_path / 'last_match.b3d'), nodes, False, lastMatch=True)
+
+    # early exit scan doesn't write the index
+    assert not os.path.exists(b3di.get_index_path(dup_b3d_file))
+    with B3DFile(dup_b3d_file) as source:
+        b3di.read_roots_indexed(dup_b3d_file, source.stream, source.seek_nodes())
+    from_index = extract_nodes(dup_b3d_file, str(tmp_path / 'from_index.b3d'), nodes, True)
+
+    assert from_index == last_match
+
+    # extracted root is the later one (former root000002)
+    sizes = extracted_sizes(dup_b3d_file, 'root000001')
+    assert extracted_sizes(str(tmp_path / 'last_match.b3d'), 'root000001') == sizes[-1:]
+
+def test_repeated_root_name_first_match_without_index(dup_b3d_file, tmp_path):
+    extract_nodes(dup_b3d_file, str(tmp_path / 'first_match.b3d'), ['root000001'], False)
+    sizes = extracted_sizes(dup_b3d_file, 'root000001')
+    assert extracted_sizes(str(tmp_path / 'first_match.b3d'), 'root000001') == sizes[:1]
+
+def test_missing_root_is_reported(b3d_file, tmp_path):
+    outFilename = str(tmp_path / 'missing.b3d')
+    with pytest.raises(ValueError, match='nosuchroot'):
+        extract_nodes(b3d_file, outFilename, ['nosuchroot'], False)
+    assert not os.path.exists(outFilename)
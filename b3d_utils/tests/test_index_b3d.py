@@ -0,0 +1,115 @@
+import os
+
+import parsing.index_b3d as b3di
+from parsing.source_b3d import B3DFile
+from conftest import root_spans
+
+def read_indexed(b3dFilename, useIndex=True):
+    with B3DFile(b3dFilename) as source:
+        return b3di.read_roots_indexed(b3dFilename, source.stream, source.seek_nodes(), useIndex)
+
+def read_sections(b3dFilename):
+    with B3DFile(b3dFilename) as source:
+        return b3di.read_index(b3di.get_index_path(b3dFilename), b3di.get_file_key(b3dFilename, source.stream))
+
+def root_table(parsed_b3d):
+    return {
+        name: (root.start, root.size, list(root.texnums), list(root.texnum_pos))
+        for name, root in parsed_b3d["roots"].items()
+    }
+
+def reference_table(parsed_b3d):
+    return {
+        name: [(ref.space_name, ref.add_name) for ref in refs]
+        for name, refs in parsed_b3d["references"].items()
+    }
+
+def test_round_trip(b3d_file):
+    scanned = read_indexed(b3d_file)
+    assert os.path.exists(b3di.get_index_path(b3d_file))
+    sections = read_sections(b3d_file)
+    assert {b3di.SECTION_ROOTS, b3di.SECTION_REFERENCES, b3di.SECTION_SPATIAL} <= set(sections.keys())
+
+    loaded = read_indexed(b3d_file)
+    # bounds are only in scan result, so this one came from the index
+    assert "bounds" in scanned and "bounds" not in loaded
+    assert list(loaded["roots"].keys()) == list(scanned["roots"].keys())
+    assert root_table(loaded) == root_table(scanned)
+    assert reference_table(loaded) == reference_table(scanned)
+
+def test_no_index_is_not_written(b3d_file):
+    read_indexed(b3d_file, useIndex=False)
+    assert not os.path.exists(b3di.get_index_path(b3d_file))
+
+def test_stale_after_mtime_change(b3d_file):
+    read_indexed(b3d_file)
+    st = os.stat(b3d_file)
+    os.utime(b3d_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert read_sections(b3d_file) is None
+
+    # rescanned and written again for current file
+    assert "bounds" in read_indexed(b3d_file)
+    assert read_sections(b3d_file) is not None
+
+def test_stale_after_size_change(b3d_file):
+    read_indexed(b3d_file)
+    st = os.stat(b3d_file)
+    with open(b3d_file, 'ab') as file:
+        file.write(b'\0' * 4)
+    os.utime(b3d_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert read_sections(b3d_file) is None
+
+def test_stale_after_content_change(b3d_file):
+    read_indexed(b3d_file)
+    st = os.stat(b3d_file)
+    with open(b3d_file, 'r+b') as file:
+        # first letter of first material name, size and mtime stay the same
+        file.seek(28)
+        file.write(b'X')
+    os.utime(b3d_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(b3d_file).st_size == st.st_size
+    assert read_sections(b3d_file) is None
+
+def test_section_is_not_added_to_stale_index(b3d_file):
+    read_indexed(b3d_file)
+    st = os.stat(b3d_file)
+    os.utime(b3d_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    with B3DFile(b3d_file) as source:
+        written = b3di.write_index_section(b3d_file, source.stream, b3di.SECTION_CLOSURES, b'')
+    assert not written
+    # index with current key and closures only would look valid without roots
+    assert not os.path.exists(b3di.get_index_path(b3d_file))
+
+def test_section_is_added_to_up_to_date_index(b3d_file):
+    read_indexed(b3d_file)
+    with B3DFile(b3d_file) as source:
+        assert b3di.write_index_section(b3d_file, source.stream, b3di.SECTION_CLOSURES, b'payload')
+    sections = read_sections(b3d_file)
+    assert sections[b3di.SECTION_CLOSURES] == b'payload'
+    assert b3di.SECTION_ROOTS in sections
+
+def read_until(b3dFilename, names, lastMatch=False):
+    with B3DFile(b3dFilename) as source:
+        parsed_b3d = b3di.read_roots_until(b3dFilename, source.stream, source.seek_nodes(), names, lastMatch=lastMatch)
+        return parsed_b3d, source.stream.tell(), source.nodes_end
+
+def test_read_until_stops_at_found_root(b3d_file):
+    parsed_b3d, position, nodes_end = read_until(b3d_file, ['root000001'])
+    root = parsed_b3d["roots"]["root000001"]
+    assert list(parsed_b3d["roots"].keys()) == ['root000001']
+    assert position == root.start + root.size
+    assert position < nodes_end // 10
+    assert not os.path.exists(b3di.get_index_path(b3d_file))
+
+def test_read_until_last_match(dup_b3d_file):
+    first, position, nodes_end = read_until(dup_b3d_file, ['root000001'])
+    last, position, nodes_end = read_until(dup_b3d_file, ['root000001'], lastMatch=True)
+    starts = [start for name, start, size in root_spans(dup_b3d_file) if name == 'root000001']
+    assert first["roots"]["root000001"].start == starts[0]
+    assert last["roots"]["root000001"].start == starts[-1]
+
+def test_read_until_uses_index(b3d_file):
+    scanned = read_indexed(b3d_file)
+    loaded, position, nodes_end = read_until(b3d_file, ['root000001'])
+    assert root_table(loaded) == root_table(scanned)
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import list_b3d
+import parsing.index_b3d as b3di
+from conftest import root_spans
+
+def list_to(b3dFilename, listType, outFilename, **kwargs):
+    list_b3d.b3dlist(b3dFilename, listType, outFilename, **kwargs)
+    with open(outFilename, 'rb') as file:
+        return file.read()
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_full_parallel_is_same_as_serial(b3d_file, tmp_path, ndjson):
+    # file is big enough to be split into several chunks
+    assert len(list_b3d.split_spans(root_spans(b3d_file), 2 * list_b3d.CHUNKS_PER_JOB)) > 1
+
+    serial = list_to(b3d_file, 'FULL', str(tmp_path / 'serial.json'), ndjson=ndjson, useIndex=False)
+    parallel = list_to(b3d_file, 'FULL', str(tmp_path / 'parallel.json'), ndjson=ndjson, useIndex=False, jobs=2)
+    assert len(serial) > 0
+    assert parallel == serial
+
+def test_split_spans_cover_all_roots(b3d_file):
+    spans = root_spans(b3d_file)
+    chunks = list_b3d.split_spans(spans, 5)
+    assert chunks[0][0] == spans[0][1]
+    assert chunks[-1][1] == spans[-1][1] + spans[-1][2]
+    for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+        assert end <= next_start
+
+def test_roots_with_repeated_names_same_with_index(dup_b3d_file, tmp_path):
+    without_index = list_to(dup_b3d_file, 'ROOTS', str(tmp_path / 'roots_no_index.txt'), useIndex=False)
+    assert without_index.count(b'root000001') == 2
+
+    # MATERIAL-USAGE writes the index
+    list_to(dup_b3d_file, 'MATERIAL-USAGE', str(tmp_path / 'usage.json'))
+    assert os.path.exists(b3di.get_index_path(dup_b3d_file))
+
+    with_index = list_to(dup_b3d_file, 'ROOTS', str(tmp_path / 'roots_index.txt'))
+    assert with_index == without_index
+
+def test_roots_from_index(b3d_file, tmp_path):
+    without_index = list_to(b3d_file, 'ROOTS', str(tmp_path / 'roots_no_index.txt'), useIndex=False)
+    list_to(b3d_file, 'MATERIAL-USAGE', str(tmp_path / 'usage.json'))
+    with_index = list_to(b3d_file, 'ROOTS', str(tmp_path / 'roots_index.txt'))
+    assert with_index == without_index
+    assert len(with_index.split(b',\n')) == len(root_spans(b3d_file))
+
+def test_failed_full_list_closes_file_and_removes_output(b3d_file, tmp_path, monkeypatch):
+    closed = []
+    class ClosingB3DFile(list_b3d.B3DFile):
+        def close(self):
+            closed.append(True)
+            super().close()
+    def fail(writer, root):
+        raise RuntimeError('write failed')
+    monkeypatch.setattr(list_b3d, 'B3DFile', ClosingB3DFile)
+    monkeypatch.setattr(list_b3d.RootWriter, 'write', fail)
+
+    outFilename = str(tmp_path / 'full.json')
+    with pytest.raises(RuntimeError):
+        list_b3d.b3dlist(b3d_file, 'FULL', outFilename, useIndex=False)
+    assert closed
+    # partial [[... without closing brackets is not left
+    assert not os.path.exists(outFilename)
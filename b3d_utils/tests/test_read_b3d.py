@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import bench.corpus as corpus
+import parsing.read_b3d as b3dr
+from parsing.document_b3d import B3DDocument
+from parsing.source_b3d import B3DFile
+from conftest import CORPUS_CONFIG, root_spans
+
+POLYGON_TYPES = {8, 28, 35}
+
+def test_polygons_of_corpus(corpus_dir):
+    # corpus writes polygons from its own format table, parser layouts are checked against it
+    mat_count = CORPUS_CONFIG.get("materials", corpus.DEFAULT_CONFIG["materials"])
+    formats = {8: corpus.POLYGON_8_FORMATS, 35: corpus.POLYGON_8_FORMATS, 28: corpus.POLYGON_28_FORMATS}
+    poly_blocks = 0
+    with B3DDocument(os.path.join(corpus_dir, 'corpus.b3d')) as document:
+        for node in document.iter_nodes():
+            if node.type not in POLYGON_TYPES:
+                continue
+            poly_blocks += 1
+            polygons = node.block_data['polygons']
+            batch = node.polygons
+            assert len(polygons) == node.block_data['poly_count'] == len(batch['texnum'])
+            for i, polygon in enumerate(polygons):
+                assert polygon['format_raw'] in formats[node.type]
+                assert 1 <= polygon['texnum'] < mat_count
+                assert batch['format_raw'][i] == polygon['format_raw']
+                assert batch['texnum'][i] == polygon['texnum']
+                assert batch['vert_count'][i] == polygon['vert_count'] == len(polygon['verts'])
+    assert poly_blocks > 0
+
+def test_skip_scan_and_document_agree(corpus_dir):
+    b3dFilename = os.path.join(corpus_dir, 'corpus.b3d')
+    spans = root_spans(b3dFilename)
+    with B3DFile(b3dFilename) as source:
+        roots = b3dr.read_roots(source.stream, source.seek_nodes())["roots"]
+    with B3DDocument(b3dFilename) as document:
+        document_spans = [(node.name, node.start, node.size) for node in document.roots]
+
+    assert len(spans) == CORPUS_CONFIG["roots"]
+    assert [(name, root.start, root.size) for name, root in roots.items()] == spans
+    assert document_spans == spans
+
+def test_iter_roots_stops_early(corpus_dir):
+    with B3DFile(os.path.join(corpus_dir, 'corpus.b3d')) as source:
+        first = next(b3dr.iter_roots(source.stream, source.seek_nodes()))
+        assert source.stream.tell() == first[1].start + first[1].size
+
+def test_truncated_file_is_rejected(b3d_file):
+    size = os.path.getsize(b3d_file)
+    with open(b3d_file, 'r+b') as file:
+        file.truncate(size // 2)
+    with pytest.raises(ValueError, match='truncated'):
+        B3DFile(b3d_file)
+
+def test_moved_node_section_is_rejected(b3d_file):
+    with open(b3d_file, 'r+b') as file:
+        # ofc_nodes word of header points one word further
+        file.seek(16)
+        ofc_nodes = int.from_bytes(file.read(4), 'little')
+        file.seek(16)
+        file.write((ofc_nodes + 1).to_bytes(4, 'little'))
+    with pytest.raises(ValueError):
+        B3DFile(b3d_file)
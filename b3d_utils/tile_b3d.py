@@ -0,0 +1,100 @@
+import logging
+import sys
+import os
+import math
+import time
+import datetime
+
+import parsing.read_b3d as b3dr
+import parsing.index_b3d as b3di
+import parsing.spatial_b3d as b3dsp
+from parsing.source_b3d import B3DFile
+
+import extract_b3d
+import common as c
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+log = logging.getLogger("tile_b3d")
+log.setLevel(logging.DEBUG)
+
+NO_BOUNDS_TILE = 'nobounds'
+
+def get_tiles(grid, cellSize):
+    """Returns {(ix, iy): [root names]}, root belongs to tile with center of its bounds (x, y),
+    and list of roots without bounds."""
+    tiles = {}
+    unplaced = []
+    for root_name, box in zip(grid.names, grid.boxes):
+        if b3dsp.is_empty_box(box):
+            unplaced.append(root_name)
+            continue
+        ix = int(math.floor((box[0] + box[3]) / 2 / cellSize))
+        iy = int(math.floor((box[1] + box[4]) / 2 / cellSize))
+        tiles.setdefault((ix, iy), []).append(root_name)
+    return tiles, unplaced
+
+def write_tile(all_roots, usage, closures, outpath, tileName, root_names):
+    root_objs = set(root_names)
+    spaces = set()
+    if closures is not None:
+        for root_name in root_names:
+            root_objs.update(c.get_closure_names(closures, closures["nodes"][root_name]))
+            spaces.update(c.get_closure_names(closures, closures["spaces"][root_name]))
+
+    entry = {
+        "nodes": list(root_objs),
+        "spaces": list(spaces)
+    }
+    # materials are compacted to the ones used by the tile
+    extract_b3d.write_extract(all_roots, usage, outpath, tileName, entry, (None, False, [], {}))
+
+def b3dtile(b3dFilename, outpath, cellSize, toUseNodeRefs, useIndex=True):
+
+    if not (cellSize > 0 and math.isfinite(cellSize)):
+        raise ValueError('Cell size should be positive number: {}'.format(cellSize))
+
+    basename = os.path.basename(os.path.splitext(b3dFilename)[0])
+    if not outpath:
+        outpath = os.path.dirname(b3dFilename)
+    os.makedirs(outpath, exist_ok=True)
+
+    tt1 = time.mktime(datetime.datetime.now().timetuple())
+
+    source = B3DFile(b3dFilename)
+    b3d_stream = source.stream
+    materials_list = source.read_materials()
+    data_blocks_offset = source.seek_nodes()
+
+    # single scan: roots, references and bounds come from the same pass (or from the index)
+    parsed_b3d = b3di.read_roots_indexed(b3dFilename, b3d_stream, data_blocks_offset, useIndex)
+    all_roots = parsed_b3d['roots']
+    blocks18 = parsed_b3d['references']
+    if 'bounds' in parsed_b3d:
+        grid = b3dsp.SpatialGrid.build(parsed_b3d['bounds'])
+    else:
+        grid = b3di.read_spatial_indexed(b3dFilename, b3d_stream, data_blocks_offset, useIndex)
+
+    tiles, unplaced = get_tiles(grid, cellSize)
+    log.info('{} tiles, {} roots without bounds'.format(len(tiles), len(unplaced)))
+
+    closures = None
+    if toUseNodeRefs:
+        closures = c.get_reference_closures(b3dFilename, b3d_stream, blocks18, useIndex)
+
+    c.read_root_data(source, all_roots)
+
+    usage = c.MaterialUsage.build(materials_list, all_roots)
+    for (ix, iy), root_names in sorted(tiles.items()):
+        write_tile(all_roots, usage, closures, outpath, '{}_{}_{}'.format(basename, ix, iy), root_names)
+
+    # roots without bounds have no place in grid, they are kept in separate file
+    if len(unplaced):
+        tileName = '{}_{}'.format(basename, NO_BOUNDS_TILE)
+        log.info('roots without bounds are written to {}.b3d: {}'.format(tileName, ', '.join(unplaced)))
+        write_tile(all_roots, usage, closures, outpath, tileName, unplaced)
+
+    c.release_root_data(all_roots)
+    source.close()
+
+    tt1 = time.mktime(datetime.datetime.now().timetuple()) - tt1
+    log.info('Completed in {} seconds'.format(tt1))